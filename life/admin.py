@@ -1,5 +1,14 @@
+from pathlib import Path
+
+from django.conf import settings
 from django.contrib import admin
-from .models import LifeCalculation
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+from django.utils.html import format_html
+
+from .admin_changelist import EstimatedCountPaginator, KeysetChangeList
+from .models import LifeCalculation, PDFJob, RequestProfile
+from .profiling import delete_reports
 
 
 @admin.register(LifeCalculation)
@@ -7,6 +16,7 @@ class LifeCalculationAdmin(admin.ModelAdmin):
     list_display = ('date_of_birth', 'gender', 'estimated_lifespan_years', 'created_at', 'unique_id')
     list_filter = ('gender', 'smoking_status', 'diet_quality', 'created_at')
     search_fields = ('unique_id', 'date_of_birth')
+    search_help_text = 'Unique ID or date of birth (YYYY-MM-DD)'
     readonly_fields = ('unique_id', 'created_at', 'estimated_lifespan_years')
     
     fieldsets = (
@@ -27,3 +37,77 @@ class LifeCalculationAdmin(admin.ModelAdmin):
             'fields': ('unique_id', 'created_at')
         }),
     )
+
+    @property
+    def show_full_result_count(self):
+        return not settings.SCALABLE_ADMIN
+
+    def get_changelist(self, request, **kwargs):
+        if settings.SCALABLE_ADMIN:
+            return KeysetChangeList
+        return super().get_changelist(request, **kwargs)
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        if settings.SCALABLE_ADMIN:
+            return EstimatedCountPaginator(
+                queryset, per_page, orphans, allow_empty_first_page, count_limit=settings.ADMIN_COUNT_LIMIT,
+            )
+        return super().get_paginator(request, queryset, per_page, orphans, allow_empty_first_page)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not settings.SCALABLE_ADMIN:
+            return super().get_search_results(request, queryset, search_term)
+
+        # Exact matches only, which the unique_id and date_of_birth indexes
+        # answer without scanning the table
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        match = Q(unique_id=term)
+        try:
+            date_of_birth = parse_date(term)
+        except ValueError:
+            date_of_birth = None
+        if date_of_birth is not None:
+            match |= Q(date_of_birth=date_of_birth)
+        return queryset.filter(match), False
+
+
+@admin.register(PDFJob)
+class PDFJobAdmin(admin.ModelAdmin):
+    list_display = ('key', 'total_years', 'mode', 'status', 'created_at', 'finished_at')
+    list_filter = ('status', 'mode')
+    readonly_fields = (
+        'key', 'total_years', 'mode', 'worker', 'created_at', 'started_at', 'heartbeat_at', 'finished_at', 'error',
+    )
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """Reports of profiled requests (see profiling.py); read-only."""
+    list_display = ('created_at', 'kind', 'method', 'path', 'status_code', 'duration_ms', 'user', 'size')
+    list_filter = ('kind',)
+    fields = ('kind', 'method', 'path', 'status_code', 'duration_ms', 'user', 'created_at', 'report_text')
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Report')
+    def report_text(self, obj):
+        try:
+            report = (Path(settings.PROFILES_DIR) / obj.report).read_text()
+        except FileNotFoundError:
+            report = 'The report file has been deleted.'
+        return format_html('<pre style="white-space: pre; overflow-x: auto;">{}</pre>', report)
+
+    def delete_model(self, request, obj):
+        delete_reports([obj.report])
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        delete_reports(queryset.values_list('report', flat=True))
+        super().delete_queryset(request, queryset)
@@ -0,0 +1,130 @@
+"""
+Changelist pieces for admin pages over very large tables.
+
+Django's changelist counts every matching row on each page (twice, with the
+unfiltered total), pages with OFFSET, which reads and discards every row
+before the page, and searches with LIKE '%term%', which cannot use an index.
+EstimatedCountPaginator and KeysetChangeList replace the first two: the
+total comes from the database's statistics, filtered counts stop at a limit,
+and following pages start after the (created_at, id) of the previous page's
+last row so every page is one index range scan however deep it is.
+"""
+from datetime import datetime
+
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ALL_VAR, ORDER_VAR, PAGE_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+
+# Query string parameter holding the keyset cursor
+CURSOR_VAR = 'after'
+
+
+def estimate_row_count(model, using='default'):
+    """
+    Cheap estimate of the rows in model's table: the planner statistics on
+    PostgreSQL, otherwise the highest primary key (exact until rows are
+    deleted, then an overestimate).
+    """
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+            row = cursor.fetchone()
+        # -1 until the table has been analyzed
+        if row and row[0] >= 0:
+            return int(row[0])
+    return model._default_manager.using(using).aggregate(last=Max('pk'))['last'] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never counts a whole table.
+
+    An unfiltered queryset is estimated with estimate_row_count(); a filtered
+    one is counted up to count_limit rows, after which count_is_exact is
+    False and count is the limit.
+    """
+
+    def __init__(self, *args, count_limit=10_000, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_limit = count_limit
+        self.count_is_exact = True
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        if not query.where and not query.distinct:
+            self.count_is_exact = False
+            return estimate_row_count(self.object_list.model, self.object_list.db)
+        count = self.object_list.order_by()[:self.count_limit].count()
+        self.count_is_exact = count < self.count_limit
+        return count
+
+
+def encode_cursor(calculation):
+    return f'{calculation.created_at.isoformat()}~{calculation.pk}'
+
+
+def decode_cursor(cursor):
+    created_at, _, pk = cursor.rpartition('~')
+    return datetime.fromisoformat(created_at), int(pk)
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Changelist that pages by (created_at, id) in the default newest-first
+    order. Sorting by a column or "Show all" fall back to numbered pages.
+
+    The template gets next_page_url and first_page_url instead of page
+    numbers; result_count is the paginator's estimate.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = request.GET.get(CURSOR_VAR)
+        self.keyset = ORDER_VAR not in request.GET and ALL_VAR not in request.GET
+        self.next_page_url = None
+        super().__init__(request, *args, **kwargs)
+        self.first_page_url = self.get_query_string(remove=[CURSOR_VAR, PAGE_VAR])
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        # Counted without the cursor, so every page shows the same total
+        self.count_queryset = queryset
+        if self.keyset and self.cursor:
+            try:
+                created_at, pk = decode_cursor(self.cursor)
+            except ValueError as error:
+                raise IncorrectLookupParameters(error)
+            # The leading created_at bound lets the database seek in the
+            # (created_at, id) index; the OR only breaks ties at the boundary
+            queryset = queryset.filter(created_at__lte=created_at).filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+            )
+        return queryset
+
+    def get_results(self, request):
+        if not self.keyset:
+            return super().get_results(request)
+
+        paginator = self.model_admin.get_paginator(request, self.count_queryset, self.list_per_page)
+        rows = list(self.queryset[:self.list_per_page + 1])
+        if len(rows) > self.list_per_page:
+            rows = rows[:self.list_per_page]
+            self.next_page_url = self.get_query_string({CURSOR_VAR: encode_cursor(rows[-1])}, remove=[PAGE_VAR])
+
+        self.result_count = paginator.count
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = rows
+        self.can_show_all = False
+        self.multi_page = bool(self.cursor or self.next_page_url)
+        self.paginator = paginator
@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
 
 
 class LifeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'life'
+
+    def ready(self):
+        # Keep the lifespan statistics up to date as calculations are saved
+        from . import stats  # noqa: F401
+        from .metrics import install_query_timer
+        from .scoring_rules import get_rules
+
+        # Compile the rule table, and with it the what-if grid, up front
+        get_rules(settings.LIFESPAN_RULES_VERSION)
+
+        # Time the SQL of every connection opened from now on
+        connection_created.connect(install_query_timer, dispatch_uid='life.metrics')
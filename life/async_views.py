@@ -0,0 +1,175 @@
+"""
+Async versions of the index, results and generate_pdf views.
+
+life/urls.py routes to these instead of views.py when ASYNC_VIEWS is on,
+which is the setting to use under an ASGI server (timetodeath.asgi). They
+query through the async ORM (aget, afirst) and render PDFs in a process
+pool of PDF_RENDER_PROCESSES, so one event loop keeps serving other
+requests and streaming downloads while ReportLab works. Long calendars are
+split over the whole pool (see pdf_parallel.py).
+"""
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.shortcuts import redirect
+
+from .fingerprints import input_fingerprint
+from .forms import LifeCalculationForm
+from .life_tables import base_age_for
+from .metrics import record_pdf_bytes, timed
+from .models import LifeCalculation
+from .page_cache import aserve_daily_cached
+from .pdf_cache import get_pdf_cache, life_calendar_key
+from .pdf_generator import DEFAULT_LAYOUT, DEFAULT_RENDER_MODE, LAYOUTS, calculate_total_years
+from .pdf_jobs import render_job
+from .pdf_parallel import merge_into_cache, plan_chunks, render_chunk
+from .profiling import cache_bypassed
+from .responses import _file_size, aserve_cached_file, sendfile_response
+from .retention import aget_calculation_or_404
+from .scoring_rules import get_rules
+from .views import (
+    _calculation_fields, _invalid_layout_response, _pdf_filename, _pdf_pages, _results_response, render_page,
+    save_calculation,
+)
+from .write_buffer import aget_buffered_calculation_or_404, get_write_buffer, wait_until_saved
+
+# Renders in progress, so concurrent requests for one PDF share a render
+_renders = {}
+
+
+@lru_cache(maxsize=None)
+def get_render_executor():
+    """The process pool rendering PDFs for the async views."""
+    return ProcessPoolExecutor(max_workers=settings.PDF_RENDER_PROCESSES)
+
+
+async def _arender_chunks(cache, key, total_years, mode, chunks, highlight):
+    # A long calendar is split over the whole pool and merged off the loop
+    loop = asyncio.get_running_loop()
+    documents = await asyncio.gather(*(
+        loop.run_in_executor(get_render_executor(), render_chunk, total_years, mode, chunk, highlight)
+        for chunk in chunks
+    ))
+    await sync_to_async(merge_into_cache, thread_sensitive=False)(cache, key, documents)
+
+
+async def aopen_life_calendar_pdf(total_years, mode=DEFAULT_RENDER_MODE, layout=DEFAULT_LAYOUT, years=None,
+                                  highlight=None):
+    """
+    Async open_life_calendar_pdf(): a cache miss is rendered into the disk
+    cache by the render process pool.
+    """
+    cache = get_pdf_cache()
+    key = life_calendar_key(total_years, mode, layout, years, highlight)
+    pdf_file = None if cache_bypassed() else cache.open(key)
+    if pdf_file is not None:
+        return pdf_file
+
+    loop = asyncio.get_running_loop()
+    rendering = _renders.get((loop, key))
+    if rendering is None:
+        chunks = plan_chunks(total_years, mode, layout, years, processes=settings.PDF_RENDER_PROCESSES)
+        if chunks is None:
+            rendering = loop.run_in_executor(
+                get_render_executor(), render_job,
+                str(cache.directory), cache.max_bytes, key, total_years, mode, layout, years, highlight,
+            )
+        else:
+            rendering = asyncio.ensure_future(_arender_chunks(cache, key, total_years, mode, chunks, highlight))
+        _renders[loop, key] = rendering
+        rendering.add_done_callback(lambda _: _renders.pop((loop, key), None))
+    # A client going away must not cancel a render others are waiting for
+    with timed('pdf'):
+        await asyncio.shield(rendering)
+    pdf_file = cache.open(key)
+    if pdf_file is not None:
+        record_pdf_bytes(_file_size(pdf_file))
+    return pdf_file
+
+
+async def index(request):
+    """
+    Main page with form to collect user information.
+    """
+    if request.method == 'POST':
+        form = LifeCalculationForm(request.POST)
+        if form.is_valid():
+            rules = get_rules(settings.LIFESPAN_RULES_VERSION)
+
+            base_age = base_age_for(form.cleaned_data['date_of_birth'], form.cleaned_data['gender'], rules.base_age)
+            fingerprint = input_fingerprint(form.cleaned_data, base_age, rules.version)
+            if settings.REUSE_IDENTICAL_CALCULATIONS:
+                existing_id = await (
+                    LifeCalculation.objects.filter(fingerprint=fingerprint)
+                    .values_list('unique_id', flat=True).afirst()
+                )
+                if existing_id is not None:
+                    return redirect('life:results', unique_id=existing_id)
+
+            calculation = LifeCalculation(**_calculation_fields(form.cleaned_data, rules, base_age, fingerprint))
+            if settings.CALCULATION_WRITE_BUFFER:
+                get_write_buffer().submit(calculation)
+            else:
+                await sync_to_async(save_calculation)(calculation)
+
+            return redirect('life:results', unique_id=calculation.unique_id)
+    else:
+        form = LifeCalculationForm()
+
+    return render_page(request, 'life/index.html', {'form': form})
+
+
+async def results(request, unique_id):
+    """
+    Results page showing elapsed and remaining life with timers.
+    """
+    if settings.CALCULATION_WRITE_BUFFER:
+        await sync_to_async(wait_until_saved, thread_sensitive=False)(unique_id)
+
+    async def arender(today):
+        calculation = await aget_buffered_calculation_or_404(unique_id)
+        return _results_response(request, calculation, today)
+
+    return await aserve_daily_cached(request, f'results:{unique_id}', arender)
+
+
+async def generate_pdf(request, unique_id):
+    """
+    Generate and download PDF for the life calendar; takes the query
+    parameters of views.generate_pdf().
+    """
+    layout = request.GET.get('layout', DEFAULT_LAYOUT)
+    if layout not in LAYOUTS:
+        return _invalid_layout_response()
+    calculation = await aget_calculation_or_404(unique_id)
+
+    total_years = calculate_total_years(calculation.date_of_birth, calculation.estimated_death_date)
+    try:
+        years, highlight = _pdf_pages(request.GET, calculation, total_years, layout)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    filename = _pdf_filename(unique_id, layout, years)
+    pages = {'layout': layout, 'years': years, 'highlight': highlight}
+
+    if settings.PDF_SENDFILE_HEADER:
+        pdf_file = await aopen_life_calendar_pdf(total_years, **pages)
+        if pdf_file is None:
+            # Evicted between the render and the open, as in aserve_cached_file()
+            raise Http404("File is no longer cached")
+        with pdf_file:
+            path = await sync_to_async(get_pdf_cache().ensure_on_disk, thread_sensitive=False)(
+                life_calendar_key(total_years, **pages), pdf_file,
+            )
+        return sendfile_response(path, filename, 'application/pdf')
+
+    return await aserve_cached_file(
+        request,
+        life_calendar_key(total_years, **pages),
+        lambda: aopen_life_calendar_pdf(total_years, **pages),
+        filename,
+        'application/pdf',
+    )
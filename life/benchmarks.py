@@ -0,0 +1,724 @@
+"""
+Benchmarks for the lifespan calculator, the PDF renderer and the views.
+
+Run them with ``python manage.py benchmark``. Every benchmark returns a flat
+dict of metrics so results can be stored as JSON and compared against a
+baseline with compare_results().
+"""
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+
+import django
+import numpy as np
+
+from .lifespan_calculator import (
+    UNCERTAINTY_SAMPLES, calculate_lifespan, calculate_lifespan_bands, calculate_lifespan_batch,
+)
+from .life_grid import grid_size, render_life_grid_png, render_life_grid_svg
+from .pdf_generator import DEFAULT_RENDER_MODE, POSTER_COLUMNS, RENDER_MODES, create_life_calendar_pdf, render_life_calendar
+from .scoring_rules import DEFAULT_RULES_VERSION
+
+# Metrics ending with these are better when higher; all others (seconds,
+# bytes) are better when lower.
+HIGHER_IS_BETTER = ('_per_second', '_speedup')
+
+
+def generate_profiles(rows, seed=0):
+    """
+    Generate a dict of random profile columns for benchmarking and testing.
+    """
+    rng = np.random.default_rng(seed)
+    return {
+        'exercise_minutes_per_week': rng.integers(0, 400, rows),
+        'smoking_status': rng.choice(np.array(['none', 'occasional', 'daily'], dtype=object), rows),
+        'weight_kg': np.round(rng.uniform(40, 140, rows), 1),
+        'height_cm': np.round(rng.uniform(140, 210, rows), 1),
+        'diet_quality': rng.choice(np.array(['healthy', 'moderate', 'unhealthy'], dtype=object), rows),
+        'alcohol_consumption': rng.choice(np.array(['none', 'light', 'heavy'], dtype=object), rows),
+        'has_health_issues': rng.random(rows) < 0.3,
+    }
+
+
+def _best_of(function, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _latencies(function, iterations, prefix):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        f'{prefix}.median_seconds': statistics.median(samples),
+        f'{prefix}.p95_seconds': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+    }
+
+
+def bench_scoring(rows=100_000, repeat=3):
+    """
+    Compare scalar calculate_lifespan() against calculate_lifespan_batch(),
+    and time the uncertainty bands of one person.
+    """
+    profiles = generate_profiles(rows)
+    records = [dict(zip(profiles, values)) for values in zip(*profiles.values())]
+
+    scalar_seconds = _best_of(lambda: [calculate_lifespan(**record) for record in records], repeat)
+    batch_seconds = _best_of(lambda: calculate_lifespan_batch(profiles), repeat)
+    bands_seconds = _best_of(lambda: calculate_lifespan_bands(**records[0]), repeat)
+
+    return {
+        'scoring.scalar_calls_per_second': rows / scalar_seconds,
+        'scoring.batch_rows_per_second': rows / batch_seconds,
+        'scoring.batch_speedup': scalar_seconds / batch_seconds,
+        f'scoring.bands_{UNCERTAINTY_SAMPLES}_samples_seconds': bands_seconds,
+    }
+
+
+def bench_pdf(year_counts=(50, 80, 100), modes=RENDER_MODES, repeat=1):
+    """
+    Measure create_life_calendar_pdf() latency and output size per render
+    mode and poster layout, the latency of a 10-year range, and the same
+    for the inline life grid (uncached) in each format.
+    """
+    metrics = {}
+    birth_date = date(2000, 1, 1)
+    for total_years in year_counts:
+        death_date = birth_date + timedelta(days=int(total_years * 365.25))
+        for mode in modes:
+            sizes = []
+
+            def render():
+                pdf_buffer = create_life_calendar_pdf(birth_date, death_date, mode=mode)
+                sizes.append(len(pdf_buffer.getbuffer()))
+
+            metrics[f'pdf.{mode}.{total_years}_years.seconds'] = _best_of(render, repeat)
+            metrics[f'pdf.{mode}.{total_years}_years.bytes'] = sizes[-1]
+
+        # The next 10 years only, with the current year's lived days filled
+        years = (total_years // 2, min(total_years, total_years // 2 + 9))
+        metrics[f'pdf.form.{total_years}_years.10_year_range.seconds'] = _best_of(
+            lambda: render_life_calendar(total_years, BytesIO(), years=years, highlight=(years[0], 180)), repeat,
+        )
+
+        for layout in POSTER_COLUMNS:
+            sizes = []
+
+            def render():
+                pdf_buffer = create_life_calendar_pdf(birth_date, death_date, layout=layout)
+                sizes.append(len(pdf_buffer.getbuffer()))
+
+            seconds = _best_of(render, repeat)
+            metrics[f'pdf.{layout}_poster.{total_years}_years.seconds'] = seconds
+            metrics[f'pdf.{layout}_poster.{total_years}_years.bytes'] = sizes[-1]
+            yearly_seconds = metrics.get(f'pdf.{DEFAULT_RENDER_MODE}.{total_years}_years.seconds')
+            if yearly_seconds:
+                metrics[f'pdf.{layout}_poster.{total_years}_years_speedup'] = yearly_seconds / seconds
+
+        total, lived = grid_size(birth_date, death_date, birth_date + timedelta(days=int(total_years * 365.25 / 2)))
+        for image_format, render_grid in (('svg', render_life_grid_svg), ('png', render_life_grid_png)):
+            metrics[f'grid.{image_format}.{total_years}_years.seconds'] = _best_of(
+                lambda: render_grid(total, lived), repeat,
+            )
+            metrics[f'grid.{image_format}.{total_years}_years.bytes'] = len(render_grid(total, lived))
+    return metrics
+
+
+def bench_pdf_parallel(total_years=100, workers=(1, 2, 4, 8), modes=RENDER_MODES, repeat=1):
+    """
+    Scaling of render_life_calendar_parallel() with the number of worker
+    processes; 1 is the serial renderer. Pools are started before timing.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    from .pdf_parallel import render_chunk, render_life_calendar_parallel
+
+    metrics = {}
+    for mode in modes:
+        serial_seconds = None
+        for count in workers:
+            executor = ProcessPoolExecutor(max_workers=count) if count > 1 else None
+            try:
+                if executor:
+                    list(executor.map(render_chunk, [1] * count, [mode] * count, [(1, 1)] * count, [None] * count))
+                seconds = _best_of(lambda: render_life_calendar_parallel(
+                    total_years, BytesIO(), mode, executor=executor, processes=count,
+                ), repeat)
+            finally:
+                if executor:
+                    executor.shutdown()
+            serial_seconds = serial_seconds or seconds
+            metrics[f'pdf_parallel.{mode}.{total_years}_years.{count}_workers.seconds'] = seconds
+            if count > 1:
+                metrics[f'pdf_parallel.{mode}.{total_years}_years.{count}_workers_speedup'] = serial_seconds / seconds
+    return metrics
+
+
+def seed_calculations(rows, seed=0, batch_size=1000, prefix='bench'):
+    """
+    Insert random LifeCalculation rows and return their unique ids,
+    "<prefix>-<seed>-<index>". Each benchmark uses its own prefix, so rows
+    one leaves behind never collide with the next one's.
+    """
+    from .models import LifeCalculation
+
+    rng = np.random.default_rng(seed)
+    profiles = generate_profiles(rows, seed)
+    estimates = calculate_lifespan_batch(profiles)
+    ages_in_days = rng.integers(365 * 5, 365 * 80, rows)
+    today = date.today()
+
+    unique_ids = []
+    batch = []
+    for index in range(rows):
+        unique_id = f'{prefix}-{seed}-{index}'
+        unique_ids.append(unique_id)
+        batch.append(LifeCalculation(
+            date_of_birth=today - timedelta(days=int(ages_in_days[index])),
+            gender=('male', 'female', 'other')[index % 3],
+            exercise_minutes_per_week=int(profiles['exercise_minutes_per_week'][index]),
+            smoking_status=profiles['smoking_status'][index],
+            weight_kg=float(profiles['weight_kg'][index]),
+            height_cm=float(profiles['height_cm'][index]),
+            diet_quality=profiles['diet_quality'][index],
+            alcohol_consumption=profiles['alcohol_consumption'][index],
+            has_health_issues=bool(profiles['has_health_issues'][index]),
+            estimated_lifespan_years=float(estimates[index]),
+            rules_version=DEFAULT_RULES_VERSION,
+            unique_id=unique_id,
+        ))
+        if len(batch) >= batch_size:
+            LifeCalculation.objects.bulk_create(batch)
+            batch = []
+    LifeCalculation.objects.bulk_create(batch)
+    return unique_ids
+
+
+def bench_views(rows=10_000, iterations=50):
+    """
+    End-to-end latency of the index POST, results and generate_pdf views
+    through the Django test client.
+
+    Runs against a throwaway test database seeded with rows calculations
+    and a temporary PDF cache, so the real database is never touched.
+    """
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+    from django.urls import reverse
+
+    from .pdf_cache import get_pdf_cache
+
+    cache_directory = tempfile.mkdtemp()
+    setup_test_environment()
+    old_database_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        with override_settings(
+            PDF_CACHE_DIR=cache_directory,
+            PDF_SENDFILE_HEADER=None,
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            # Every index POST is scored and saved, as in the baseline,
+            # rather than redirected to the first one
+            REUSE_IDENTICAL_CALCULATIONS=False,
+        ):
+            get_pdf_cache.cache_clear()
+            unique_ids = seed_calculations(rows, prefix='bench-views')
+            rng = np.random.default_rng(1)
+            client = Client()
+
+            form_data = {
+                'date_of_birth': '1990-05-17',
+                'gender': 'female',
+                'exercise_minutes_per_week': '120',
+                'smoking_status': 'none',
+                'weight_kg': '64',
+                'height_cm': '168',
+                'diet_quality': 'healthy',
+                'alcohol_consumption': 'light',
+            }
+
+            def get(url):
+                response = client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                response.close()
+
+            def random_url(name):
+                return reverse(name, args=[unique_ids[rng.integers(len(unique_ids))]])
+
+            def cold_pdf():
+                shutil.rmtree(cache_directory, ignore_errors=True)
+                get_pdf_cache().clear_memory()
+                get(random_url('life:generate_pdf'))
+
+            metrics = {}
+            metrics.update(_latencies(lambda: client.post(reverse('life:index'), form_data), iterations, 'views.index_post'))
+            metrics.update(_latencies(lambda: get(random_url('life:results')), iterations, 'views.results'))
+            metrics.update(_latencies(cold_pdf, max(1, iterations // 5), 'views.generate_pdf_uncached'))
+            pdf_url = random_url('life:generate_pdf')
+            get(pdf_url)
+            metrics.update(_latencies(lambda: get(pdf_url), iterations, 'views.generate_pdf_cached'))
+    finally:
+        get_pdf_cache.cache_clear()
+        connection.creation.destroy_test_db(old_database_name, verbosity=0)
+        teardown_test_environment()
+        shutil.rmtree(cache_directory, ignore_errors=True)
+    return metrics
+
+
+def bench_writes(threads=8, submissions=4000):
+    """
+    Throughput of new calculations saved by concurrent request threads:
+    one transaction each with SQLite's default pragmas, one transaction each
+    in production write mode, and coalesced by the write buffer.
+
+    Runs against a throwaway file-based SQLite database, since an in-memory
+    one has no write lock to contend for.
+    """
+    import secrets
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.db import connection, transaction
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    from .models import LifeCalculation
+    from .write_buffer import WriteBuffer
+
+    def calculation():
+        return LifeCalculation(
+            date_of_birth=date(1990, 5, 17), weight_kg=64, height_cm=168,
+            estimated_lifespan_years=76.5, unique_id=secrets.token_urlsafe(16),
+        )
+
+    def save(instance):
+        # As the index view saves
+        with transaction.atomic():
+            instance.save(force_insert=True)
+
+    def run(save):
+        def worker(count):
+            for _ in range(count):
+                save(calculation())
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(worker, [submissions // threads] * threads))
+        return start
+
+    database_directory = tempfile.mkdtemp()
+    setup_test_environment()
+    old_database_name = connection.settings_dict['NAME']
+    old_test_name = connection.settings_dict['TEST'].get('NAME')
+    production_options = connection.settings_dict['OPTIONS']
+    connection.settings_dict['TEST']['NAME'] = f'{database_directory}/bench.sqlite3'
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    metrics = {}
+    try:
+        for mode, options in (
+            ('default_pragmas', {'init_command': 'PRAGMA journal_mode=DELETE; PRAGMA synchronous=FULL'}),
+            ('direct', production_options),
+            ('buffered', production_options),
+        ):
+            # Connections opened from now on, the worker threads' included,
+            # use these options
+            connection.settings_dict['OPTIONS'] = options
+            connection.close()
+            LifeCalculation.objects.all().delete()
+
+            if mode == 'buffered':
+                buffer = WriteBuffer()
+                start = run(buffer.submit)
+                buffer.flush()
+            else:
+                start = run(save)
+            seconds = time.perf_counter() - start
+            metrics[f'writes.{mode}.rows_per_second'] = LifeCalculation.objects.count() / seconds
+        metrics['writes.buffer_speedup'] = (
+            metrics['writes.buffered.rows_per_second'] / metrics['writes.direct.rows_per_second']
+        )
+    finally:
+        connection.settings_dict['OPTIONS'] = production_options
+        connection.creation.destroy_test_db(old_database_name, verbosity=0)
+        connection.settings_dict['TEST']['NAME'] = old_test_name
+        teardown_test_environment()
+        shutil.rmtree(database_directory, ignore_errors=True)
+    return metrics
+
+
+def _thread_load(paths, concurrency):
+    """GET every path from a pool of threads, like a threaded WSGI server."""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.test import Client
+
+    local = threading.local()
+
+    def fetch(path):
+        if not hasattr(local, 'client'):
+            local.client = Client()
+        start = time.perf_counter()
+        response = local.client.get(path)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        response.close()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        samples = list(pool.map(fetch, paths))
+    return samples, time.perf_counter() - start
+
+
+async def _async_load(paths, concurrency):
+    """GET every path from one event loop, like an ASGI server."""
+    import asyncio
+
+    from django.test import AsyncClient
+
+    client = AsyncClient()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(path):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.get(path)
+            if response.streaming:
+                b''.join([chunk async for chunk in response])
+            response.close()
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    samples = await asyncio.gather(*(fetch(path) for path in paths))
+    return samples, time.perf_counter() - start
+
+
+def bench_servers(rows=2000, requests=200, concurrency=16):
+    """
+    Load comparison of the results and generate_pdf views under WSGI and
+    ASGI on this machine.
+
+    Setups: "wsgi" (sync views, a pool of concurrency threads),
+    "asgi_sync_views" (sync views behind the ASGI handler) and "asgi"
+    (ASYNC_VIEWS, one event loop with concurrency requests in flight).
+    Requests go through Django's WSGI and ASGI handlers in process, without
+    sockets. Every run starts with cold page and PDF caches.
+    """
+    import asyncio
+    import importlib
+    import warnings
+
+    from django.core.cache import cache
+    from django.db import connection
+    from django.db.backends.signals import connection_created
+    from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+    from django.urls import clear_url_caches, reverse
+
+    from . import urls as life_urls
+    from .async_views import get_render_executor
+    from .pdf_cache import get_pdf_cache
+
+    # The test client does not close connections after a request, and each
+    # worker thread and ASGI request opens its own. Any left open keeps the
+    # in-memory test database alive after destroy_test_db().
+    opened = []
+
+    def remember(sender, connection, **kwargs):
+        opened.append(connection)
+
+    cache_directory = tempfile.mkdtemp()
+    setup_test_environment()
+    old_database_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    connection_created.connect(remember)
+    metrics = {}
+    try:
+        unique_ids = seed_calculations(rows, prefix='bench-servers')
+        rng = np.random.default_rng(2)
+        picked = rng.choice(unique_ids, requests)
+        paths = {view: [reverse(f'life:{view}', args=[unique_id]) for unique_id in picked]
+                 for view in ('results', 'generate_pdf')}
+
+        for server, async_views in (('wsgi', False), ('asgi_sync_views', False), ('asgi', True)):
+            with override_settings(
+                ASYNC_VIEWS=async_views,
+                PDF_CACHE_DIR=cache_directory,
+                PDF_SENDFILE_HEADER=None,
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            ), warnings.catch_warnings():
+                # Sync iterators served through ASGI warn on every response
+                warnings.simplefilter('ignore')
+                importlib.reload(life_urls)
+                clear_url_caches()
+                for view, view_paths in paths.items():
+                    shutil.rmtree(cache_directory, ignore_errors=True)
+                    get_pdf_cache.cache_clear()
+                    cache.clear()
+                    if server == 'wsgi':
+                        samples, seconds = _thread_load(view_paths, concurrency)
+                    else:
+                        samples, seconds = asyncio.run(_async_load(view_paths, concurrency))
+                    samples.sort()
+                    metrics[f'servers.{server}.{view}.requests_per_second'] = len(view_paths) / seconds
+                    metrics[f'servers.{server}.{view}.p95_seconds'] = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    finally:
+        importlib.reload(life_urls)
+        clear_url_caches()
+        if get_render_executor.cache_info().currsize:
+            get_render_executor().shutdown()
+            get_render_executor.cache_clear()
+        get_pdf_cache.cache_clear()
+        connection_created.disconnect(remember)
+        connection.creation.destroy_test_db(old_database_name, verbosity=0)
+        # Only now, as SQLite never closes a connection to an in-memory
+        # database; these were opened by threads that have finished
+        for opened_connection in opened:
+            opened_connection.inc_thread_sharing()
+            opened_connection.close()
+        teardown_test_environment()
+        shutil.rmtree(cache_directory, ignore_errors=True)
+    return metrics
+
+
+def bench_admin(rows=200_000, iterations=10):
+    """
+    Latency of the LifeCalculation admin changelist over a large table,
+    with Django's default changelist ("classic") and with SCALABLE_ADMIN.
+
+    Cases: the first page, a filtered page, a page 90% of the way through
+    the table (OFFSET for classic, a keyset cursor for scalable) and a
+    unique_id search. Runs against a throwaway test database.
+    """
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+    from django.urls import reverse
+
+    from .admin_changelist import CURSOR_VAR, encode_cursor
+    from .models import LifeCalculation
+
+    setup_test_environment()
+    old_database_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    metrics = {}
+    try:
+        unique_ids = seed_calculations(rows, prefix='bench-admin')
+        client = Client()
+        client.force_login(User.objects.create_superuser('bench', 'bench@example.com', 'bench'))
+        url = reverse('admin:life_lifecalculation_changelist')
+
+        per_page = 100
+        deep_page = max(1, int(rows * 0.9) // per_page)
+        last_before = LifeCalculation.objects.order_by('-created_at', '-pk')[(deep_page - 1) * per_page - 1]
+        deep = {'classic': {'p': deep_page}, 'scalable': {CURSOR_VAR: encode_cursor(last_before)}}
+
+        medians = {}
+        for mode, scalable in (('classic', False), ('scalable', True)):
+            cases = {
+                'first_page': {},
+                'filtered': {'gender': 'female', 'smoking_status': 'daily'},
+                'deep_page': deep[mode],
+                'search': {'q': unique_ids[rows // 2]},
+            }
+            with override_settings(SCALABLE_ADMIN=scalable):
+                for case, params in cases.items():
+                    def get():
+                        response = client.get(url, params)
+                        assert response.status_code == 200, response.status_code
+                    prefix = f'admin.{mode}.{case}'
+                    metrics.update(_latencies(get, iterations, prefix))
+                    medians[mode, case] = metrics[f'{prefix}.median_seconds']
+
+        for case in ('first_page', 'filtered', 'deep_page', 'search'):
+            metrics[f'admin.{case}_speedup'] = medians['classic', case] / medians['scalable', case]
+    finally:
+        connection.creation.destroy_test_db(old_database_name, verbosity=0)
+        teardown_test_environment()
+    return metrics
+
+
+def bench_import(rows=50_000, batch_size=2000):
+    """
+    Throughput of import_calculations() reading a JSON Lines export of rows
+    seeded calculations back into an empty table. Runs against a throwaway
+    test database.
+    """
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    from .models import LifeCalculation, LifespanStat
+    from .transfer import export_calculations, import_calculations
+
+    setup_test_environment()
+    old_database_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        seed_calculations(rows, prefix='bench-import')
+        stream = StringIO()
+        export_calculations(stream, 'jsonl')
+        LifeCalculation.objects.all().delete()
+        LifespanStat.objects.all().delete()
+
+        stream.seek(0)
+        start = time.perf_counter()
+        import_calculations(stream, 'jsonl', batch_size=batch_size)
+        seconds = time.perf_counter() - start
+    finally:
+        connection.creation.destroy_test_db(old_database_name, verbosity=0)
+        teardown_test_environment()
+    return {
+        f'import.jsonl.{rows}_rows.seconds': seconds,
+        f'import.jsonl.{rows}_rows.rows_per_second': rows / seconds,
+    }
+
+
+def bench_life_tables(countries=200, ages=111, lookups=100_000, repeat=3):
+    """
+    Open time and lookup throughput of a synthetic life table file with
+    countries × 3 sexes tables.
+    """
+    from .life_tables import SEXES, LifeTables, write_life_tables
+
+    rng = np.random.default_rng(0)
+    codes = [f'{chr(65 + index // 676)}{chr(65 + index // 26 % 26)}{chr(65 + index % 26)}' for index in range(countries)]
+    remaining = np.maximum(80.0 - np.arange(ages), 1.0)
+    tables = {(code, sex): remaining + rng.normal(0, 1) for code in codes for sex in SEXES}
+
+    directory = tempfile.mkdtemp()
+    try:
+        path = f'{directory}/life-tables.bin'
+        write_life_tables(path, tables)
+        life_tables = LifeTables(path)
+        open_seconds = _best_of(lambda: LifeTables(path), repeat)
+
+        query_codes = [codes[index] for index in rng.integers(0, countries, lookups)]
+        query_sexes = [SEXES[index] for index in rng.integers(0, 2, lookups)]
+        query_ages = rng.uniform(0, ages, lookups)
+
+        def scalar():
+            for code, sex, age in zip(query_codes, query_sexes, query_ages.tolist()):
+                life_tables.remaining_years(code, sex, age)
+
+        def batch():
+            rows = np.array([life_tables.row(code, sex) for code, sex in zip(query_codes, query_sexes)])
+            life_tables.remaining_years_batch(rows, query_ages)
+
+        scalar_seconds = _best_of(scalar, repeat)
+        batch_seconds = _best_of(batch, repeat)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        'life_tables.open_seconds': open_seconds,
+        'life_tables.scalar_lookups_per_second': lookups / scalar_seconds,
+        'life_tables.batch_lookups_per_second': lookups / batch_seconds,
+    }
+
+
+def environment():
+    """Where the benchmarks ran, stored next to the metrics."""
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'platform': platform.platform(),
+    }
+
+
+def compare_results(metrics, baseline, threshold=0.2):
+    """
+    Find metrics that got worse than the baseline by more than threshold.
+
+    Args:
+        metrics: Current metrics dict
+        baseline: Baseline metrics dict
+        threshold: Allowed relative change, e.g. 0.2 for 20%
+
+    Returns:
+        (regressions, not comparable): lists of (name, baseline value,
+        current value, relative change) for every regression, and of
+        (name, baseline value, current value) for metrics whose baseline is
+        zero or negative (e.g. a timing overhead lost in noise), which have
+        no meaningful relative change
+    """
+    regressions = []
+    not_comparable = []
+    for name, value in metrics.items():
+        old_value = baseline.get(name)
+        if old_value is None:
+            continue
+        if old_value <= 0:
+            not_comparable.append((name, old_value, value))
+            continue
+        change = (value - old_value) / old_value
+        if name.endswith(HIGHER_IS_BETTER):
+            change = -change
+        if change > threshold:
+            regressions.append((name, old_value, value, change))
+    return regressions, not_comparable
+
+
+def bench_metrics(requests=100_000, repeat=3):
+    """
+    Cost of request timing: RequestTimingMiddleware around a view that does
+    nothing, and the query timer around a query that does nothing, minus the
+    same calls without them. Also the time to render the metrics endpoint.
+    """
+    from django.http import HttpResponse
+    from django.test import RequestFactory
+    from django.test.utils import override_settings
+
+    from .metrics import MetricsRegistry, _query_timer, finish_request, start_request
+    from .middleware import RequestTimingMiddleware
+
+    response = HttpResponse()
+    request = RequestFactory().get('/')
+
+    def view(request):
+        return response
+
+    def execute(sql, params, many, context):
+        return None
+
+    with override_settings(REQUEST_TIMING=True, SERVER_TIMING_HEADER=True):
+        middleware = RequestTimingMiddleware(view)
+    middleware.registry = MetricsRegistry()
+
+    def untimed_requests():
+        for _ in range(requests):
+            view(request)
+
+    def timed_requests():
+        for _ in range(requests):
+            middleware(request)
+
+    def untimed_queries():
+        for _ in range(requests):
+            execute('', None, False, None)
+
+    def timed_queries():
+        _, token = start_request()
+        for _ in range(requests):
+            _query_timer(execute, '', None, False, None)
+        finish_request(token)
+
+    request_overhead = (_best_of(timed_requests, repeat) - _best_of(untimed_requests, repeat)) / requests
+    query_overhead = (_best_of(timed_queries, repeat) - _best_of(untimed_queries, repeat)) / requests
+    return {
+        'metrics.request_overhead_seconds': request_overhead,
+        'metrics.query_overhead_seconds': query_overhead,
+        'metrics.exposition_seconds': _best_of(middleware.registry.exposition, repeat),
+    }
@@ -0,0 +1,167 @@
+"""
+Bulk lifespan estimation over NDJSON.
+
+estimate_ndjson() consumes an iterator of NDJSON lines (one profile per
+line, with the fields of LifeCalculationForm) and yields one NDJSON result
+line per input line. Profiles are validated with LifeCalculationForm,
+scored in small chunks with calculate_lifespan_batch() and optionally saved
+with bulk_create(), so memory stays flat however long the stream is.
+"""
+import json
+import secrets
+
+import numpy as np
+from django.db import transaction
+
+from .fingerprints import input_fingerprint
+from .forms import LifeCalculationForm
+from .life_tables import base_age_for
+from .lifespan_calculator import calculate_lifespan_batch
+from .models import LifeCalculation
+from .stats import record_calculations
+
+# Valid profiles scored (and saved) together
+CHUNK_SIZE = 500
+
+# Longest accepted input line; longer lines are rejected
+MAX_LINE_BYTES = 64 * 1024
+
+SCORED_FIELDS = (
+    'exercise_minutes_per_week',
+    'smoking_status',
+    'weight_kg',
+    'height_cm',
+    'diet_quality',
+    'alcohol_consumption',
+    'has_health_issues',
+)
+
+
+def read_lines(readline, max_line_bytes=MAX_LINE_BYTES):
+    """
+    Yield lines from a readline(size) callable, replacing lines longer than
+    max_line_bytes with None after skipping the rest of them.
+    """
+    while True:
+        line = readline(max_line_bytes)
+        if not line:
+            return
+        if len(line) >= max_line_bytes and not line.endswith(b'\n'):
+            while line and not line.endswith(b'\n'):
+                line = readline(max_line_bytes)
+            yield None
+        else:
+            yield line
+
+
+def _dumps(result):
+    return json.dumps(result, separators=(',', ':')).encode() + b'\n'
+
+
+def _parse(line):
+    """Return (profile dict, None) or (None, error dict) for one input line."""
+    if line is None:
+        return None, {'__all__': ['Line too long.']}
+    try:
+        profile = json.loads(line)
+    except ValueError:
+        return None, {'__all__': ['Invalid JSON.']}
+    if not isinstance(profile, dict):
+        return None, {'__all__': ['Expected a JSON object.']}
+
+    # The form expects what a browser submits: strings
+    data = {}
+    errors = {}
+    for field, value in profile.items():
+        if isinstance(value, (dict, list)):
+            errors[field] = ['Expected a string, number or boolean.']
+        elif value is not None:
+            data[field] = str(value)
+    if errors:
+        return None, errors
+
+    form = LifeCalculationForm(data=data)
+    if not form.is_valid():
+        return None, {field: list(errors) for field, errors in form.errors.items()}
+    cleaned_data = form.cleaned_data
+    cleaned_data['ref'] = profile.get('ref')
+    return cleaned_data, None
+
+
+def _flush(chunk, rules, persist):
+    """Score (and save) a chunk of (line number, cleaned data) and yield results."""
+    if not chunk:
+        return
+    columns = {field: [cleaned_data[field] for _, cleaned_data in chunk] for field in SCORED_FIELDS}
+    base_ages = [
+        base_age_for(cleaned_data['date_of_birth'], cleaned_data['gender'], rules.base_age)
+        for _, cleaned_data in chunk
+    ]
+    estimates = calculate_lifespan_batch(
+        columns, base_age=np.array(base_ages), rules_version=rules.version,
+    ).tolist()
+
+    unique_ids = [None] * len(chunk)
+    if persist:
+        unique_ids = [secrets.token_urlsafe(16) for _ in chunk]
+        with transaction.atomic():
+            calculations = LifeCalculation.objects.bulk_create([
+                LifeCalculation(
+                    date_of_birth=cleaned_data['date_of_birth'],
+                    gender=cleaned_data['gender'],
+                    **{field: cleaned_data[field] for field in SCORED_FIELDS},
+                    estimated_lifespan_years=estimated_years,
+                    base_age=base_age,
+                    unique_id=unique_id,
+                    fingerprint=input_fingerprint(cleaned_data, base_age, rules.version),
+                    rules_version=rules.version,
+                )
+                for (_, cleaned_data), base_age, estimated_years, unique_id
+                in zip(chunk, base_ages, estimates, unique_ids)
+            ])
+            record_calculations(calculations)
+
+    for (line_number, cleaned_data), estimated_years, unique_id in zip(chunk, estimates, unique_ids):
+        result = {'line': line_number, 'estimated_lifespan_years': estimated_years}
+        if cleaned_data['ref'] is not None:
+            result['ref'] = cleaned_data['ref']
+        if unique_id is not None:
+            result['unique_id'] = unique_id
+        yield _dumps(result)
+
+
+def estimate_ndjson(lines, rules, persist=False, chunk_size=None):
+    """
+    Yield NDJSON result lines for NDJSON profile lines.
+
+    Each result has the 1-based input "line" number and either
+    "estimated_lifespan_years" (plus "unique_id" when persisted) or
+    "errors". A "ref" value in the input is echoed back. Results are
+    yielded in input order; blank lines are skipped.
+
+    Args:
+        lines: Iterable of bytes lines (None for a line that was too long)
+        rules: Compiled rule table to score with
+        persist: Save valid profiles as LifeCalculation rows
+        chunk_size: Valid profiles scored and saved together (default
+            CHUNK_SIZE)
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    chunk = []
+    for line_number, line in enumerate(lines, start=1):
+        if line is not None and not line.strip():
+            continue
+        cleaned_data, errors = _parse(line)
+        if errors is not None:
+            # Keep results in input order
+            yield from _flush(chunk, rules, persist)
+            chunk = []
+            yield _dumps({'line': line_number, 'errors': errors})
+            continue
+
+        chunk.append((line_number, cleaned_data))
+        if len(chunk) >= chunk_size:
+            yield from _flush(chunk, rules, persist)
+            chunk = []
+
+    yield from _flush(chunk, rules, persist)
@@ -0,0 +1,54 @@
+"""
+Fingerprints of calculation inputs.
+
+Two calculations with the same fingerprint were scored from the same date of
+birth, gender and lifestyle answers with the same base age and rule table,
+so they have the same result and can share one row, share link, cached
+results page and PDF.
+"""
+import hashlib
+import json
+
+# Bump when the canonical form below changes, so old and new fingerprints
+# never collide
+FINGERPRINT_VERSION = 1
+
+FINGERPRINT_FIELDS = (
+    'date_of_birth',
+    'gender',
+    'exercise_minutes_per_week',
+    'smoking_status',
+    'weight_kg',
+    'height_cm',
+    'diet_quality',
+    'alcohol_consumption',
+    'has_health_issues',
+)
+
+
+def input_fingerprint(inputs, base_age, rules_version):
+    """
+    Return the hex SHA-256 of the canonical form of a calculation's inputs.
+
+    Args:
+        inputs: Mapping (cleaned form data, or a row's values) with the
+            FINGERPRINT_FIELDS
+        base_age: Base age the inputs were scored with
+        rules_version: Rule table version the inputs were scored with
+    """
+    canonical = {
+        'v': FINGERPRINT_VERSION,
+        'rules': rules_version,
+        'base_age': float(base_age),
+        'date_of_birth': inputs['date_of_birth'].isoformat(),
+        'gender': inputs['gender'],
+        'exercise_minutes_per_week': int(inputs['exercise_minutes_per_week']),
+        'smoking_status': inputs['smoking_status'],
+        'weight_kg': float(inputs['weight_kg']),
+        'height_cm': float(inputs['height_cm']),
+        'diet_quality': inputs['diet_quality'],
+        'alcohol_consumption': inputs['alcohol_consumption'],
+        'has_health_issues': bool(inputs['has_health_issues']),
+    }
+    payload = json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
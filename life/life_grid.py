@@ -0,0 +1,148 @@
+"""
+Inline life grid: every week (or day) of a lifespan as one cell, with the
+lived cells filled.
+
+The PDF calendar draws a page per year; the grid is a single image small
+enough to inline in the results page. The SVG does not draw a shape per
+cell. Two <pattern>s (lived and remaining) tile the cells, and each part of
+the grid is at most three rectangles (a partial first row, whole rows, a
+partial last row), so the SVG is the same size for any lifespan. The PNG is
+rasterised with NumPy from one tiled cell.
+
+A grid only depends on (unit, total cells, lived cells), so it is cached per
+that key in the RESULTS_CACHE_ALIAS cache and shared by every calculation
+with the same lifespan and age in that unit.
+"""
+import struct
+import zlib
+from math import ceil
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+# Bump when the rendered output changes so cached grids are not reused
+GRID_VERSION = 1
+
+# Unit to (days per cell, cells per row, cell pitch and gap between cells
+# in pixels)
+UNITS = {
+    'weeks': (7, 52, 10, 2),
+    'days': (1, 365, 3, 1),
+}
+FORMATS = ('svg', 'png')
+
+# RGBA; the background is transparent
+LIVED_COLOR = (239, 68, 68, 255)
+REMAINING_COLOR = (75, 85, 99, 255)
+BACKGROUND_COLOR = (0, 0, 0, 0)
+
+
+def grid_size(birth_date, death_date, today, unit='weeks'):
+    """(total cells, lived cells) of a lifespan on a date."""
+    days_per_cell = UNITS[unit][0]
+    total = max(1, ceil((death_date - birth_date).days / days_per_cell))
+    lived = min(max((today - birth_date).days // days_per_cell, 0), total)
+    return total, lived
+
+
+def _spans(start, stop, columns):
+    """Rectangles (column, row, width, height) covering cells start to stop."""
+    if start >= stop:
+        return
+    row, column = divmod(start, columns)
+    if column:
+        width = min(columns - column, stop - start)
+        yield column, row, width, 1
+        start += width
+        row += 1
+    full_rows = (stop - start) // columns
+    if full_rows:
+        yield 0, row, columns, full_rows
+        start += full_rows * columns
+        row += full_rows
+    if stop > start:
+        yield 0, row, stop - start, 1
+
+
+def _hex(color):
+    return '#%02x%02x%02x' % color[:3]
+
+
+def _svg_parts(total, lived, unit):
+    _, columns, cell, gap = UNITS[unit]
+    width, height = columns * cell - gap, ceil(total / columns) * cell - gap
+    yield (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" '
+        f'width="{width}" height="{height}" role="img">'
+    )
+    yield f'<title>{lived:,} of {total:,} {unit} lived</title><defs>'
+    for name, color in (('lived', LIVED_COLOR), ('remaining', REMAINING_COLOR)):
+        yield (
+            f'<pattern id="life-grid-{name}" width="{cell}" height="{cell}" patternUnits="userSpaceOnUse">'
+            f'<rect width="{cell - gap}" height="{cell - gap}" rx="{gap / 2:g}" fill="{_hex(color)}"/></pattern>'
+        )
+    yield '</defs>'
+    for name, start, stop in (('lived', 0, lived), ('remaining', lived, total)):
+        for column, row, span_width, span_height in _spans(start, stop, columns):
+            yield (
+                f'<rect x="{column * cell}" y="{row * cell}" width="{span_width * cell}" '
+                f'height="{span_height * cell}" fill="url(#life-grid-{name})"/>'
+            )
+    yield '</svg>'
+
+
+def render_life_grid_svg(total, lived, unit='weeks'):
+    """SVG of a grid of total cells with the first lived cells filled."""
+    return ''.join(_svg_parts(total, lived, unit))
+
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def render_life_grid_png(total, lived, unit='weeks'):
+    """PNG of the same grid as render_life_grid_svg()."""
+    _, columns, cell, gap = UNITS[unit]
+    rows = ceil(total / columns)
+
+    # One palette index per cell: 0 past the end, 1 lived, 2 remaining
+    cells = np.zeros(rows * columns, dtype=np.uint8)
+    cells[:lived] = 1
+    cells[lived:total] = 2
+    palette = np.array([BACKGROUND_COLOR, LIVED_COLOR, REMAINING_COLOR], dtype=np.uint8)
+    pixels = np.repeat(np.repeat(cells.reshape(rows, columns), cell, axis=0), cell, axis=1)
+    inside = np.zeros((cell, cell), dtype=bool)
+    inside[:cell - gap, :cell - gap] = True
+    pixels[~np.tile(inside, (rows, columns))] = 0
+    # Drop the gap after the last row and column
+    image = palette[pixels[:rows * cell - gap, :columns * cell - gap]]
+
+    height, width = image.shape[:2]
+    # Every scanline starts with filter type 0 (none)
+    scanlines = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    scanlines[:, 1:] = image.reshape(height, width * 4)
+    return b''.join((
+        b'\x89PNG\r\n\x1a\n',
+        _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)),
+        _png_chunk(b'IDAT', zlib.compress(scanlines.tobytes(), 6)),
+        _png_chunk(b'IEND', b''),
+    ))
+
+
+def life_grid(total, lived, unit='weeks', image_format='svg'):
+    """Cached SVG text or PNG bytes of a grid."""
+    cache = caches[settings.RESULTS_CACHE_ALIAS]
+    key = f'life-grid:{GRID_VERSION}:{unit}:{image_format}:{total}:{lived}'
+    content = cache.get(key)
+    if content is None:
+        render = render_life_grid_svg if image_format == 'svg' else render_life_grid_png
+        content = render(total, lived, unit)
+        cache.set(key, content, None)
+    return content
+
+
+def calculation_life_grid(calculation, today, unit='weeks', image_format='svg'):
+    """life_grid() of a saved calculation on a date."""
+    total, lived = grid_size(calculation.date_of_birth, calculation.estimated_death_date, today, unit)
+    return life_grid(total, lived, unit, image_format)
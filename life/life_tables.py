@@ -0,0 +1,158 @@
+"""
+Period life tables: remaining life expectancy by country, sex and age.
+
+Tables are stored in one compact binary file (see write_life_tables() and
+the build_life_tables command) and memory-mapped read-only, so every worker
+process on a host shares the same pages of the OS page cache. The file is
+only opened on the first lookup, so startup never touches it.
+
+File layout, little-endian:
+
+    8 bytes   magic b'LIFETBL1'
+    uint16    number of ages (0 .. ages - 1)
+    uint32    number of tables
+    tables ×  4 bytes key: 3-letter country code + sex ('M', 'F' or 'T')
+    tables ×  ages × float32 remaining years, one row per table
+
+A lookup is a dict hit for the row and two array reads for the ages
+either side of a fractional age, so it is O(1) whatever the file size.
+"""
+import mmap
+import struct
+from datetime import timezone as dt_timezone
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+MAGIC = b'LIFETBL1'
+HEADER = struct.Struct('<8sHI')
+
+# Sex codes of the tables; 'T' is both sexes combined
+SEXES = ('M', 'F', 'T')
+
+# LifeCalculation.gender to table sex
+GENDER_SEXES = {'male': 'M', 'female': 'F'}
+
+
+class LifeTablesError(ValueError):
+    """A life table file or its source data is malformed."""
+
+
+def write_life_tables(path, tables):
+    """
+    Write tables to path in the binary format.
+
+    Args:
+        tables: Mapping of (country, sex) to a sequence of remaining years
+            for ages 0, 1, 2, ...; every sequence must have the same length,
+            at least 2
+    """
+    keys = sorted(tables)
+    if not keys:
+        raise LifeTablesError('No life tables to write')
+    ages = len(tables[keys[0]])
+    if ages < 2:
+        # Lookups interpolate between two neighbouring ages
+        raise LifeTablesError(f'Tables need at least 2 ages, got {ages}')
+    for country, sex in keys:
+        if len(country) != 3 or not country.isascii() or sex not in SEXES:
+            raise LifeTablesError(f'Invalid table key: {country!r}, {sex!r}')
+        if len(tables[country, sex]) != ages:
+            raise LifeTablesError(f'Table {country} {sex} has {len(tables[country, sex])} ages, expected {ages}')
+
+    with open(path, 'wb') as output:
+        output.write(HEADER.pack(MAGIC, ages, len(keys)))
+        output.write(b''.join((country.upper() + sex).encode() for country, sex in keys))
+        output.write(np.array([tables[key] for key in keys], dtype='<f4').tobytes())
+
+
+class LifeTables:
+    """A memory-mapped life table file."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as source:
+            self._map = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            raise LifeTablesError(f'{path} is not a life table file')
+        magic, self.ages, count = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise LifeTablesError(f'{path} is not a life table file')
+        if self.ages < 2:
+            raise LifeTablesError(f'{path} has {self.ages} ages, at least 2 are needed')
+
+        keys = self._map[HEADER.size:HEADER.size + 4 * count].decode('ascii')
+        self.rows = {(keys[index:index + 3], keys[index + 3]): index // 4 for index in range(0, len(keys), 4)}
+        try:
+            self.data = np.frombuffer(
+                self._map, dtype='<f4', count=count * self.ages, offset=HEADER.size + 4 * count,
+            ).reshape(count, self.ages)
+        except ValueError:
+            raise LifeTablesError(f'{path} is truncated') from None
+
+    def row(self, country, sex):
+        """Row of a table; falls back to both sexes combined ('T')."""
+        rows = self.rows
+        country = country.upper()
+        row = rows.get((country, sex))
+        if row is None:
+            row = rows.get((country, 'T'))
+        if row is None:
+            raise KeyError(f'No life table for {country} {sex}')
+        return row
+
+    def remaining_years(self, country, sex, age):
+        """Remaining life expectancy at a (fractional) age in years."""
+        values = self.data[self.row(country, sex)]
+        age = min(max(age, 0.0), self.ages - 1)
+        lower = int(age)
+        if lower == self.ages - 1:
+            return float(values[lower])
+        fraction = age - lower
+        return float(values[lower] * (1 - fraction) + values[lower + 1] * fraction)
+
+    def remaining_years_batch(self, rows, ages):
+        """remaining_years() for arrays of rows (from row()) and ages."""
+        # A one-row batch may arrive as scalars; always return an array
+        rows = np.atleast_1d(rows)
+        ages = np.clip(np.atleast_1d(np.asarray(ages, dtype=np.float64)), 0, self.ages - 1)
+        lower = np.minimum(ages.astype(np.intp), self.ages - 2)
+        fraction = ages - lower
+        values = self.data
+        return values[rows, lower] * (1 - fraction) + values[rows, lower + 1] * fraction
+
+
+@lru_cache(maxsize=None)
+def get_life_tables():
+    """The LIFE_TABLES_PATH tables, opened on first use, or None."""
+    if not settings.LIFE_TABLES_PATH:
+        return None
+    return LifeTables(settings.LIFE_TABLES_PATH)
+
+
+def age_in_years(date_of_birth, today):
+    return (today - date_of_birth).days / 365.25
+
+
+def base_age_for(date_of_birth, gender, default, today=None):
+    """
+    Expected age at death of someone of this age and gender today in
+    LIFE_TABLE_COUNTRY: their age plus their remaining life expectancy.
+    Rounded to 0.01 years, so the base age (and with it the input
+    fingerprint) changes every few days rather than daily. today defaults
+    to the UTC date, like the daily page cache, so every worker agrees
+    on it whatever TIME_ZONE is.
+
+    Returns default when no life tables are configured or the country has
+    no table.
+    """
+    tables = get_life_tables()
+    if tables is None:
+        return default
+    age = age_in_years(date_of_birth, today or timezone.now().astimezone(dt_timezone.utc).date())
+    try:
+        remaining = tables.remaining_years(settings.LIFE_TABLE_COUNTRY, GENDER_SEXES.get(gender, 'T'), age)
+    except KeyError:
+        return default
+    return round(age + remaining, 2)
@@ -11,7 +11,17 @@ Factors:
 - Diet: 0.15 weight
 - Alcohol: 0.1 weight
 - Health Metrics: 0.15 weight
+
+The bands, scores and weights are read from the versioned rule tables in
+life/rules/ (see scoring_rules.py); the values above are those of "v1".
+
+calculate_lifespan() scores one person; calculate_lifespan_batch() scores
+column arrays of many people at once with NumPy. calculate_lifespan_bands()
+gives the uncertainty around one person's estimate.
 """
+import numpy as np
+
+from .scoring_rules import get_rules
 
 
 def calculate_exercise_score(exercise_minutes_per_week):
@@ -22,12 +32,7 @@ def calculate_exercise_score(exercise_minutes_per_week):
     75-150 minutes → +3
     0-75 minutes → 0
     """
-    if exercise_minutes_per_week >= 150:
-        return 5
-    elif exercise_minutes_per_week >= 75:
-        return 3
-    else:
-        return 0
+    return get_rules().factor('exercise').score(exercise_minutes_per_week)
 
 
 def calculate_smoking_score(smoking_status):
@@ -38,13 +43,7 @@ def calculate_smoking_score(smoking_status):
     Occasional → -5
     None → 0
     """
-    smoking_status = smoking_status.lower().strip()
-    if smoking_status in ['daily', 'روزانه']:
-        return -10
-    elif smoking_status in ['occasional', 'sometimes', 'گاهی']:
-        return -5
-    else:
-        return 0
+    return get_rules().factor('smoking').score(smoking_status)
 
 
 def calculate_bmi_score(weight_kg, height_cm):
@@ -57,13 +56,7 @@ def calculate_bmi_score(weight_kg, height_cm):
     """
     height_m = height_cm / 100
     bmi = weight_kg / (height_m ** 2)
-    
-    if 18.5 <= bmi <= 24.9:
-        return 2
-    elif 25 <= bmi <= 29.9:
-        return 0
-    else:
-        return -2
+    return get_rules().factor('bmi').score(bmi)
 
 
 def calculate_diet_score(diet_quality):
@@ -74,13 +67,7 @@ def calculate_diet_score(diet_quality):
     Moderate → 0
     Unhealthy → -2
     """
-    diet_quality = diet_quality.lower().strip()
-    if diet_quality in ['healthy', 'سالم']:
-        return 2
-    elif diet_quality in ['moderate', 'متوسط']:
-        return 0
-    else:
-        return -2
+    return get_rules().factor('diet').score(diet_quality)
 
 
 def calculate_alcohol_score(alcohol_consumption):
@@ -90,11 +77,7 @@ def calculate_alcohol_score(alcohol_consumption):
     Heavy consumption → -3
     Light/None → 0
     """
-    alcohol_consumption = alcohol_consumption.lower().strip()
-    if alcohol_consumption in ['heavy', 'high', 'زیاد']:
-        return -3
-    else:
-        return 0
+    return get_rules().factor('alcohol').score(alcohol_consumption)
 
 
 def calculate_health_score(has_health_issues):
@@ -105,27 +88,19 @@ def calculate_health_score(has_health_issues):
     One abnormal → 0
     Multiple abnormal → -5
     """
-    if isinstance(has_health_issues, bool):
-        return 3 if not has_health_issues else -5
-    
-    has_health_issues = str(has_health_issues).lower().strip()
-    if has_health_issues in ['no', 'false', 'none', 'خیر']:
-        return 3
-    elif has_health_issues in ['yes', 'true', 'multiple', 'بله']:
-        return -5
-    else:
-        return 0
+    return get_rules().factor('health').score(has_health_issues)
 
 
 def calculate_lifespan(
-    base_age=75,
+    base_age=None,
     exercise_minutes_per_week=0,
     smoking_status='none',
     weight_kg=70,
     height_cm=170,
     diet_quality='moderate',
     alcohol_consumption='none',
-    has_health_issues=False
+    has_health_issues=False,
+    rules_version=None
 ):
     """
     Calculate estimated lifespan using the weighted formula.
@@ -135,7 +110,7 @@ def calculate_lifespan(
                      + 0.15×Diet + 0.1×Alcohol + 0.15×Health
     
     Args:
-        base_age: Base life expectancy (default 75)
+        base_age: Base life expectancy (default: the rule table's, 75)
         exercise_minutes_per_week: Weekly exercise minutes
         smoking_status: 'none', 'occasional', 'daily'
         weight_kg: Weight in kilograms
@@ -143,27 +118,151 @@ def calculate_lifespan(
         diet_quality: 'healthy', 'moderate', 'unhealthy'
         alcohol_consumption: 'none', 'light', 'heavy'
         has_health_issues: Boolean or string indicating health issues
+        rules_version: Name of the rule table to use (default 'v1')
     
     Returns:
         Estimated lifespan in years (float)
     """
-    exercise_score = calculate_exercise_score(exercise_minutes_per_week)
-    smoking_score = calculate_smoking_score(smoking_status)
-    bmi_score = calculate_bmi_score(weight_kg, height_cm)
-    diet_score = calculate_diet_score(diet_quality)
-    alcohol_score = calculate_alcohol_score(alcohol_consumption)
-    health_score = calculate_health_score(has_health_issues)
-    
-    # Weighted formula
-    estimated_age = (
-        base_age
-        + 0.2 * exercise_score
-        + 0.25 * smoking_score
-        + 0.15 * bmi_score
-        + 0.15 * diet_score
-        + 0.1 * alcohol_score
-        + 0.15 * health_score
-    )
-    
-    # Ensure minimum age is reasonable (at least 50 years)
-    return max(estimated_age, 50)
+    inputs = {
+        'exercise_minutes_per_week': exercise_minutes_per_week,
+        'smoking_status': smoking_status,
+        'weight_kg': weight_kg,
+        'height_cm': height_cm,
+        'diet_quality': diet_quality,
+        'alcohol_consumption': alcohol_consumption,
+        'has_health_issues': has_health_issues,
+    }
+    return get_rules(rules_version).estimate(inputs, base_age=base_age)
+
+
+# Values used by calculate_lifespan_batch() for columns that are not given
+BATCH_DEFAULTS = {
+    'exercise_minutes_per_week': 0,
+    'smoking_status': 'none',
+    'weight_kg': 70,
+    'height_cm': 170,
+    'diet_quality': 'moderate',
+    'alcohol_consumption': 'none',
+    'has_health_issues': False,
+}
+
+
+def calculate_lifespan_batch(profiles, base_age=None, rules_version=None):
+    """
+    Calculate estimated lifespans for many people in one vectorized pass.
+    
+    Gives exactly the same values as calling calculate_lifespan() once per row.
+    
+    Args:
+        profiles: Columns indexable by field name - a dict of arrays, a NumPy
+            structured array or a pandas DataFrame. Recognized fields are the
+            keyword arguments of calculate_lifespan(); missing fields use the
+            same defaults.
+        base_age: Base life expectancy, a scalar or an array
+            (default: the rule table's, 75)
+        rules_version: Name of the rule table to use (default 'v1')
+    
+    Returns:
+        NumPy float64 array of estimated lifespans in years
+    """
+    if isinstance(profiles, np.ndarray):
+        names = profiles.dtype.names or ()
+    else:
+        names = profiles
+    
+    columns = {}
+    for name, default in BATCH_DEFAULTS.items():
+        columns[name] = np.asarray(profiles[name] if name in names else default)
+    columns['weight_kg'] = columns['weight_kg'].astype(np.float64)
+    columns['height_cm'] = columns['height_cm'].astype(np.float64)
+    
+    return get_rules(rules_version).estimate_batch(columns, base_age=base_age)
+
+
+# Samples drawn by calculate_lifespan_bands()
+UNCERTAINTY_SAMPLES = 100_000
+
+# Resolution, in years, of the band percentiles
+BAND_RESOLUTION = 0.1
+
+
+def lifespan_bands(mean, sd, minimum_age=50, samples=UNCERTAINTY_SAMPLES, seed=0):
+    """
+    Sample lifespans from Normal(mean, sd), floored at minimum_age, and
+    summarize them.
+    
+    The samples are counted into BAND_RESOLUTION-year bins, which gives both
+    the percentiles and the survival curve without sorting the samples.
+    
+    Returns:
+        Dict with p10, p50 and p90 in years and 'survival', a list of
+        (age, fraction of samples living to at least that age) for every
+        whole year the samples span
+    """
+    rng = np.random.default_rng(seed)
+    lifespans = np.maximum(mean + sd * rng.standard_normal(samples), minimum_age)
+    
+    bins = np.floor(lifespans / BAND_RESOLUTION).astype(np.intp)
+    first_bin = int(bins.min())
+    died_by = np.cumsum(np.bincount(bins - first_bin)) / samples
+    
+    def percentile(fraction):
+        index = int(np.searchsorted(died_by, fraction))
+        return round((first_bin + index + 0.5) * BAND_RESOLUTION, 2)
+    
+    bins_per_year = round(1 / BAND_RESOLUTION)
+    # From the youngest sampled age to the first age nobody reaches
+    ages = np.arange(first_bin // bins_per_year, (first_bin + len(died_by)) // bins_per_year + 1)
+    # Fraction dead before each age: the cumulative count of the bin below it
+    below = np.clip(ages * bins_per_year - first_bin, 0, len(died_by)) - 1
+    surviving = 1 - np.where(below >= 0, died_by[np.maximum(below, 0)], 0)
+    
+    return {
+        'p10': percentile(0.1),
+        'p50': percentile(0.5),
+        'p90': percentile(0.9),
+        'survival': [(int(age), round(float(fraction), 4)) for age, fraction in zip(ages, surviving)],
+    }
+
+
+def calculate_lifespan_bands(
+    base_age=None,
+    exercise_minutes_per_week=0,
+    smoking_status='none',
+    weight_kg=70,
+    height_cm=170,
+    diet_quality='moderate',
+    alcohol_consumption='none',
+    has_health_issues=False,
+    rules_version=None,
+    samples=UNCERTAINTY_SAMPLES,
+    seed=0,
+):
+    """
+    Uncertainty mode of calculate_lifespan(): Monte Carlo percentiles and a
+    survival curve instead of a single estimate.
+    
+    Each sample perturbs every factor effect by the rule table's effect_cv
+    and adds baseline_sd years of individual variation (see
+    RuleTable.estimate_spread()). The same seed gives the same bands.
+    
+    Args:
+        Same as calculate_lifespan(), plus:
+        samples: Number of lifespans sampled
+        seed: Seed of the random generator
+    
+    Returns:
+        See lifespan_bands()
+    """
+    inputs = {
+        'exercise_minutes_per_week': exercise_minutes_per_week,
+        'smoking_status': smoking_status,
+        'weight_kg': weight_kg,
+        'height_cm': height_cm,
+        'diet_quality': diet_quality,
+        'alcohol_consumption': alcohol_consumption,
+        'has_health_issues': has_health_issues,
+    }
+    rules = get_rules(rules_version)
+    mean, sd = rules.estimate_spread(inputs, base_age=base_age)
+    return lifespan_bands(mean, sd, rules.minimum_age, samples, seed)
@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from life.retention import archive_calculations
+
+
+class Command(BaseCommand):
+    help = 'Move calculations older than the retention period to gzip archive files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.CALCULATION_RETENTION_DAYS,
+            help='Archive calculations created more than this many days ago',
+        )
+        parser.add_argument('--archive-dir', help='Archive directory (default: CALCULATION_ARCHIVE_DIR)')
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.CALCULATION_ARCHIVE_BATCH_SIZE,
+            help='Rows archived and deleted per transaction',
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0.0,
+            help='Seconds to wait between batches, to leave the database to live traffic',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+
+        def progress(rows, rate):
+            self.stdout.write(f'{rows:,} rows archived ({rate:,.0f} rows/s)')
+
+        total = archive_calculations(
+            cutoff, directory=options['archive_dir'], batch_size=options['batch_size'],
+            pause=options['pause'], progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Archived {total:,} calculations created before {cutoff:%Y-%m-%d}'))
@@ -0,0 +1,90 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from life.benchmarks import bench_admin, bench_import, bench_life_tables, bench_metrics, bench_pdf, bench_pdf_parallel, bench_scoring, bench_servers, bench_views, bench_writes, compare_results, environment
+
+BENCHMARKS = ('scoring', 'pdf', 'views', 'writes', 'servers', 'admin', 'life_tables', 'pdf_parallel', 'metrics', 'import')
+
+# Run when no benchmark is named; the others are slow or seed large tables
+DEFAULT_BENCHMARKS = ('scoring', 'pdf', 'views')
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the lifespan calculator, the PDF renderer and the views.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'benchmarks', nargs='*',
+            help=f'Benchmarks to run: {", ".join(BENCHMARKS)} (default: {", ".join(DEFAULT_BENCHMARKS)})',
+        )
+        parser.add_argument('--rows', type=int, default=100_000, help='Profiles to score')
+        parser.add_argument('--years', type=int, nargs='+', default=[50, 80, 100], help='PDF year counts')
+        parser.add_argument('--repeat', type=int, default=3, help='Best-of repetitions')
+        parser.add_argument('--seed-rows', type=int, default=10_000, help='Calculations seeded for the views')
+        parser.add_argument('--iterations', type=int, default=50, help='Requests per view')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent writers')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per view for the server comparison')
+        parser.add_argument('--concurrency', type=int, default=16, help='Requests in flight for the server comparison')
+        parser.add_argument('--submissions', type=int, default=4000, help='Rows saved by the write benchmark')
+        parser.add_argument(
+            '--workers', type=int, nargs='+', default=[1, 2, 4, 8], help='Process counts for the parallel PDF benchmark',
+        )
+        parser.add_argument('--admin-rows', type=int, default=200_000, help='Calculations seeded for the admin')
+        parser.add_argument('--import-rows', type=int, default=50_000, help='Calculations imported by the import benchmark')
+        parser.add_argument('--output', help='Write results to this JSON file')
+        parser.add_argument('--compare', help='Baseline JSON file to check for regressions')
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Relative slowdown that counts as a regression (default 0.2)',
+        )
+
+    def handle(self, *args, **options):
+        selected = options['benchmarks'] or DEFAULT_BENCHMARKS
+        unknown = set(selected) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError(f'Unknown benchmark(s): {", ".join(sorted(unknown))}')
+
+        metrics = {}
+        if 'scoring' in selected:
+            metrics.update(bench_scoring(rows=options['rows'], repeat=options['repeat']))
+        if 'pdf' in selected:
+            metrics.update(bench_pdf(year_counts=options['years'], repeat=options['repeat']))
+        if 'views' in selected:
+            metrics.update(bench_views(rows=options['seed_rows'], iterations=options['iterations']))
+        if 'writes' in selected:
+            metrics.update(bench_writes(threads=options['threads'], submissions=options['submissions']))
+        if 'servers' in selected:
+            metrics.update(bench_servers(
+                rows=options['seed_rows'], requests=options['requests'], concurrency=options['concurrency'],
+            ))
+        if 'admin' in selected:
+            metrics.update(bench_admin(rows=options['admin_rows'], iterations=options['iterations'] // 5 or 1))
+        if 'pdf_parallel' in selected:
+            metrics.update(bench_pdf_parallel(workers=options['workers'], repeat=options['repeat']))
+        if 'life_tables' in selected:
+            metrics.update(bench_life_tables(repeat=options['repeat']))
+        if 'metrics' in selected:
+            metrics.update(bench_metrics(repeat=options['repeat']))
+        if 'import' in selected:
+            metrics.update(bench_import(rows=options['import_rows']))
+
+        for name, value in metrics.items():
+            formatted = f'{value:,.0f}' if value >= 1000 else f'{value:.6g}'
+            self.stdout.write(f'{name:<50} {formatted:>16}')
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'environment': environment(), 'metrics': metrics}, output, indent=2)
+
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)['metrics']
+            regressions, not_comparable = compare_results(metrics, baseline, options['threshold'])
+            for name, old_value, value in not_comparable:
+                self.stderr.write(f'NOT COMPARABLE {name}: {old_value:,.6g} -> {value:,.6g} (baseline is not positive)')
+            for name, old_value, value, change in regressions:
+                self.stderr.write(f'REGRESSION {name}: {old_value:,.6g} -> {value:,.6g} ({change:+.0%})')
+            if regressions:
+                raise CommandError(f'{len(regressions)} benchmark(s) regressed')
+            self.stdout.write(self.style.SUCCESS('No regressions'))
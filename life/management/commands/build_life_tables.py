@@ -0,0 +1,47 @@
+import csv
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from life.life_tables import SEXES, LifeTablesError, write_life_tables
+
+# Spellings of the sex column accepted besides M, F and T
+SEX_NAMES = {'male': 'M', 'female': 'F', 'total': 'T', 'both': 'T'}
+
+
+class Command(BaseCommand):
+    help = 'Build the binary life table file from a CSV of remaining life expectancy.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'input',
+            help='CSV with columns country (3-letter code), sex (M, F or T), age and remaining_years, '
+                 'e.g. the ex column of a period life table',
+        )
+        parser.add_argument('output', help='Binary file to write, used as LIFE_TABLES_PATH')
+
+    def handle(self, *args, **options):
+        tables = defaultdict(dict)
+        with open(options['input'], newline='', encoding='utf-8') as source:
+            for number, record in enumerate(csv.DictReader(source), start=2):
+                try:
+                    sex = record['sex'].strip()
+                    sex = SEX_NAMES.get(sex.lower(), sex.upper())
+                    if sex not in SEXES:
+                        raise ValueError(f'unknown sex {record["sex"]!r}')
+                    key = (record['country'].strip().upper(), sex)
+                    tables[key][int(record['age'])] = float(record['remaining_years'])
+                except (KeyError, ValueError) as error:
+                    raise CommandError(f'Line {number}: {error}')
+
+        rows = {}
+        for key, by_age in tables.items():
+            if sorted(by_age) != list(range(len(by_age))):
+                raise CommandError(f'Table {key[0]} {key[1]} must cover every age from 0 without gaps')
+            rows[key] = [by_age[age] for age in range(len(by_age))]
+
+        try:
+            write_life_tables(options['output'], rows)
+        except LifeTablesError as error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(rows)} life tables to {options["output"]}'))
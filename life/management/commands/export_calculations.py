@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from life.transfer import CHUNK_SIZE, FORMATS, TransferError, detect_format, export_calculations, open_text
+
+
+class Command(BaseCommand):
+    help = 'Export life calculations to CSV or JSON Lines, optionally gzipped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output',
+            help="File to write, e.g. calculations.csv or calculations.jsonl.gz ('-' for stdout)",
+        )
+        parser.add_argument('--format', choices=FORMATS, help='File format (default: from the file name)')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output (implied by .gz)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows fetched per query')
+        parser.add_argument(
+            '--after-id', type=int,
+            help='Export rows after this id and append to the output, to resume an interrupted export',
+        )
+
+    def handle(self, *args, **options):
+        path = options['output']
+        try:
+            file_format, gzipped = detect_format(path, options['format'])
+        except TransferError as error:
+            raise CommandError(error)
+        gzipped = gzipped or options['gzip']
+
+        # Keep stdout clean when the export goes there
+        log = self.stderr if path == '-' else self.stdout
+
+        def progress(rows, rate, last_id):
+            log.write(f'{rows:,} rows exported, up to id {last_id} ({rate:,.0f} rows/s)')
+
+        after = options['after_id']
+        with open_text(path, 'w' if after is None else 'a', gzipped) as stream:
+            total, last_id = export_calculations(
+                stream, file_format, after=after, chunk_size=options['chunk_size'], progress=progress,
+            )
+        log.write(self.style.SUCCESS(f'Exported {total:,} rows, up to id {last_id}'))
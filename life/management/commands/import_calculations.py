@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from life.transfer import CHUNK_SIZE, FORMATS, TransferError, detect_format, import_calculations, open_text
+
+
+class Command(BaseCommand):
+    help = 'Import life calculations from CSV or JSON Lines, optionally gzipped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'input',
+            help="File to read, e.g. calculations.csv or calculations.jsonl.gz ('-' for stdin)",
+        )
+        parser.add_argument('--format', choices=FORMATS, help='File format (default: from the file name)')
+        parser.add_argument('--gzip', action='store_true', help='Decompress the input (implied by .gz)')
+        parser.add_argument('--batch-size', type=int, default=CHUNK_SIZE, help='Rows saved per transaction')
+        parser.add_argument(
+            '--offset', type=int, default=0,
+            help='Skip this many rows, to resume an interrupted import',
+        )
+        parser.add_argument(
+            '--ignore-conflicts', action='store_true',
+            help='Skip rows whose unique_id already exists',
+        )
+
+    def handle(self, *args, **options):
+        path = options['input']
+        try:
+            file_format, gzipped = detect_format(path, options['format'])
+        except TransferError as error:
+            raise CommandError(error)
+        gzipped = gzipped or options['gzip']
+        saved = options['offset']
+
+        def progress(rows, rate):
+            nonlocal saved
+            saved = rows
+            self.stdout.write(f'{rows:,} rows imported ({rate:,.0f} rows/s)')
+
+        try:
+            with open_text(path, 'r', gzipped) as stream:
+                total = import_calculations(
+                    stream, file_format, offset=options['offset'], batch_size=options['batch_size'],
+                    ignore_conflicts=options['ignore_conflicts'], progress=progress,
+                )
+        except (TransferError, IntegrityError) as error:
+            raise CommandError(f'{error}. Rows before it are saved; resume with --offset {saved}')
+        self.stdout.write(self.style.SUCCESS(f'Imported {total - options["offset"]:,} rows'))
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from life.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = 'Print a token that lets anyone profile requests to one path (see life/profiling.py).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='URL path to allow, e.g. /pdf/<unique_id>/')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not path.startswith('/') or '?' in path:
+            raise CommandError('path must be a URL path starting with "/", without a query string')
+        token = make_token(path)
+        self.stdout.write(f'{path}?profile=cpu&profile_token={token}')
+        self.stdout.write(f'Valid for {settings.PROFILE_TOKEN_MAX_AGE} seconds; use profile=memory for allocations.')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from life.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the lifespan statistics from all saved calculations.'
+
+    def handle(self, *args, **options):
+        rows = rebuild_stats()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows:,} statistics rows'))
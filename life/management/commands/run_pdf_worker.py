@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from life.pdf_jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Render queued life calendar PDFs in a local process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int,
+            help='Maximum concurrent renders (default: PDF_JOB_WORKERS)',
+        )
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+
+    def handle(self, *args, **options):
+        try:
+            run_worker(processes=options['processes'], once=options['once'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,37 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from life.models import LifeCalculation
+from life.pdf_cache import get_pdf_cache, life_calendar_key, open_life_calendar_pdf
+from life.pdf_generator import calculate_total_years
+
+
+class Command(BaseCommand):
+    help = 'Pre-render life calendar PDFs into the shared PDF cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'years', nargs='*', type=int,
+            help='Year counts to render (default: every year count in the database)',
+        )
+
+    def handle(self, *args, **options):
+        year_counts = options['years'] or self.year_counts_in_use()
+        cache = get_pdf_cache()
+
+        for total_years in sorted(set(year_counts)):
+            if cache.path(life_calendar_key(total_years)).exists():
+                self.stdout.write(f'{total_years} years: cached')
+                continue
+            open_life_calendar_pdf(total_years).close()
+            self.stdout.write(f'{total_years} years: rendered')
+
+    def year_counts_in_use(self):
+        # The year count depends only on the lifespan, not the birth date
+        year_counts = set()
+        lifespans = LifeCalculation.objects.order_by().values_list('estimated_lifespan_years', flat=True).distinct()
+        for lifespan_years in lifespans.iterator():
+            calculation = LifeCalculation(date_of_birth=date.today(), estimated_lifespan_years=lifespan_years)
+            year_counts.add(calculate_total_years(calculation.date_of_birth, calculation.estimated_death_date))
+        return year_counts
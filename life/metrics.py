@@ -0,0 +1,209 @@
+"""
+Per-request timings: database, scoring, template and PDF render time.
+
+RequestTimingMiddleware (life/middleware.py) starts a RequestTimings for
+every request in a context variable. While it is set:
+
+- every SQL query adds to 'db' through a wrapper installed on each database
+  connection as it is opened (install_query_timer());
+- code wrapped in timed(phase) adds to that phase: 'scoring' around the
+  calculator, 'template' around rendering, 'pdf' around PDF renders, which
+  also record_pdf_bytes().
+
+Context variables follow sync_to_async() and the async ORM into their
+threads, so the async views are covered too. Outside a request the
+wrappers only read the context variable.
+
+The middleware sends the timings to the client as a Server-Timing header
+and adds them to fixed-bucket histograms per view in this process, which
+the metrics view serves in the Prometheus text format. Every process keeps
+its own histograms.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from threading import Lock
+from time import perf_counter
+
+# Phases of a request, in Server-Timing order
+PHASES = ('db', 'scoring', 'template', 'pdf')
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERIES_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000, 10_000_000)
+
+# Histogram name to (help text, buckets)
+HISTOGRAMS = {
+    'timetodeath_request_duration_seconds': ('Time spent in the view and inner middleware', SECONDS_BUCKETS),
+    'timetodeath_db_duration_seconds': ('Time spent running SQL queries', SECONDS_BUCKETS),
+    'timetodeath_db_queries': ('SQL queries per request', QUERIES_BUCKETS),
+    'timetodeath_scoring_duration_seconds': ('Time spent estimating lifespans', SECONDS_BUCKETS),
+    'timetodeath_template_duration_seconds': ('Time spent rendering templates', SECONDS_BUCKETS),
+    'timetodeath_pdf_duration_seconds': ('Time spent rendering PDFs', SECONDS_BUCKETS),
+    'timetodeath_pdf_bytes': ('Size of rendered PDFs', BYTES_BUCKETS),
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class RequestTimings:
+    """What one request spent its time on."""
+
+    __slots__ = ('durations', 'queries', 'pdf_bytes')
+
+    def __init__(self):
+        self.durations = {}
+        self.queries = 0
+        self.pdf_bytes = 0
+
+    def add(self, phase, seconds):
+        self.durations[phase] = self.durations.get(phase, 0.0) + seconds
+
+
+_current = ContextVar('request_timings', default=None)
+
+
+def start_request():
+    """Start timing a request; pass the token to finish_request()."""
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def finish_request(token):
+    _current.reset(token)
+
+
+@contextmanager
+def timed(phase):
+    """Add the time spent in the block to a phase of the current request."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(phase, perf_counter() - start)
+
+
+def record_pdf_bytes(size):
+    timings = _current.get()
+    if timings is not None:
+        timings.pdf_bytes += size
+
+
+def _query_timer(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add('db', perf_counter() - start)
+        timings.queries += 1
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """connection_created receiver adding the query timer to a connection."""
+    if _query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_query_timer)
+
+
+def server_timing(timings, total):
+    """Server-Timing header value of a request's timings (in milliseconds)."""
+    durations = timings.durations
+    parts = []
+    for phase in PHASES:
+        if phase == 'db':
+            parts.append(f'db;dur={durations.get("db", 0.0) * 1000:.2f};desc="{timings.queries} queries"')
+        elif phase in durations:
+            part = f'{phase};dur={durations[phase] * 1000:.2f}'
+            if phase == 'pdf':
+                part += f';desc="{timings.pdf_bytes} bytes"'
+            parts.append(part)
+    parts.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(parts)
+
+
+class Histogram:
+    """Counts of observations per bucket (upper bounds), plus their sum."""
+
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # The last count is the +Inf bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """The request histograms of this process, per view."""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = Lock()
+
+    def _histogram(self, name, view):
+        histogram = self._histograms.get((name, view))
+        if histogram is None:
+            histogram = self._histograms[name, view] = Histogram(HISTOGRAMS[name][1])
+        return histogram
+
+    def observe(self, view, timings, total):
+        """Add a finished request's timings to the histograms of its view."""
+        durations = timings.durations
+        with self._lock:
+            self._histogram('timetodeath_request_duration_seconds', view).observe(total)
+            self._histogram('timetodeath_db_duration_seconds', view).observe(durations.get('db', 0.0))
+            self._histogram('timetodeath_db_queries', view).observe(timings.queries)
+            for phase in ('scoring', 'template', 'pdf'):
+                if phase in durations:
+                    self._histogram(f'timetodeath_{phase}_duration_seconds', view).observe(durations[phase])
+            if timings.pdf_bytes:
+                self._histogram('timetodeath_pdf_bytes', view).observe(timings.pdf_bytes)
+
+    def exposition(self):
+        """The histograms in the Prometheus text exposition format."""
+        with self._lock:
+            snapshot = {
+                key: (list(histogram.counts), histogram.sum) for key, histogram in self._histograms.items()
+            }
+        lines = []
+        for name, (help_text, buckets) in HISTOGRAMS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for (histogram_name, view), (counts, total) in sorted(snapshot.items()):
+                if histogram_name != name:
+                    continue
+                view = _label(view)
+                cumulative = 0
+                for bound, count in zip(buckets, counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{view="{view}",le="{bound:g}"}} {cumulative}')
+                cumulative += counts[-1]
+                lines.append(f'{name}_bucket{{view="{view}",le="+Inf"}} {cumulative}')
+                lines.append(f'{name}_sum{{view="{view}"}} {total!r}')
+                lines.append(f'{name}_count{{view="{view}"}} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+@lru_cache(maxsize=None)
+def get_registry():
+    """The process-wide metrics registry."""
+    return MetricsRegistry()
@@ -0,0 +1,104 @@
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .metrics import finish_request, get_registry, server_timing, start_request
+from .profiling import aprofile_request, profile_request, requested_profile, token_allows
+
+
+class RequestTimingMiddleware:
+    """
+    Time each request (see metrics.py), send the timings as a Server-Timing
+    header and add them to the metrics histograms of its view.
+
+    Disabled with REQUEST_TIMING = False. Put it first in MIDDLEWARE so the
+    total covers the rest of the stack.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.registry = get_registry()
+        self.server_timing = settings.SERVER_TIMING_HEADER
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        start = perf_counter()
+        timings, token = start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            finish_request(token)
+        return self._finish(request, response, timings, perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = perf_counter()
+        timings, token = start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            finish_request(token)
+        return self._finish(request, response, timings, perf_counter() - start)
+
+    def _finish(self, request, response, timings, total):
+        match = request.resolver_match
+        self.registry.observe(match.view_name if match else 'unmatched', timings, total)
+        if self.server_timing:
+            response['Server-Timing'] = server_timing(timings, total)
+        return response
+
+
+class RequestProfilingMiddleware:
+    """
+    Run a request under cProfile or tracemalloc when a staff user or a
+    valid token asks for it with ?profile= (see profiling.py); every other
+    request passes straight through.
+
+    Disabled with REQUEST_PROFILING = False. Put it after
+    AuthenticationMiddleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        kind = requested_profile(request)
+        if kind is None:
+            return self.get_response(request)
+        user = request.user
+        if user.is_staff:
+            return profile_request(request, self.get_response, kind, user.get_username())
+        if token_allows(request):
+            return profile_request(request, self.get_response, kind)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        kind = requested_profile(request)
+        if kind is None:
+            return await self.get_response(request)
+        user = await request.auser()
+        if user.is_staff:
+            return await aprofile_request(request, self.get_response, kind, user.get_username())
+        if token_allows(request):
+            return await aprofile_request(request, self.get_response, kind)
+        return await self.get_response(request)
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:09
+
+import hashlib
+import json
+
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+# Every calculation saved before this migration was scored with the
+# original formula, which is rule table v1
+RULES_VERSION = 'v1'
+
+# A frozen copy of life.fingerprints as of fingerprint version 1, so later
+# changes to the app code never change what this migration writes
+
+FINGERPRINT_FIELDS = (
+    'date_of_birth',
+    'gender',
+    'exercise_minutes_per_week',
+    'smoking_status',
+    'weight_kg',
+    'height_cm',
+    'diet_quality',
+    'alcohol_consumption',
+    'has_health_issues',
+)
+
+
+def input_fingerprint(inputs, base_age, rules_version):
+    canonical = {
+        'v': 1,
+        'rules': rules_version,
+        'base_age': float(base_age),
+        'date_of_birth': inputs['date_of_birth'].isoformat(),
+        'gender': inputs['gender'],
+        'exercise_minutes_per_week': int(inputs['exercise_minutes_per_week']),
+        'smoking_status': inputs['smoking_status'],
+        'weight_kg': float(inputs['weight_kg']),
+        'height_cm': float(inputs['height_cm']),
+        'diet_quality': inputs['diet_quality'],
+        'alcohol_consumption': inputs['alcohol_consumption'],
+        'has_health_issues': bool(inputs['has_health_issues']),
+    }
+    payload = json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def backfill_fingerprints(apps, schema_editor):
+    LifeCalculation = apps.get_model('life', 'LifeCalculation')
+    rows = LifeCalculation.objects.order_by('pk').only('pk', 'base_age', *FINGERPRINT_FIELDS)
+    last_pk = 0
+    while True:
+        # Walk by primary key rather than holding a cursor open while updating
+        batch = list(rows.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            return
+        for calculation in batch:
+            calculation.fingerprint = input_fingerprint(
+                {field: getattr(calculation, field) for field in FINGERPRINT_FIELDS},
+                calculation.base_age,
+                RULES_VERSION,
+            )
+        LifeCalculation.objects.bulk_update(batch, ['fingerprint'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('life', '0002_pdfjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lifecalculation',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+    ]
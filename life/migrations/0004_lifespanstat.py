@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('life', '0003_lifecalculation_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LifespanStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('dimension', models.CharField(max_length=20)),
+                ('value', models.CharField(blank=True, max_length=20)),
+                ('bucket', models.IntegerField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('total_years', models.FloatField(default=0)),
+                ('total_squared_years', models.FloatField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('life', '0004_lifespanstat'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lifecalculation',
+            index=models.Index(fields=['created_at', 'id'], name='life_calc_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lifecalculation',
+            index=models.Index(fields=['gender', 'created_at', 'id'], name='life_calc_gender_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lifecalculation',
+            index=models.Index(fields=['smoking_status', 'created_at', 'id'], name='life_calc_smoking_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lifecalculation',
+            index=models.Index(fields=['diet_quality', 'created_at', 'id'], name='life_calc_diet_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lifecalculation',
+            index=models.Index(fields=['date_of_birth'], name='life_calc_birth_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('life', '0007_requestprofile'),
+    ]
+
+    operations = [
+        # Every calculation saved so far was scored with rule table v1, the
+        # only one there has been
+        migrations.AddField(
+            model_name='lifecalculation',
+            name='rules_version',
+            field=models.CharField(blank=True, max_length=32, default='v1'),
+            preserve_default=False,
+        ),
+    ]
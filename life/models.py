@@ -1,3 +1,5 @@
+from datetime import timedelta
+
 from django.db import models
 from django.utils import timezone
 
@@ -43,9 +45,132 @@ class LifeCalculation(models.Model):
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
     unique_id = models.CharField(max_length=32, unique=True, db_index=True)
+    # Hash of the scored inputs, base age and rule table (see fingerprints.py)
+    fingerprint = models.CharField(max_length=64, blank=True, db_index=True)
+    # Rule table the estimate was scored with (see scoring_rules.py); blank
+    # when unknown, e.g. imported rows
+    rules_version = models.CharField(max_length=32, blank=True)
+    
+    @property
+    def estimated_death_date(self):
+        return self.date_of_birth + timedelta(days=int(self.estimated_lifespan_years * 365.25))
     
     def __str__(self):
         return f"Life Calculation - {self.date_of_birth} - {self.estimated_lifespan_years} years"
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Newest-first admin pages and keyset pagination, alone and
+            # under each list filter
+            models.Index(fields=['created_at', 'id'], name='life_calc_created_idx'),
+            models.Index(fields=['gender', 'created_at', 'id'], name='life_calc_gender_created_idx'),
+            models.Index(fields=['smoking_status', 'created_at', 'id'], name='life_calc_smoking_created_idx'),
+            models.Index(fields=['diet_quality', 'created_at', 'id'], name='life_calc_diet_created_idx'),
+            # Exact date of birth search
+            models.Index(fields=['date_of_birth'], name='life_calc_birth_idx'),
+        ]
+
+
+class PDFJob(models.Model):
+    """
+    A background render of a life calendar PDF into the PDF cache.
+    
+    Jobs are keyed by the PDF cache key, so identical requests share one job.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    
+    key = models.CharField(max_length=64, unique=True)
+    total_years = models.PositiveIntegerField()
+    mode = models.CharField(max_length=20)
+    status = models.CharField(max_length=10, choices=[
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ], default=PENDING, db_index=True)
+    error = models.TextField(blank=True)
+    # Worker rendering the job, "<host>:<pid>:<random>" (see pdf_jobs.py)
+    worker = models.CharField(max_length=100, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Last sign of life from the worker while running
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"PDF Job - {self.total_years} years - {self.status}"
+    
+    class Meta:
+        ordering = ['created_at']
+
+
+class LifespanStat(models.Model):
+    """
+    Running totals of estimated lifespans for one histogram bucket of one
+    group of calculations, e.g. smoking_status "daily" and 70-71 years.
+    
+    Kept up to date by stats.py as calculations are saved, so dashboards
+    never have to aggregate the LifeCalculation table.
+    """
+    # "<dimension>:<value>:<bucket>", for cheap lookups when updating
+    key = models.CharField(max_length=64, unique=True)
+    dimension = models.CharField(max_length=20)
+    value = models.CharField(max_length=20, blank=True)
+    bucket = models.IntegerField()
+    
+    count = models.BigIntegerField(default=0)
+    total_years = models.FloatField(default=0)
+    total_squared_years = models.FloatField(default=0)
+    
+    def __str__(self):
+        return f"Lifespan Stat - {self.key}"
+
+
+class ArchivedCalculation(models.Model):
+    """
+    Where an archived LifeCalculation was written, so its share link can be
+    restored without reading whole archive files (see retention.py).
+    """
+    unique_id = models.CharField(max_length=32, unique=True)
+    # Archive file month, "YYYY-MM"
+    month = models.CharField(max_length=7)
+    # Byte offset of the gzip member holding the row
+    offset = models.BigIntegerField()
+    
+    def __str__(self):
+        return f"Archived Calculation - {self.unique_id} - {self.month}"
+
+
+class RequestProfile(models.Model):
+    """
+    A report of one profiled request, written to PROFILES_DIR by
+    profiling.py.
+    """
+    CPU = 'cpu'
+    MEMORY = 'memory'
+    
+    kind = models.CharField(max_length=10, choices=[
+        (CPU, 'CPU (cProfile)'),
+        (MEMORY, 'Memory (tracemalloc)'),
+    ])
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    # Staff username; empty when profiled with a token
+    user = models.CharField(max_length=150, blank=True)
+    # File name in PROFILES_DIR
+    report = models.CharField(max_length=100, unique=True)
+    size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Request Profile - {self.kind} - {self.method} {self.path}"
+    
+    class Meta:
+        ordering = ['-created_at']
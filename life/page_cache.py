@@ -0,0 +1,146 @@
+"""
+Caching of pages that only change when the UTC date rolls over.
+
+serve_daily_cached() stores a rendered page in the RESULTS_CACHE_ALIAS cache
+until the next UTC midnight and answers repeat visitors with 304 Not
+Modified. When the page is missing, a short-lived lock in the same cache
+makes sure only one worker renders it while the others wait for the result.
+Use a cache shared by all workers (the file-based default, Redis or
+Memcached) for the lock to cover the whole pool.
+"""
+import asyncio
+import hashlib
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date
+
+from .profiling import cache_bypassed
+
+# How long a worker waiting on another worker's render polls the cache
+LOCK_POLL_INTERVAL = 0.05
+
+
+def next_utc_midnight(now):
+    tomorrow = now.astimezone(dt_timezone.utc).date() + timedelta(days=1)
+    return datetime.combine(tomorrow, datetime.min.time(), tzinfo=dt_timezone.utc)
+
+
+def _cache_response(entry, expires):
+    response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    response['Cache-Control'] = f'public, max-age={expires}'
+    return response
+
+
+def _page_keys(request, key, today):
+    page_key = f'daily-page:{key}:{today.isoformat()}:{request.scheme}:{request.get_host()}'
+    return page_key, f'{page_key}:lock'
+
+
+def _entry(response, midnight):
+    modified = int((midnight - timedelta(days=1)).timestamp())
+    if response.has_header('Last-Modified'):
+        modified = max(modified, parse_http_date(response['Last-Modified']))
+    return {
+        'content': response.content,
+        'content_type': response['Content-Type'],
+        'etag': '"%s"' % hashlib.md5(response.content, usedforsecurity=False).hexdigest(),
+        'last_modified': modified,
+    }
+
+
+def _respond(request, entry, expires):
+    response = get_conditional_response(
+        request, etag=entry['etag'], last_modified=entry['last_modified']
+    )
+    if response is not None:
+        response['Cache-Control'] = f'public, max-age={expires}'
+        return response
+    return _cache_response(entry, expires)
+
+
+def serve_daily_cached(request, key, render):
+    """
+    Serve a page cached until the next UTC midnight.
+
+    Args:
+        request: The current request
+        key: Cache key identifying the page; the UTC date and host are added
+        render: Callable taking today's UTC date and returning an
+            HttpResponse (only called on a cache miss). A Last-Modified
+            header it sets is kept when later than today's midnight.
+    """
+    cache = caches[settings.RESULTS_CACHE_ALIAS]
+    now = timezone.now()
+    today = now.astimezone(dt_timezone.utc).date()
+    midnight = next_utc_midnight(now)
+    expires = max(1, int((midnight - now).total_seconds()))
+    page_key, lock_key = _page_keys(request, key, today)
+    # A profiled request can ask for a fresh render
+    if cache_bypassed():
+        return render(today)
+
+    entry = cache.get(page_key)
+    if entry is None:
+        if cache.add(lock_key, 1, settings.RESULTS_CACHE_LOCK_TIMEOUT):
+            try:
+                response = render(today)
+                if response.status_code != 200:
+                    return response
+                entry = _entry(response, midnight)
+                cache.set(page_key, entry, expires)
+            finally:
+                cache.delete(lock_key)
+        else:
+            # Another worker is rendering this page; wait for it
+            deadline = time.monotonic() + settings.RESULTS_CACHE_LOCK_TIMEOUT
+            while entry is None and time.monotonic() < deadline:
+                time.sleep(LOCK_POLL_INTERVAL)
+                entry = cache.get(page_key)
+            if entry is None:
+                return render(today)
+
+    return _respond(request, entry, expires)
+
+
+async def aserve_daily_cached(request, key, arender):
+    """
+    Async serve_daily_cached(): arender is a coroutine function and waiting
+    for another worker's render does not block the event loop.
+    """
+    cache = caches[settings.RESULTS_CACHE_ALIAS]
+    now = timezone.now()
+    today = now.astimezone(dt_timezone.utc).date()
+    midnight = next_utc_midnight(now)
+    expires = max(1, int((midnight - now).total_seconds()))
+    page_key, lock_key = _page_keys(request, key, today)
+    if cache_bypassed():
+        return await arender(today)
+
+    entry = await cache.aget(page_key)
+    if entry is None:
+        if await cache.aadd(lock_key, 1, settings.RESULTS_CACHE_LOCK_TIMEOUT):
+            try:
+                response = await arender(today)
+                if response.status_code != 200:
+                    return response
+                entry = _entry(response, midnight)
+                await cache.aset(page_key, entry, expires)
+            finally:
+                await cache.adelete(lock_key)
+        else:
+            deadline = time.monotonic() + settings.RESULTS_CACHE_LOCK_TIMEOUT
+            while entry is None and time.monotonic() < deadline:
+                await asyncio.sleep(LOCK_POLL_INTERVAL)
+                entry = await cache.aget(page_key)
+            if entry is None:
+                return await arender(today)
+
+    return _respond(request, entry, expires)
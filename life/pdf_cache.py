@@ -0,0 +1,210 @@
+"""
+Cache for rendered life calendar PDFs.
+
+A calendar depends only on its render parameters (currently the number of
+years), so rendered files are stored under a hash of those parameters:
+
+- An in-process LRU tier keeps recently rendered PDFs in memory, bounded by
+  PDF_CACHE_MEMORY_BYTES.
+- A shared on-disk tier in PDF_CACHE_DIR is used by every worker. Files are
+  written atomically and the least recently used ones are evicted once the
+  directory grows past PDF_CACHE_MAX_BYTES.
+
+Hits from the disk tier are returned as open files, so they can be streamed
+(or sent with sendfile) without reading them into memory.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+
+from .metrics import record_pdf_bytes, timed
+from .pdf_generator import DEFAULT_LAYOUT, DEFAULT_RENDER_MODE, RENDERER_VERSION
+from .pdf_parallel import render_life_calendar_parallel
+from .profiling import cache_bypassed
+
+
+def cache_key(**params):
+    """Stable hash of the render parameters and the renderer version."""
+    payload = json.dumps({'renderer': RENDERER_VERSION, **params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class PDFCache:
+    """Two-tier (memory, disk) store of rendered PDFs keyed by cache_key()."""
+
+    def __init__(self, directory, max_bytes, memory_max_bytes):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.memory_max_bytes = memory_max_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        return self.directory / key[:2] / f'{key}.pdf'
+
+    def open(self, key):
+        """
+        Return a readable binary file for a cached PDF, or None on a miss.
+        """
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return BytesIO(data)
+
+        path = self.path(key)
+        try:
+            pdf_file = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        # Record the hit for LRU eviction across workers
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return pdf_file
+
+    def store(self, key, data):
+        """Add a rendered PDF to both tiers."""
+        self._remember(key, data)
+        self._write(key, data)
+
+    def ensure_on_disk(self, key, pdf_file):
+        """
+        Return the on-disk path of a cached PDF, first writing pdf_file
+        (from open() or get_or_render()) there if the file is missing, e.g.
+        after a memory tier hit whose file was evicted from disk.
+        """
+        path = self.path(key)
+        if not path.exists():
+            pdf_file.seek(0)
+            self._write(key, pdf_file.read())
+        return path
+
+    def _write(self, key, data):
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file and rename, so readers never see partial files
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self.evict()
+
+    def get_or_render(self, key, render):
+        """
+        Return an open file for a cached PDF, rendering it on a miss.
+
+        Args:
+            key: Key from cache_key()
+            render: Callable writing the PDF into the binary file-like
+                object it is given
+        """
+        # A profiled request can ask for a fresh render
+        pdf_file = None if cache_bypassed() else self.open(key)
+        if pdf_file is not None:
+            return pdf_file
+
+        buffer = BytesIO()
+        with timed('pdf'):
+            render(buffer)
+        data = buffer.getvalue()
+        record_pdf_bytes(len(data))
+        self.store(key, data)
+        return BytesIO(data)
+
+    def _remember(self, key, data):
+        if len(data) > self.memory_max_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                return
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.memory_max_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def evict(self):
+        """Delete least recently used files until the disk tier fits max_bytes."""
+        entries = []
+        total = 0
+        for path in self.directory.glob('*/*.pdf'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+
+
+@lru_cache(maxsize=None)
+def get_pdf_cache():
+    """The process-wide PDF cache configured in settings."""
+    return PDFCache(
+        settings.PDF_CACHE_DIR,
+        settings.PDF_CACHE_MAX_BYTES,
+        settings.PDF_CACHE_MEMORY_BYTES,
+    )
+
+
+def life_calendar_key(total_years, mode=DEFAULT_RENDER_MODE, layout=DEFAULT_LAYOUT, years=None, highlight=None):
+    # Parameters at their defaults are left out, so the keys of complete
+    # yearly calendars (and their cached files) stay the same
+    params = {'total_years': total_years, 'mode': mode}
+    if layout != DEFAULT_LAYOUT:
+        params['layout'] = layout
+    if years:
+        params['years'] = list(years)
+    if highlight:
+        params['highlight'] = list(highlight)
+    return cache_key(**params)
+
+
+def open_life_calendar_pdf(total_years, mode=DEFAULT_RENDER_MODE, layout=DEFAULT_LAYOUT, years=None, highlight=None):
+    """
+    Return an open binary file with the life calendar for total_years,
+    rendering and caching it if needed.
+    """
+    return get_pdf_cache().get_or_render(
+        life_calendar_key(total_years, mode, layout, years, highlight),
+        lambda output: render_life_calendar_parallel(total_years, output, mode, layout, years, highlight),
+    )
+
+
+def life_calendar_pdf_path(total_years, mode=DEFAULT_RENDER_MODE, layout=DEFAULT_LAYOUT, years=None,
+                           highlight=None):
+    """
+    Return the on-disk path of the life calendar for total_years,
+    rendering and caching it if needed.
+    """
+    with open_life_calendar_pdf(total_years, mode, layout, years, highlight) as pdf_file:
+        return get_pdf_cache().ensure_on_disk(life_calendar_key(total_years, mode, layout, years, highlight), pdf_file)
@@ -9,68 +9,242 @@ from io import BytesIO
 from datetime import date
 
 
-def create_life_calendar_pdf(birth_date, estimated_death_date, filename=None):
+# Bump when the rendered output changes so cached PDFs are not reused
+RENDERER_VERSION = 3
+
+
+def calculate_total_years(birth_date, estimated_death_date):
+    """Number of yearly pages in the calendar between two dates."""
+    total_days = (estimated_death_date - birth_date).days
+    return ceil(total_days / 365.25)
+
+
+def lived_position(birth_date, today):
     """
-    Create a PDF with circles representing each day of life.
-    Each page represents one year with 365 circles numbered by day.
-    
-    Args:
-        birth_date: datetime.date object for birth date
-        estimated_death_date: datetime.date object for estimated death date
-        filename: Optional filename. If None, returns BytesIO object
-    
-    Returns:
-        BytesIO object containing PDF data, or saves to filename if provided
+    (year page, days lived on it) of a date in the calendar; e.g. (31, 120)
+    on the 120th day of the 31st year of life.
     """
-    # Calculate total years
-    total_days = (estimated_death_date - birth_date).days
-    total_years = ceil(total_days / 365.25)
+    elapsed_days = (today - birth_date).days
+    year = int(elapsed_days / 365.25) + 1
+    return year, min(elapsed_days - int((year - 1) * 365.25), CIRCLES_PER_PAGE)
+
+
+# "form" draws the year grid once as a PDF form XObject and stamps it on
+# every page; "inline" redraws all 365 circles on every page.
+RENDER_MODES = ('form', 'inline')
+DEFAULT_RENDER_MODE = 'form'
+
+CIRCLES_PER_PAGE = 365
+MARGIN = 40
+CIRCLE_RADIUS = 12
+
+# "yearly" is one page per year of 365 day circles; the poster layouts put
+# one row per year of week or month cells on a single page (or a few).
+LAYOUTS = ('yearly', 'weeks', 'months')
+DEFAULT_LAYOUT = 'yearly'
+
+# Poster layout to cells per row
+POSTER_COLUMNS = {'weeks': 52, 'months': 12}
+POSTER_HEADER = 40
+# Room for the year labels left of the grid
+POSTER_LABEL_WIDTH = 24
+# Smallest row pitch in points; longer lives continue on another page
+POSTER_MIN_PITCH = 6
+POSTER_MAX_PITCH = 2 * CIRCLE_RADIUS
+
+
+def _grid_cells(width, height):
+    """Yield (x, y, day) for each circle of the year grid."""
+    cols = int(sqrt(CIRCLES_PER_PAGE))
+    rows = ceil(CIRCLES_PER_PAGE / cols)
+    spacing_x = (width - 2 * MARGIN) / (cols - 1)
+    spacing_y = (height - 2 * MARGIN - 30) / (rows - 1)  # 30 for year header space
     
-    # Create PDF in memory or file
-    if filename:
-        pdf_buffer = open(filename, 'wb')
-    else:
-        pdf_buffer = BytesIO()
+    count = 1
+    for r in range(rows):
+        for c_index in range(cols):
+            if count > CIRCLES_PER_PAGE:
+                return
+            x = MARGIN + c_index * spacing_x
+            y = height - MARGIN - 30 - r * spacing_y
+            yield x, y, count
+            count += 1
+
+
+def _draw_year_header(c, width, height, year):
+    c.setFont("Helvetica-Bold", 20)
+    c.drawCentredString(width / 2, height - MARGIN / 2, f"Year {year}")
+
+
+def _draw_lived_days(c, width, height, days):
+    # Filled discs over the grid, then their day numbers on top. A
+    # zero-length line with round caps is a disc as wide as the line, and
+    # takes a fraction of the operators of a filled circle.
+    cells = [cell for cell in _grid_cells(width, height) if cell[2] <= days]
+    c.saveState()
+    c.setStrokeColorRGB(0.94, 0.27, 0.27)
+    c.setLineWidth(2 * CIRCLE_RADIUS)
+    c.setLineCap(1)
+    dots = c.beginPath()
+    for x, y, day in cells:
+        dots.moveTo(x, y)
+        dots.lineTo(x, y)
+    c.drawPath(dots, stroke=1, fill=0)
+    c.restoreState()
+    c.setFillColorRGB(1, 1, 1)
+    c.setFont("Helvetica", 6)
+    for x, y, day in cells:
+        c.drawCentredString(x, y - 2, str(day))
+
+
+def _render_form(c, width, height, years, highlight):
+    # Define the grid once; every page only adds its header
+    c.beginForm('year_grid')
+    c.setFont("Helvetica", 6)
+    for x, y, day in _grid_cells(width, height):
+        c.circle(x, y, CIRCLE_RADIUS)
+        c.drawCentredString(x, y - 2, str(day))
+    c.endForm()
     
-    width, height = A4
-    c = canvas.Canvas(pdf_buffer, pagesize=A4)
+    for year in years:
+        c.doForm('year_grid')
+        _draw_year_header(c, width, height, year)
+        if highlight and highlight[0] == year:
+            _draw_lived_days(c, width, height, highlight[1])
+        c.showPage()
+
+
+def _render_inline(c, width, height, years, highlight):
+    for year in years:
+        _draw_year_header(c, width, height, year)
+        
+        for x, y, day in _grid_cells(width, height):
+            c.circle(x, y, CIRCLE_RADIUS)
+            
+            # Write day number inside circle
+            c.setFont("Helvetica", 6)
+            c.drawCentredString(x, y - 2, str(day))
+        
+        if highlight and highlight[0] == year:
+            _draw_lived_days(c, width, height, highlight[1])
+        c.showPage()  # Next page
+
+
+def _render_poster(c, width, height, total_years, layout):
+    columns = POSTER_COLUMNS[layout]
+    grid_width = width - 2 * MARGIN - POSTER_LABEL_WIDTH
+    grid_height = height - 2 * MARGIN - POSTER_HEADER
+    rows_per_page = min(total_years, int(grid_height // POSTER_MIN_PITCH))
+    pitch = min(grid_width / columns, grid_height / rows_per_page, POSTER_MAX_PITCH)
+    cell = pitch * 0.8
+    left = MARGIN + POSTER_LABEL_WIDTH + (grid_width - columns * pitch) / 2
+    top = height - MARGIN - POSTER_HEADER
+    pages = ceil(total_years / rows_per_page)
     
-    circles_per_page = 365
-    margin = 40
-    circle_radius = 12
+    # One row of cells is drawn once as a form and stamped for every year
+    c.beginForm('poster_row')
+    c.setLineWidth(0.5)
+    row_path = c.beginPath()
+    for column in range(columns):
+        row_path.rect(left + column * pitch, 0, cell, cell)
+    c.drawPath(row_path, stroke=1, fill=0)
+    c.endForm()
     
-    for year in range(1, total_years + 1):
-        # Write year at top of page
+    for page in range(pages):
         c.setFont("Helvetica-Bold", 20)
-        c.drawCentredString(width / 2, height - margin / 2, f"Year {year}")
-        
-        # Calculate grid layout for 365 circles
-        cols = int(sqrt(circles_per_page))
-        rows = ceil(circles_per_page / cols)
-        spacing_x = (width - 2 * margin) / (cols - 1)
-        spacing_y = (height - 2 * margin - 30) / (rows - 1)  # 30 for year header space
+        title = f"Life in {layout.capitalize()}"
+        if pages > 1:
+            title += f" ({page + 1}/{pages})"
+        c.drawCentredString(width / 2, height - MARGIN / 2 - 10, title)
         
-        count = 1
-        for r in range(rows):
-            for c_index in range(cols):
-                if count > circles_per_page:
-                    break
-                x = margin + c_index * spacing_x
-                y = height - margin - 30 - r * spacing_y
-                c.circle(x, y, circle_radius)
-                
-                # Write day number inside circle
-                c.setFont("Helvetica", 6)
-                c.drawCentredString(x, y - 2, str(count))
-                count += 1
+        # One font for all the labels of the page
+        c.setFont("Helvetica", 6)
+        for column in (0, *range(9, columns, 10), columns - 1):
+            c.drawCentredString(left + column * pitch + cell / 2, top + 4, str(column + 1))
         
-        c.showPage()  # Next page
+        first_year = page * rows_per_page
+        for year in range(first_year, min(first_year + rows_per_page, total_years)):
+            y = top - (year - first_year + 1) * pitch
+            c.saveState()
+            c.translate(0, y)
+            c.doForm('poster_row')
+            c.restoreState()
+            if year == 0 or (year + 1) % 5 == 0:
+                c.drawRightString(left - 4, y + (cell - 4) / 2, str(year + 1))
+        c.showPage()
+
+
+def render_life_calendar(total_years, output, mode=DEFAULT_RENDER_MODE, layout=DEFAULT_LAYOUT,
+                         years=None, highlight=None):
+    """
+    Draw the life calendar into a file-like object.
+    
+    The output depends only on the arguments (no timestamps are embedded),
+    which makes it cacheable (see pdf_cache.py).
+    
+    Args:
+        total_years: Number of years in the calendar
+        output: Writable binary file-like object
+        mode: One of RENDER_MODES. "form" produces the same pages as
+            "inline" but much smaller and faster, with compressed streams.
+            Poster layouts are always drawn with forms.
+        layout: One of LAYOUTS
+        years: Optional (first, last) year pages to draw, 1-based and
+            inclusive; only pages in the range are rendered
+        highlight: Optional (year, days) from lived_position(); the first
+            days circles of that year's page are filled
+    
+    Ranges and highlighting are only supported by the yearly layout.
+    """
+    if mode not in RENDER_MODES:
+        raise ValueError(f"Unknown render mode: {mode!r}")
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout: {layout!r}")
+    if layout != 'yearly' and (years or highlight):
+        raise ValueError("Year ranges and highlighting need the yearly layout")
+    first_year, last_year = years or (1, total_years)
+    if not 1 <= first_year <= last_year <= total_years:
+        raise ValueError(f"Invalid year range {first_year}-{last_year} of {total_years}")
     
+    width, height = A4
+    pages = range(first_year, last_year + 1)
+    if layout != 'yearly':
+        c = canvas.Canvas(output, pagesize=A4, pageCompression=1, invariant=1)
+        _render_poster(c, width, height, total_years, layout)
+    elif mode == 'form':
+        c = canvas.Canvas(output, pagesize=A4, pageCompression=1, invariant=1)
+        _render_form(c, width, height, pages, highlight)
+    else:
+        c = canvas.Canvas(output, pagesize=A4, invariant=1)
+        _render_inline(c, width, height, pages, highlight)
     c.save()
+
+
+def create_life_calendar_pdf(birth_date, estimated_death_date, filename=None, mode=DEFAULT_RENDER_MODE,
+                             layout=DEFAULT_LAYOUT):
+    """
+    Create a PDF with circles representing each day of life.
+    Each page represents one year with 365 circles numbered by day, or with
+    a poster layout one row per year of week or month cells.
+    
+    Args:
+        birth_date: datetime.date object for birth date
+        estimated_death_date: datetime.date object for estimated death date
+        filename: Optional filename. If None, returns BytesIO object
+        mode: One of RENDER_MODES
+        layout: One of LAYOUTS
+    
+    Returns:
+        BytesIO object containing PDF data, or saves to filename if provided
+    """
+    total_years = calculate_total_years(birth_date, estimated_death_date)
     
     if filename:
-        pdf_buffer.close()
+        with open(filename, 'wb') as pdf_file:
+            render_life_calendar(total_years, pdf_file, mode, layout)
         return None
-    else:
-        pdf_buffer.seek(0)
-        return pdf_buffer
+    
+    pdf_buffer = BytesIO()
+    render_life_calendar(total_years, pdf_buffer, mode, layout)
+    pdf_buffer.seek(0)
+    return pdf_buffer
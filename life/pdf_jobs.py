@@ -0,0 +1,189 @@
+"""
+Background rendering of life calendar PDFs.
+
+Requests enqueue a PDFJob row instead of rendering on the request thread.
+The run_pdf_worker management command claims pending jobs and renders them
+in a local process pool into the shared PDF cache. Long calendars are split
+into chunks rendered by several pool processes and merged by the worker
+(see pdf_parallel.py). The queue lives in the database, so no external
+broker is needed.
+
+A running job records the worker that claimed it, and that worker updates
+its heartbeat every PDF_JOB_HEARTBEAT_INTERVAL seconds until the job is
+finished. Only jobs whose heartbeat is older than PDF_JOB_TIMEOUT (their
+worker died or hung) are queued again, however long the render takes.
+"""
+import logging
+import os
+import secrets
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import PDFJob
+from .pdf_cache import PDFCache, get_pdf_cache, life_calendar_key
+from .pdf_generator import DEFAULT_LAYOUT, DEFAULT_RENDER_MODE, render_life_calendar
+from .pdf_parallel import merge_into_cache, plan_chunks, render_chunk
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_life_calendar(total_years, mode=DEFAULT_RENDER_MODE):
+    """
+    Return the job rendering the life calendar for total_years.
+
+    Identical requests share one job. A job is (re)queued only when its
+    PDF is neither cached nor already being rendered.
+    """
+    key = life_calendar_key(total_years, mode)
+    job, created = PDFJob.objects.get_or_create(
+        key=key, defaults={'total_years': total_years, 'mode': mode}
+    )
+    if created or job.status in (PDFJob.PENDING, PDFJob.RUNNING):
+        return job
+
+    if job.status == PDFJob.DONE and get_pdf_cache().path(key).exists():
+        return job
+
+    # Failed, or finished but evicted from the cache since
+    PDFJob.objects.filter(pk=job.pk, status=job.status).update(
+        status=PDFJob.PENDING, error='', started_at=None, finished_at=None
+    )
+    job.refresh_from_db()
+    return job
+
+
+def render_job(cache_directory, max_bytes, key, total_years, mode, layout=DEFAULT_LAYOUT, years=None, highlight=None):
+    """Render one PDF into the on-disk cache. Runs in a pool process."""
+    cache = PDFCache(cache_directory, max_bytes, memory_max_bytes=0)
+    cache.get_or_render(
+        key, lambda output: render_life_calendar(total_years, output, mode, layout, years, highlight),
+    ).close()
+
+
+def make_worker_id():
+    """Identifier of a worker, unique across hosts and restarts."""
+    return f'{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}'
+
+
+def claim_next_job(worker=''):
+    """Atomically move the oldest pending job to running, or return None."""
+    for job in PDFJob.objects.filter(status=PDFJob.PENDING)[:10]:
+        now = timezone.now()
+        claimed = PDFJob.objects.filter(pk=job.pk, status=PDFJob.PENDING).update(
+            status=PDFJob.RUNNING, worker=worker, started_at=now, heartbeat_at=now
+        )
+        if claimed:
+            job.status = PDFJob.RUNNING
+            job.worker = worker
+            return job
+    return None
+
+
+def send_heartbeat(worker):
+    """Mark the jobs a worker is running as still alive."""
+    return PDFJob.objects.filter(status=PDFJob.RUNNING, worker=worker).update(heartbeat_at=timezone.now())
+
+
+def requeue_stale_jobs(worker=None):
+    """
+    Return jobs whose worker stopped sending heartbeats to the queue. The
+    calling worker's own jobs are never requeued.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.PDF_JOB_TIMEOUT)
+    # Jobs claimed before heartbeats were recorded have none
+    stale = PDFJob.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+        status=PDFJob.RUNNING,
+    )
+    if worker is not None:
+        stale = stale.exclude(worker=worker)
+    return stale.update(status=PDFJob.PENDING, worker='', started_at=None, heartbeat_at=None)
+
+
+def _finish(job, error=''):
+    PDFJob.objects.filter(pk=job.pk).update(
+        status=PDFJob.FAILED if error else PDFJob.DONE,
+        error=error,
+        finished_at=timezone.now(),
+    )
+
+
+def run_worker(processes=None, once=False, poll_interval=1.0, worker=None):
+    """
+    Claim and render pending jobs until interrupted.
+
+    Args:
+        processes: Pool size, i.e. the maximum number of concurrent renders
+            (default settings.PDF_JOB_WORKERS)
+        once: Stop when the queue is empty instead of polling
+        poll_interval: Seconds to sleep when there is nothing to do
+        worker: Identifier recorded on claimed jobs (default:
+            make_worker_id())
+    """
+    processes = processes or settings.PDF_JOB_WORKERS
+    worker = worker or make_worker_id()
+    last_heartbeat = 0.0
+    # Future to (job, chunk documents or None, chunk index)
+    running = {}
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        while True:
+            close_old_connections()
+            if running and time.monotonic() - last_heartbeat >= settings.PDF_JOB_HEARTBEAT_INTERVAL:
+                send_heartbeat(worker)
+                last_heartbeat = time.monotonic()
+            requeue_stale_jobs(worker)
+
+            while len(running) < processes:
+                job = claim_next_job(worker)
+                if job is None:
+                    break
+                chunks = plan_chunks(job.total_years, job.mode, processes=processes)
+                if chunks is None:
+                    future = pool.submit(
+                        render_job, str(settings.PDF_CACHE_DIR), settings.PDF_CACHE_MAX_BYTES,
+                        job.key, job.total_years, job.mode,
+                    )
+                    running[future] = (job, None, 0)
+                    continue
+                documents = [None] * len(chunks)
+                for index, chunk in enumerate(chunks):
+                    future = pool.submit(render_chunk, job.total_years, job.mode, chunk, None)
+                    running[future] = (job, documents, index)
+
+            if not running:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, documents, index = running.pop(future)
+                error = future.exception()
+                if documents is not None and error is None:
+                    documents[index] = future.result()
+                    if any(document is None for document in documents):
+                        continue
+                    try:
+                        merge_into_cache(get_pdf_cache(), job.key, documents)
+                    except Exception as merge_error:
+                        error = merge_error
+                elif documents is not None:
+                    # Skip the job's other chunks; the first error fails it
+                    for other, (other_job, _, _) in list(running.items()):
+                        if other_job is job:
+                            other.cancel()
+                            running.pop(other)
+                if error is not None:
+                    logger.error("PDF job %s failed: %r", job.key, error)
+                    _finish(job, error=repr(error))
+                else:
+                    _finish(job)
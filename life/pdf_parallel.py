@@ -0,0 +1,206 @@
+"""
+Parallel rendering of long life calendars.
+
+render_life_calendar() draws every page on one core. The pages of the
+yearly layout do not depend on each other, so a long calendar can be cut
+into ranges of years (split_years()), each range rendered into a complete
+PDF in a pool process (render_chunk()) and the pages of those PDFs joined
+into one document in the calling process (merge_pdfs()).
+
+merge_pdfs() only understands what ReportLab writes: a classic xref table,
+a flat page tree and ASCII85 streams. It copies objects as they are and
+only renumbers their references. Resources every chunk shares (fonts, the
+year grid form) are written once.
+
+Only modes in PDF_PARALLEL_MODES are split: in the default form mode every
+chunk draws the shared year grid again, which costs more than the pages
+themselves, so splitting makes those calendars slower. Calendars shorter
+than PDF_PARALLEL_MIN_YEARS pages and poster layouts always use the serial
+renderer. The PDF job worker and the async views
+split longer calendars over the process pools they already have; the sync
+views only when PDF_PARALLEL_PROCESSES is above 1.
+"""
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from math import ceil
+
+from django.conf import settings
+
+from .pdf_generator import DEFAULT_LAYOUT, DEFAULT_RENDER_MODE, render_life_calendar
+
+_XREF_ENTRY = re.compile(rb'(\d{10}) \d{5} ([nf])')
+_REFERENCE = re.compile(rb'(\d+) 0 R\b')
+_STREAM = re.compile(rb'>>\s*stream\r?\n')
+
+
+def split_years(first_year, last_year, chunks):
+    """Cut first..last (inclusive) into at most chunks contiguous ranges."""
+    size = ceil((last_year - first_year + 1) / chunks)
+    return [(start, min(start + size - 1, last_year)) for start in range(first_year, last_year + 1, size)]
+
+
+def plan_chunks(total_years, mode=DEFAULT_RENDER_MODE, layout=DEFAULT_LAYOUT, years=None, processes=None,
+                min_years=None):
+    """
+    Year ranges to render in parallel, or None to render serially.
+    """
+    processes = processes or settings.PDF_PARALLEL_PROCESSES
+    min_years = min_years or settings.PDF_PARALLEL_MIN_YEARS
+    first_year, last_year = years or (1, total_years)
+    if (mode not in settings.PDF_PARALLEL_MODES or layout != DEFAULT_LAYOUT or processes < 2
+            or last_year - first_year + 1 < min_years):
+        return None
+    return split_years(first_year, last_year, processes)
+
+
+def render_chunk(total_years, mode, years, highlight):
+    """Render a range of years into PDF bytes. Runs in a pool process."""
+    output = BytesIO()
+    render_life_calendar(total_years, output, mode, DEFAULT_LAYOUT, years, highlight)
+    return output.getvalue()
+
+
+class _Document:
+    """The objects of a ReportLab PDF, by object number."""
+
+    def __init__(self, data):
+        self.header = data[:data.index(b'\n') + 1]
+        startxref = int(data[data.rindex(b'startxref') + 9:].split()[0])
+        trailer_start = data.index(b'trailer', startxref)
+        offsets = {
+            number: int(offset)
+            for number, (offset, kind) in enumerate(_XREF_ENTRY.findall(data, startxref, trailer_start))
+            if kind == b'n'
+        }
+        ends = sorted(offsets.values()) + [startxref]
+        end_of = dict(zip(ends, ends[1:]))
+
+        self.objects = {}
+        for number, offset in offsets.items():
+            chunk = data[offset:end_of[offset]]
+            self.objects[number] = chunk[chunk.index(b'obj') + 3:chunk.rindex(b'endobj')].strip(b'\r\n')
+
+        trailer = data[trailer_start:]
+        self.root = int(re.search(rb'/Root (\d+) 0 R', trailer).group(1))
+        self.info = int(re.search(rb'/Info (\d+) 0 R', trailer).group(1))
+        self.pages = int(re.search(rb'/Pages (\d+) 0 R', self.objects[self.root]).group(1))
+        kids = re.search(rb'/Kids \[(.*?)\]', self.objects[self.pages], re.S).group(1)
+        self.page_numbers = [int(number) for number in _REFERENCE.findall(kids)]
+        if any(b'/Type /Pages' in self.objects[number] for number in self.page_numbers):
+            raise ValueError('Nested page trees are not supported')
+        # Objects rebuilt for the merged document rather than copied
+        self.structure = {self.root, self.pages, self.info, *self.page_numbers}
+
+    def references(self, number):
+        head = _STREAM.split(self.objects[number], 1)[0]
+        return [int(reference) for reference in _REFERENCE.findall(head)]
+
+
+def _shared(document, first, number, seen=frozenset()):
+    # The same object as in the first document: same number, same bytes and
+    # only shared references
+    if number in document.structure or document.objects[number] != first.objects.get(number):
+        return False
+    seen = seen | {number}
+    return all(
+        reference in seen or _shared(document, first, reference, seen)
+        for reference in document.references(number)
+    )
+
+
+def _renumber(body, numbers):
+    # Only the dictionary; stream data is ASCII85 and has no references
+    parts = _STREAM.split(body, 1)
+    head = _REFERENCE.sub(lambda match: b'%d 0 R' % numbers[int(match.group(1))], parts[0])
+    if len(parts) == 1:
+        return head
+    return head + _STREAM.search(body).group(0) + parts[1]
+
+
+def merge_pdfs(documents, output):
+    """
+    Write the pages of several ReportLab PDFs, in order, as one PDF.
+
+    Args:
+        documents: PDF bytes, e.g. from render_chunk()
+        output: Writable binary file-like object
+    """
+    documents = [_Document(data) for data in documents]
+    first = documents[0]
+
+    # 1 is the catalog, 2 the page tree and 3 the document info
+    bodies = [None, None, first.objects[first.info]]
+    pages_number = 2
+    copies = []
+    kids = []
+    for document in documents:
+        numbers = {document.pages: pages_number}
+        for number in document.objects:
+            if number in (document.root, document.pages, document.info):
+                continue
+            if document is not first and _shared(document, first, number):
+                numbers[number] = first.numbers[number]
+            else:
+                bodies.append(None)
+                numbers[number] = len(bodies)
+                copies.append((document, number))
+        document.numbers = numbers
+        kids.extend(numbers[number] for number in document.page_numbers)
+
+    for document, number in copies:
+        bodies[document.numbers[number] - 1] = _renumber(document.objects[number], document.numbers)
+    bodies[0] = b'<<\n/PageMode /UseNone /Pages %d 0 R /Type /Catalog\n>>' % pages_number
+    bodies[1] = b'<<\n/Count %d /Kids [ %s ] /Type /Pages\n>>' % (
+        len(kids), b' '.join(b'%d 0 R' % number for number in kids),
+    )
+
+    position = output.write(first.header + b'%\x93\x8c\x8b\x9e\n')
+    offsets = []
+    for number, body in enumerate(bodies, start=1):
+        offsets.append(position)
+        position += output.write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+    output.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(bodies) + 1))
+    output.write(b''.join(b'%010d 00000 n \n' % offset for offset in offsets))
+    output.write(
+        b'trailer\n<<\n/Info 3 0 R\n/Root 1 0 R\n/Size %d\n>>\nstartxref\n%d\n%%%%EOF\n'
+        % (len(bodies) + 1, position)
+    )
+
+
+def merge_into_cache(cache, key, documents):
+    """merge_pdfs() the chunks of a calendar into a PDFCache entry."""
+    output = BytesIO()
+    merge_pdfs(documents, output)
+    cache.store(key, output.getvalue())
+
+
+@lru_cache(maxsize=None)
+def get_parallel_executor():
+    """The process pool rendering chunks of long calendars."""
+    return ProcessPoolExecutor(max_workers=settings.PDF_PARALLEL_PROCESSES)
+
+
+def render_life_calendar_parallel(total_years, output, mode=DEFAULT_RENDER_MODE, layout=DEFAULT_LAYOUT,
+                                  years=None, highlight=None, executor=None, processes=None):
+    """
+    render_life_calendar() with the years split over a process pool; the
+    same pages, drawn on several cores. Falls back to the serial renderer
+    when plan_chunks() says so.
+
+    Args:
+        executor: Executor running render_chunk() (default:
+            get_parallel_executor())
+        processes: Number of chunks (default: PDF_PARALLEL_PROCESSES)
+    """
+    chunks = plan_chunks(total_years, mode, layout, years, processes)
+    if chunks is None:
+        render_life_calendar(total_years, output, mode, layout, years, highlight)
+        return
+    executor = executor or get_parallel_executor()
+    documents = executor.map(
+        render_chunk,
+        [total_years] * len(chunks), [mode] * len(chunks), chunks, [highlight] * len(chunks),
+    )
+    merge_pdfs(list(documents), output)
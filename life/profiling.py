@@ -0,0 +1,256 @@
+"""
+On-demand profiling of single requests.
+
+Add ?profile=cpu (cProfile) or ?profile=memory (tracemalloc) to any URL
+as a staff user, or together with a ?profile_token= from
+`python manage.py profile_token <path>`, and RequestProfilingMiddleware
+(life/middleware.py) runs that request under the profiler. With
+?profile_uncached=1 the results page cache and the PDF cache are skipped,
+so the page or PDF is rendered again rather than served from a cache.
+
+A streamed response (a PDF download) is read to the end while profiling, so
+the report covers copying the file out as well as rendering it. The report
+is written to PROFILES_DIR and listed in the admin as a RequestProfile; the
+response carries its admin URL in an X-Profile-Report header. The oldest
+reports are deleted once the directory grows past PROFILES_MAX_BYTES.
+
+One request is profiled at a time per process; others arriving meanwhile
+are served without profiling. Under ASGI, cProfile only sees the event loop
+thread, not sync views run in threads or renders in the process pool;
+tracemalloc sees every thread of the process.
+"""
+import cProfile
+import io
+import pstats
+import secrets
+import threading
+import tracemalloc
+from contextvars import ContextVar
+from pathlib import Path
+from time import perf_counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import RequestProfile
+
+TOKEN_SALT = 'life.profiling'
+
+# One profiled request at a time: tracemalloc is process-wide
+_lock = threading.Lock()
+
+_uncached = ContextVar('profile_uncached', default=False)
+
+
+def cache_bypassed():
+    """Whether the current request asked for ?profile_uncached=1."""
+    return _uncached.get()
+
+
+def make_token(path):
+    """Token allowing a request to path to be profiled, for PROFILE_TOKEN_MAX_AGE seconds."""
+    return signing.dumps(path, salt=TOKEN_SALT)
+
+
+def token_allows(request):
+    token = request.GET.get('profile_token')
+    if not token:
+        return False
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=settings.PROFILE_TOKEN_MAX_AGE) == request.path
+    except signing.BadSignature:
+        return False
+
+
+def requested_profile(request):
+    """The profiler a request asks for (a key of PROFILERS), or None."""
+    kind = request.GET.get('profile')
+    return kind if kind in PROFILERS else None
+
+
+class CPUProfile:
+    """cProfile of the calling thread."""
+
+    def start(self):
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+
+    def report(self, lines):
+        output = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=output)
+        for order in ('cumulative', 'tottime'):
+            output.write(f'Top {lines} by {order} time\n')
+            stats.sort_stats(order).print_stats(lines)
+        return output.getvalue()
+
+
+class MemoryProfile:
+    """tracemalloc of the whole process."""
+
+    def start(self):
+        self.was_tracing = tracemalloc.is_tracing()
+        if not self.was_tracing:
+            tracemalloc.start(settings.PROFILE_TRACEMALLOC_FRAMES)
+        tracemalloc.reset_peak()
+        self.before = tracemalloc.take_snapshot()
+
+    def stop(self):
+        self.after = tracemalloc.take_snapshot()
+        self.current, self.peak = tracemalloc.get_traced_memory()
+        if not self.was_tracing:
+            tracemalloc.stop()
+
+    def report(self, lines):
+        ignore = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+        differences = self.after.filter_traces(ignore).compare_to(self.before.filter_traces(ignore), 'traceback')
+        output = [
+            f'Peak traced memory: {self.peak:,} bytes',
+            f'Traced memory at the end: {self.current:,} bytes',
+            '',
+            f'Top {lines} allocations still live at the end, by size',
+            '',
+        ]
+        for difference in differences[:lines]:
+            output.append(f'{difference.size_diff:+,} bytes in {difference.count_diff:+,} blocks')
+            output.extend(f'    {line}' for line in difference.traceback.format())
+        return '\n'.join(output) + '\n'
+
+
+PROFILERS = {RequestProfile.CPU: CPUProfile, RequestProfile.MEMORY: MemoryProfile}
+
+
+def _read_streaming(response):
+    # Only consumed chunks are profiled, so read them all here
+    content = b''.join(response.streaming_content)
+    response.streaming_content = [content]
+
+
+async def _aread_streaming(response):
+    if response.is_async:
+        content = b''.join([chunk async for chunk in response.streaming_content])
+    else:
+        content = b''.join(response.streaming_content)
+
+    async def stream():
+        yield content
+
+    response.streaming_content = stream()
+
+
+def profile_request(request, get_response, kind, user=''):
+    """Call get_response(request) under a profiler and save the report."""
+    if not _lock.acquire(blocking=False):
+        return get_response(request)
+    try:
+        profiler = PROFILERS[kind]()
+        token = _uncached.set(request.GET.get('profile_uncached') == '1')
+        start = perf_counter()
+        profiler.start()
+        try:
+            response = get_response(request)
+            if response.streaming:
+                _read_streaming(response)
+        finally:
+            profiler.stop()
+            _uncached.reset(token)
+        duration = perf_counter() - start
+    finally:
+        _lock.release()
+    return _saved(request, response, kind, profiler, duration, user)
+
+
+async def aprofile_request(request, get_response, kind, user=''):
+    """profile_request() for an async get_response."""
+    if not _lock.acquire(blocking=False):
+        return await get_response(request)
+    try:
+        profiler = PROFILERS[kind]()
+        token = _uncached.set(request.GET.get('profile_uncached') == '1')
+        start = perf_counter()
+        profiler.start()
+        try:
+            response = await get_response(request)
+            if response.streaming:
+                await _aread_streaming(response)
+        finally:
+            profiler.stop()
+            _uncached.reset(token)
+        duration = perf_counter() - start
+    finally:
+        _lock.release()
+    return await sync_to_async(_saved)(request, response, kind, profiler, duration, user)
+
+
+def _saved(request, response, kind, profiler, duration, user):
+    profile = save_profile(request, kind, profiler.report(settings.PROFILE_REPORT_LINES), duration,
+                           response.status_code, user)
+    response['X-Profile-Report'] = reverse('admin:life_requestprofile_change', args=[profile.pk])
+    return response
+
+
+def save_profile(request, kind, report, duration, status_code, user=''):
+    """Write a report to PROFILES_DIR, record it and enforce PROFILES_MAX_BYTES."""
+    directory = Path(settings.PROFILES_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    now = timezone.now()
+    # Names sort in the order the reports were written
+    name = f'{now:%Y%m%d-%H%M%S-%f}-{kind}-{secrets.token_hex(4)}.txt'
+    # The token is not recorded
+    query = request.GET.copy()
+    query.pop('profile_token', None)
+    full_path = f'{request.path}?{query.urlencode()}'
+    header = (
+        f'{request.method} {full_path}\n'
+        f'{kind} profile, {now.isoformat()}, by {user or "token"}\n'
+        f'Status {status_code} in {duration * 1000:.1f} ms\n\n'
+    )
+    data = (header + report).encode()
+    (directory / name).write_bytes(data)
+
+    profile = RequestProfile.objects.create(
+        kind=kind,
+        method=request.method,
+        path=full_path[:RequestProfile._meta.get_field('path').max_length],
+        status_code=status_code,
+        duration_ms=round(duration * 1000, 3),
+        user=user,
+        report=name,
+        size=len(data),
+    )
+    evict_profiles()
+    return profile
+
+
+def delete_reports(names):
+    for name in names:
+        (Path(settings.PROFILES_DIR) / name).unlink(missing_ok=True)
+
+
+def evict_profiles():
+    """Delete the oldest reports (files and rows) until PROFILES_DIR fits PROFILES_MAX_BYTES."""
+    entries = []
+    total = 0
+    for path in Path(settings.PROFILES_DIR).glob('*.txt'):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((path.name, stat.st_size))
+        total += stat.st_size
+
+    evicted = []
+    # The newest report is kept even when it alone is too big
+    for name, size in sorted(entries)[:-1]:
+        if total <= settings.PROFILES_MAX_BYTES:
+            break
+        evicted.append(name)
+        total -= size
+    if evicted:
+        delete_reports(evicted)
+        RequestProfile.objects.filter(report__in=evicted).delete()
@@ -0,0 +1,177 @@
+"""
+HTTP delivery of cached files.
+
+serve_cached_file() streams a file from the PDF cache with Content-Length,
+a strong ETag (cache keys are content-addressed) and single byte-range
+support, or hands the file to a reverse proxy when PDF_SENDFILE_HEADER is
+configured. aserve_cached_file() is the same for async views, streaming the
+body with an async iterator.
+"""
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_range_re = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range Range header.
+
+    Returns:
+        (start, end) inclusive byte positions, None if the header should be
+        ignored (absent, malformed or multi-range), or False if the range
+        cannot be satisfied
+    """
+    if not header:
+        return None
+    match = _range_re.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        return False
+    end = int(last) if last else size - 1
+    return start, min(end, size - 1)
+
+
+def _file_size(file):
+    file.seek(0, 2)
+    size = file.tell()
+    file.seek(0)
+    return size
+
+
+def _iter_range(file, start, length):
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(STREAM_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def sendfile_response(path, filename, content_type):
+    """Let the reverse proxy serve a file from disk (X-Accel-Redirect / X-Sendfile)."""
+    header = settings.PDF_SENDFILE_HEADER
+    if header == 'X-Accel-Redirect':
+        relative = path.relative_to(settings.PDF_CACHE_DIR).as_posix()
+        location = settings.PDF_SENDFILE_URL_PREFIX.rstrip('/') + '/' + relative
+    else:
+        location = str(path)
+
+    response = HttpResponse(content_type=content_type)
+    response[header] = location
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+
+def _file_response(request, etag, cached_file, filename, content_type, iter_range=None):
+    """
+    Build the 200, 206 or 416 response for an open cached file.
+
+    iter_range(file, start, length) streams the body; by default the full
+    file goes through FileResponse (and wsgi.file_wrapper) and ranges
+    through _iter_range.
+    """
+    size = _file_size(cached_file)
+
+    # If-Range: only honour Range when the client has the current version
+    if_range = request.headers.get('If-Range')
+    byte_range = None
+    if if_range is None or if_range == etag:
+        byte_range = parse_range(request.headers.get('Range'), size)
+
+    if byte_range is False:
+        cached_file.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range is None and iter_range is None:
+        response = FileResponse(
+            cached_file, as_attachment=True, filename=filename, content_type=content_type
+        )
+    else:
+        start, end = byte_range or (0, size - 1)
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            (iter_range or _iter_range)(cached_file, start, length),
+            status=206 if byte_range else 200,
+            content_type=content_type,
+        )
+        response['Content-Length'] = str(length)
+        if byte_range:
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    return response
+
+
+def serve_cached_file(request, key, open_file, filename, content_type):
+    """
+    Serve a cached file with conditional GET and Range support.
+
+    Args:
+        request: The current request
+        key: Content-addressed cache key, used as the ETag
+        open_file: Callable returning the open binary file, or None if it
+            is gone (only called when the body is actually needed)
+        filename: Download filename
+        content_type: MIME type of the file
+    """
+    etag = f'"{key}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return response
+
+    cached_file = open_file()
+    if cached_file is None:
+        raise Http404("File is no longer cached")
+    return _file_response(request, etag, cached_file, filename, content_type)
+
+
+async def _aiter_range(file, start, length):
+    # Chunks come from the page cache or memory, so reading them inline is
+    # cheaper than a thread hop per chunk
+    for chunk in _iter_range(file, start, length):
+        yield chunk
+
+
+async def aserve_cached_file(request, key, aopen_file, filename, content_type):
+    """
+    Async serve_cached_file(): aopen_file is awaited and the body is
+    streamed with an async iterator, so ASGI servers stream it without a
+    thread per download.
+    """
+    etag = f'"{key}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return response
+
+    cached_file = await aopen_file()
+    if cached_file is None:
+        raise Http404("File is no longer cached")
+    return _file_response(request, etag, cached_file, filename, content_type, iter_range=_aiter_range)
@@ -0,0 +1,188 @@
+"""
+Retention: archiving old calculations to compressed files.
+
+archive_calculations() moves calculations created before a cutoff into
+append-only gzip JSON Lines files, one per UTC month of created_at, in the
+same format as export_calculations. Each batch of rows is written as one
+gzip member and fsynced, then deleted by primary key in a short transaction
+together with an ArchivedCalculation entry pointing at the member, so live
+traffic only ever waits for one small batch.
+
+The archive is written before the rows are deleted, so an interrupted run
+loses nothing and can simply be run again: a batch written but not deleted
+is written once more, leaving an unused copy of it in the file.
+
+get_calculation_or_404() restores an archived calculation on first visit by
+decompressing only its own member. The lifespan stats keep counting
+archived calculations.
+"""
+import gzip
+import io
+import json
+import logging
+import os
+import time
+import zlib
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404
+
+from .models import ArchivedCalculation, LifeCalculation
+from .transfer import FIELDS, _build, _write_jsonl
+
+logger = logging.getLogger(__name__)
+
+
+def archive_path(directory, month):
+    return Path(directory) / f'calculations-{month}.jsonl.gz'
+
+
+def _month(created_at):
+    return created_at.astimezone(dt_timezone.utc).strftime('%Y-%m')
+
+
+def _append_member(path, rows):
+    # One gzip member per batch; readers of the whole file see one stream
+    text = io.StringIO()
+    for _ in _write_jsonl(text, rows, header=False):
+        pass
+    data = gzip.compress(text.getvalue().encode())
+
+    with open(path, 'ab') as archive:
+        offset = archive.seek(0, os.SEEK_END)
+        archive.write(data)
+        archive.flush()
+        os.fsync(archive.fileno())
+    return offset
+
+
+def archive_calculations(cutoff, directory=None, batch_size=None, pause=0.0, progress=None):
+    """
+    Archive and delete every calculation created before cutoff.
+
+    Args:
+        cutoff: Aware datetime; older calculations are archived
+        directory: Archive directory (default: CALCULATION_ARCHIVE_DIR)
+        batch_size: Rows archived and deleted per transaction (default:
+            CALCULATION_ARCHIVE_BATCH_SIZE)
+        pause: Seconds to sleep between batches, to leave the database to
+            live traffic
+        progress: Called with (rows archived, rows per second) after every
+            batch
+
+    Returns:
+        Number of rows archived
+    """
+    directory = Path(directory or settings.CALCULATION_ARCHIVE_DIR)
+    batch_size = batch_size or settings.CALCULATION_ARCHIVE_BATCH_SIZE
+    directory.mkdir(parents=True, exist_ok=True)
+
+    rows = LifeCalculation.objects.filter(created_at__lt=cutoff).order_by('pk').values_list('pk', *FIELDS)
+    # Rows are (pk, *FIELDS)
+    unique_id_index = 1 + FIELDS.index('unique_id')
+    created_at_index = 1 + FIELDS.index('created_at')
+    start = time.perf_counter()
+    archived = 0
+    while True:
+        # Always the oldest remaining rows; deleted rows drop out, which is
+        # what makes a run resumable
+        batch = list(rows[:batch_size])
+        if not batch:
+            return archived
+
+        by_month = defaultdict(list)
+        for row in batch:
+            by_month[_month(row[created_at_index])].append(row)
+
+        entries = []
+        for month, month_rows in sorted(by_month.items()):
+            offset = _append_member(archive_path(directory, month), [row[1:] for row in month_rows])
+            entries.extend(
+                ArchivedCalculation(unique_id=row[unique_id_index], month=month, offset=offset) for row in month_rows
+            )
+
+        with transaction.atomic():
+            ArchivedCalculation.objects.bulk_create(entries, ignore_conflicts=True)
+            LifeCalculation.objects.filter(pk__in=[row[0] for row in batch]).delete()
+
+        archived += len(batch)
+        if progress:
+            progress(archived, archived / max(time.perf_counter() - start, 1e-9))
+        if pause:
+            time.sleep(pause)
+
+
+def _read_member(path, offset):
+    decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    data = []
+    with open(path, 'rb') as archive:
+        archive.seek(offset)
+        while not decompressor.eof:
+            chunk = archive.read(64 * 1024)
+            if not chunk:
+                break
+            data.append(decompressor.decompress(chunk))
+    return b''.join(data).decode()
+
+
+def restore_calculation(unique_id, directory=None):
+    """
+    Move an archived calculation back into the table.
+
+    Returns the restored LifeCalculation, or None if unique_id was never
+    archived. Restored rows are archived again by a later run while they
+    are older than the retention period.
+    """
+    entry = ArchivedCalculation.objects.filter(unique_id=unique_id).first()
+    if entry is None:
+        return None
+
+    path = archive_path(directory or settings.CALCULATION_ARCHIVE_DIR, entry.month)
+    try:
+        lines = _read_member(path, entry.offset).splitlines()
+    except OSError:
+        logger.exception("Could not read archive %s for calculation %s", path, unique_id)
+        return None
+    record = next((record for record in map(json.loads, lines) if record['unique_id'] == unique_id), None)
+    if record is None:
+        logger.error("Calculation %s is missing from archive %s", unique_id, path)
+        return None
+
+    converters = [(name, LifeCalculation._meta.get_field(name).to_python) for name in FIELDS]
+    calculation = _build(record, converters, 1)
+    created_at = calculation.created_at
+    with transaction.atomic():
+        # bulk_create() skips the post_save stats update (the stats never
+        # dropped this row) and tolerates a concurrent restore
+        LifeCalculation.objects.bulk_create([calculation], ignore_conflicts=True)
+        # auto_now_add stamped the current time; put the original back
+        LifeCalculation.objects.filter(unique_id=unique_id).update(created_at=created_at)
+        entry.delete()
+    return LifeCalculation.objects.get(unique_id=unique_id)
+
+
+def get_calculation_or_404(unique_id):
+    """Look up a calculation by share link, restoring it if archived."""
+    try:
+        return LifeCalculation.objects.get(unique_id=unique_id)
+    except LifeCalculation.DoesNotExist:
+        calculation = restore_calculation(unique_id)
+    if calculation is None:
+        raise Http404('No LifeCalculation matches the given query.')
+    return calculation
+
+
+async def aget_calculation_or_404(unique_id):
+    """Async get_calculation_or_404()."""
+    try:
+        return await LifeCalculation.objects.aget(unique_id=unique_id)
+    except LifeCalculation.DoesNotExist:
+        calculation = await sync_to_async(restore_calculation)(unique_id)
+    if calculation is None:
+        raise Http404('No LifeCalculation matches the given query.')
+    return calculation
@@ -0,0 +1,402 @@
+"""
+Data-driven scoring rules for the lifespan calculator.
+
+Rule tables live in life/rules/<version>.json and are compiled once into
+lookup structures:
+
+- Banded factors (exercise minutes, BMI) become a sorted list of band edges
+  searched with bisect.
+- Categorical factors (smoking, diet, alcohol, health) become a dict from
+  normalized value to an integer code.
+
+Every band and code maps to a precomputed weighted contribution
+(weight × score), so scoring a person is a few lookups and an add.
+
+Compiled tables are cached per version and recompiled when their file
+changes on disk, so rules can be edited without restarting workers.
+"""
+import bisect
+import json
+import logging
+import math
+import operator
+import re
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+RULES_DIR = Path(__file__).resolve().parent / 'rules'
+DEFAULT_RULES_VERSION = 'v1'
+
+# Seconds between modification-time checks of a cached rule file
+RELOAD_CHECK_INTERVAL = 2.0
+
+# Inputs computed from other inputs before scoring; work on scalars and arrays
+DERIVED_INPUTS = {
+    'bmi': lambda inputs: inputs['weight_kg'] / ((inputs['height_cm'] / 100) ** 2),
+}
+
+
+class RulesError(ValueError):
+    """Raised when a rule table is missing or malformed."""
+
+
+def normalize_category(value):
+    """Normalize a categorical input the same way for rule files and requests."""
+    return str(value).lower().strip()
+
+
+class BandedFactor:
+    """
+    A factor scored by which numeric band its input falls in.
+
+    Bands have an inclusive "min" and an optional inclusive "max". A band
+    without "max" extends up to the next band. Values outside every band
+    get the factor's default score.
+    """
+
+    def __init__(self, name, input_name, weight, default, bands):
+        self.name = name
+        self.input = input_name
+        self.weight = weight
+
+        bands = sorted(bands, key=lambda band: band.get('min', -math.inf))
+        self.edges = []
+        self.scores = [default]
+        previous_end = -math.inf
+        for index, band in enumerate(bands):
+            start = band.get('min', -math.inf)
+            if 'max' in band:
+                end = math.nextafter(band['max'], math.inf)
+            elif index + 1 < len(bands):
+                end = bands[index + 1].get('min', -math.inf)
+            else:
+                end = math.inf
+            if start < previous_end or end <= start:
+                raise RulesError(f"Factor '{name}' has overlapping or empty bands")
+
+            if self.edges and self.edges[-1] == start:
+                self.scores[-1] = band['score']
+            else:
+                self.edges.append(start)
+                self.scores.append(band['score'])
+            if end != math.inf:
+                self.edges.append(end)
+                self.scores.append(default)
+            previous_end = end
+
+        self.contributions = [weight * score for score in self.scores]
+        self._edge_array = np.array(self.edges, dtype=np.float64)
+        self._contribution_array = np.array(self.contributions, dtype=np.float64)
+
+        # Codes are band indexes; the ones of declared bands can be chosen
+        # as what-if targets, the default gaps between them cannot
+        self.labels = [self._label(code) for code in range(len(self.scores))]
+        self.targets = [
+            code for code in range(len(self.scores))
+            if any(self.code(band.get('min', -math.inf)) == code for band in bands)
+        ]
+
+    def _label(self, code):
+        if code == 0:
+            return f'< {self.edges[0]:g}' if self.edges else 'any'
+        if code == len(self.edges):
+            return f'{self.edges[-1]:g}+'
+        return f'{self.edges[code - 1]:g}–{self.edges[code]:g}'
+
+    def code(self, value):
+        return bisect.bisect_right(self.edges, value)
+
+    def score(self, value):
+        return self.scores[bisect.bisect_right(self.edges, value)]
+
+    def contribution(self, value):
+        return self.contributions[bisect.bisect_right(self.edges, value)]
+
+    def lookup(self, get_input):
+        """Return a function mapping an inputs dict to this factor's contribution."""
+        edges, contributions = self.edges, self.contributions
+        return lambda inputs: contributions[bisect.bisect_right(edges, get_input(inputs))]
+
+    def contribution_array(self, values):
+        indexes = np.searchsorted(self._edge_array, values, side='right')
+        return self._contribution_array[indexes]
+
+
+class CategoricalFactor:
+    """
+    A factor scored by a categorical input.
+
+    Each category lists the values that belong to it; values are matched
+    after normalize_category(). Unlisted values get the default score.
+    """
+
+    def __init__(self, name, input_name, weight, default, categories):
+        self.name = name
+        self.input = input_name
+        self.weight = weight
+
+        self.codes = {}
+        self.scores = [default]
+        self.labels = ['other']
+        for code, category in enumerate(categories, start=1):
+            self.scores.append(category['score'])
+            self.labels.append(category.get('label', category['values'][0]))
+            for value in category['values']:
+                self.codes[normalize_category(value)] = code
+        # Unlisted values (code 0) cannot be chosen as what-if targets
+        self.targets = list(range(1, len(self.scores)))
+
+        self.contributions = [weight * score for score in self.scores]
+        self._contribution_array = np.array(self.contributions, dtype=np.float64)
+        self._bool_codes = (self.codes.get('false', 0), self.codes.get('true', 0))
+
+    def code(self, value):
+        if value.__class__ is bool:
+            return self._bool_codes[value]
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes.get(normalize_category(value), 0)
+        return code
+
+    def score(self, value):
+        return self.scores[self.code(value)]
+
+    def contribution(self, value):
+        return self.contributions[self.code(value)]
+
+    def lookup(self, get_input):
+        """Return a function mapping an inputs dict to this factor's contribution."""
+        codes, contributions, code = self.codes, self.contributions, self.code
+
+        def contribution(inputs):
+            value = get_input(inputs)
+            value_code = codes.get(value)
+            return contributions[code(value) if value_code is None else value_code]
+        return contribution
+
+    def code_array(self, values):
+        """
+        Map a column of values to integer codes.
+
+        Values already in normalized form are matched with vectorized
+        comparisons; anything else is normalized once per distinct value.
+        """
+        values = np.asarray(values)
+        if values.ndim == 0:
+            return np.asarray(self.code(values.item()))
+        if values.dtype == np.bool_:
+            return np.where(values, self.code(True), self.code(False))
+
+        codes = np.zeros(values.shape, dtype=np.intp)
+        unmatched = np.ones(values.shape, dtype=bool)
+        if values.dtype.kind in 'OUS':
+            for value, code in self.codes.items():
+                mask = values == value
+                codes[mask] = code
+                unmatched &= ~mask
+
+        if unmatched.any():
+            seen = {}
+            residual = []
+            for value in values[unmatched].tolist():
+                key = normalize_category(value)
+                if key not in seen:
+                    seen[key] = self.codes.get(key, 0)
+                residual.append(seen[key])
+            codes[unmatched] = residual
+        return codes
+
+    def contribution_array(self, values):
+        return self._contribution_array[self.code_array(values)]
+
+
+def compile_factor(definition):
+    """Compile one factor definition from a rule file."""
+    try:
+        arguments = (
+            definition['name'],
+            definition['input'],
+            definition['weight'],
+            definition.get('default', 0),
+        )
+        if 'bands' in definition:
+            return BandedFactor(*arguments, definition['bands'])
+        if 'categories' in definition:
+            return CategoricalFactor(*arguments, definition['categories'])
+    except (KeyError, TypeError) as e:
+        raise RulesError(f"Malformed factor definition: {e}") from e
+    raise RulesError(f"Factor '{definition.get('name')}' needs 'bands' or 'categories'")
+
+
+class RuleTable:
+    """
+    A compiled rule table.
+
+    Estimated Age = Base Age + Σ(precomputed weighted contribution per factor),
+    clamped to the table's minimum age.
+    """
+
+    def __init__(self, data):
+        try:
+            self.version = data['version']
+            self.base_age = data.get('base_age', 75)
+            self.minimum_age = data.get('minimum_age', 50)
+            factors = data['factors']
+            uncertainty = data.get('uncertainty', {})
+            self.baseline_sd = uncertainty.get('baseline_sd', 0.0)
+            self.effect_cv = uncertainty.get('effect_cv', 0.0)
+        except (KeyError, TypeError, AttributeError) as e:
+            raise RulesError(f"Malformed rule table: {e}") from e
+
+        self.factors = [compile_factor(definition) for definition in factors]
+        self._by_name = {factor.name: factor for factor in self.factors}
+        # (input getter, factor) pairs and per-factor lookups, resolved once
+        self._steps = [
+            (DERIVED_INPUTS.get(factor.input) or operator.itemgetter(factor.input), factor)
+            for factor in self.factors
+        ]
+        self._lookups = [factor.lookup(get_input) for get_input, factor in self._steps]
+
+        # Sum of contributions for every combination of factor codes, one
+        # axis per factor: the whole state space is a few thousand cells
+        self.grid = np.zeros(())
+        for factor in self.factors:
+            self.grid = np.add.outer(self.grid, factor._contribution_array)
+
+    def factor(self, name):
+        return self._by_name[name]
+
+    def estimate(self, inputs, base_age=None):
+        """
+        Estimate the lifespan of one person.
+
+        Args:
+            inputs: Mapping of input name to value (see calculate_lifespan())
+            base_age: Overrides the table's base age
+
+        Returns:
+            Estimated lifespan in years
+        """
+        estimated_age = self.base_age if base_age is None else base_age
+        for lookup in self._lookups:
+            estimated_age = estimated_age + lookup(inputs)
+        return max(estimated_age, self.minimum_age)
+
+    def codes(self, inputs):
+        """Code of every factor for one person's inputs, in factor order."""
+        return tuple(factor.code(get_input(inputs)) for get_input, factor in self._steps)
+
+    def estimate_codes(self, codes, base_age=None):
+        """estimate() for factor codes, by looking the sum up in the grid."""
+        estimated_age = (self.base_age if base_age is None else base_age) + self.grid[tuple(codes)]
+        return max(float(estimated_age), self.minimum_age)
+
+    def estimate_spread(self, inputs, base_age=None):
+        """
+        Mean and standard deviation of one person's lifespan, before the
+        minimum age is applied.
+
+        Each factor's effect is uncertain by effect_cv of its contribution
+        and individual lifespans vary by baseline_sd years around the
+        expectation. The effects are independent normals, so their sum is
+        normal with the variances added up.
+
+        Returns:
+            (mean, standard deviation) in years
+        """
+        mean = self.base_age if base_age is None else base_age
+        variance = self.baseline_sd ** 2
+        for lookup in self._lookups:
+            contribution = lookup(inputs)
+            mean += contribution
+            variance += (self.effect_cv * contribution) ** 2
+        return mean, math.sqrt(variance)
+
+    def estimate_batch(self, columns, base_age=None):
+        """
+        Estimate lifespans for columns of inputs with NumPy.
+
+        Args:
+            columns: Mapping of input name to array-like column
+            base_age: Overrides the table's base age; scalar or array
+
+        Returns:
+            NumPy float64 array of estimated lifespans in years
+        """
+        estimated_age = np.asarray(self.base_age if base_age is None else base_age, dtype=np.float64)
+        for get_input, factor in self._steps:
+            estimated_age = estimated_age + factor.contribution_array(get_input(columns))
+        return np.maximum(estimated_age, self.minimum_age)
+
+
+def rules_path(version):
+    if not re.fullmatch(r'[\w.-]+', version):
+        raise RulesError(f"Invalid rules version: {version!r}")
+    return RULES_DIR / f'{version}.json'
+
+
+def load_rules(path):
+    """Read and compile a rule file."""
+    try:
+        with open(path, encoding='utf-8') as rules_file:
+            data = json.load(rules_file)
+    except (OSError, ValueError) as e:
+        raise RulesError(f"Cannot load rules from {path}: {e}") from e
+    return RuleTable(data)
+
+
+def available_versions():
+    """Names of the rule versions shipped in RULES_DIR."""
+    return sorted(path.stem for path in RULES_DIR.glob('*.json'))
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def get_rules(version=None):
+    """
+    Return the compiled rule table for a version (default DEFAULT_RULES_VERSION).
+
+    The rule file's modification time is checked at most every
+    RELOAD_CHECK_INTERVAL seconds and the table is recompiled when it changes.
+    If a changed file fails to compile, the previous table keeps being served.
+    """
+    version = version or DEFAULT_RULES_VERSION
+    entry = _cache.get(version)
+    if entry is not None and time.monotonic() - entry['checked_at'] < RELOAD_CHECK_INTERVAL:
+        return entry['table']
+
+    with _cache_lock:
+        entry = _cache.get(version)
+        path = rules_path(version)
+        try:
+            mtime = path.stat().st_mtime_ns
+        except OSError as e:
+            if entry is None:
+                raise RulesError(f"Unknown rules version: {version!r}") from e
+            mtime = entry['mtime']
+
+        if entry is None or mtime != entry['mtime']:
+            try:
+                table = load_rules(path)
+            except RulesError:
+                if entry is None:
+                    raise
+                logger.exception("Keeping previous rules for version %s", version)
+                table = entry['table']
+            entry = {'table': table, 'mtime': mtime}
+            _cache[version] = entry
+        entry['checked_at'] = time.monotonic()
+        return entry['table']
+
+
+def clear_rules_cache():
+    """Drop all compiled tables so the next get_rules() reloads from disk."""
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,180 @@
+"""
+Incrementally maintained statistics of estimated lifespans.
+
+Every saved calculation adds its estimate to one LifespanStat row per
+dimension (all calculations, gender, smoking status, diet quality and UTC
+creation day) in its histogram bucket. Each row holds a count, a sum and a
+sum of squares, which is enough for counts, means, standard deviations and
+histograms. Reading the stats touches a bounded number of rows however many
+calculations there are.
+
+Single saves are recorded by a post_save handler; code saving with
+bulk_create() calls record_calculations() itself. Deleting calculations
+does not update the stats, so run rebuild_stats() (the
+rebuild_lifespan_stats command) after bulk deletes or to backfill.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import CharField, Count, F, FloatField, Q, Sum, Value
+from django.db.models.functions import Cast, Floor, TruncDate
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import LifeCalculation, LifespanStat
+
+# Width of the histogram buckets in years
+BUCKET_YEARS = 1.0
+
+# Dimensions grouped by a LifeCalculation field; 'all' and 'day' are added
+FIELD_DIMENSIONS = ('gender', 'smoking_status', 'diet_quality')
+
+DIMENSIONS = ('all',) + FIELD_DIMENSIONS + ('day',)
+
+
+def bucket_for(years):
+    return math.floor(years / BUCKET_YEARS)
+
+
+def _groups(calculation):
+    yield 'all', ''
+    for dimension in FIELD_DIMENSIONS:
+        yield dimension, getattr(calculation, dimension)
+    yield 'day', calculation.created_at.astimezone(dt_timezone.utc).date().isoformat()
+
+
+def stat_key(dimension, value, bucket):
+    return f'{dimension}:{value}:{bucket}'
+
+
+def _add(deltas):
+    # Keys with the same delta (all keys of a single calculation) share one
+    # UPDATE; only keys seen for the first time need an INSERT
+    keys_by_delta = defaultdict(list)
+    for key, delta in deltas.items():
+        keys_by_delta[tuple(delta)].append(key)
+
+    for (count, total, squares), keys in keys_by_delta.items():
+        totals = {
+            'count': F('count') + count,
+            'total_years': F('total_years') + total,
+            'total_squared_years': F('total_squared_years') + squares,
+        }
+        rows = LifespanStat.objects.filter(key__in=[stat_key(*key) for key in keys])
+        if rows.update(**totals) == len(keys):
+            continue
+
+        # Rows that did exist were updated above; create the others
+        existing = set(rows.values_list('key', flat=True))
+        for dimension, value, bucket in keys:
+            key = stat_key(dimension, value, bucket)
+            if key in existing:
+                continue
+            try:
+                with transaction.atomic():
+                    LifespanStat.objects.create(
+                        key=key, dimension=dimension, value=value, bucket=bucket,
+                        count=count, total_years=total, total_squared_years=squares,
+                    )
+            except IntegrityError:
+                # Created by a concurrent writer in the meantime
+                LifespanStat.objects.filter(key=key).update(**totals)
+
+
+def record_calculations(calculations):
+    """Add saved calculations to the stats."""
+    deltas = defaultdict(lambda: [0, 0.0, 0.0])
+    for calculation in calculations:
+        years = calculation.estimated_lifespan_years
+        bucket = bucket_for(years)
+        for dimension, value in _groups(calculation):
+            delta = deltas[dimension, value, bucket]
+            delta[0] += 1
+            delta[1] += years
+            delta[2] += years * years
+
+    # Part of the caller's transaction when there is one
+    with transaction.atomic(savepoint=False):
+        _add(deltas)
+
+
+@receiver(post_save, sender=LifeCalculation, dispatch_uid='life.stats.record_saved_calculation')
+def record_saved_calculation(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        record_calculations([instance])
+
+
+def rebuild_stats():
+    """
+    Recompute every LifespanStat row from the calculations table with one
+    GROUP BY query per dimension. Returns the number of rows written.
+    """
+    years = F('estimated_lifespan_years')
+    group_values = {
+        'all': Value(''),
+        'day': Cast(TruncDate('created_at', tzinfo=dt_timezone.utc), output_field=CharField()),
+        **{dimension: F(dimension) for dimension in FIELD_DIMENSIONS},
+    }
+
+    stats = []
+    for dimension in DIMENSIONS:
+        groups = (
+            LifeCalculation.objects.order_by()
+            .values(group=group_values[dimension], bucket=Floor(years / BUCKET_YEARS))
+            .annotate(
+                count=Count('pk'),
+                total=Sum(years),
+                squares=Sum(years * years, output_field=FloatField()),
+            )
+        )
+        for group in groups.iterator():
+            value, bucket = str(group['group']), int(group['bucket'])
+            stats.append(LifespanStat(
+                key=stat_key(dimension, value, bucket), dimension=dimension, value=value, bucket=bucket,
+                count=group['count'], total_years=group['total'], total_squared_years=group['squares'],
+            ))
+
+    with transaction.atomic():
+        LifespanStat.objects.all().delete()
+        LifespanStat.objects.bulk_create(stats, batch_size=1000)
+    return len(stats)
+
+
+def _summary(rows):
+    count = sum(row.count for row in rows)
+    total = sum(row.total_years for row in rows)
+    squares = sum(row.total_squared_years for row in rows)
+    mean = total / count if count else None
+    variance = max(0.0, squares / count - mean * mean) if count else None
+    return {
+        'count': count,
+        'mean_years': mean,
+        'std_years': math.sqrt(variance) if count else None,
+        'histogram': [
+            {'min_years': row.bucket * BUCKET_YEARS, 'max_years': (row.bucket + 1) * BUCKET_YEARS, 'count': row.count}
+            for row in sorted(rows, key=lambda row: row.bucket)
+        ],
+    }
+
+
+def get_stats(today, days=30):
+    """
+    Summaries per dimension value, with daily summaries for the days
+    before and including today (UTC).
+    """
+    since = (today - timedelta(days=days - 1)).isoformat()
+    rows = LifespanStat.objects.filter(
+        Q(dimension__in=('all',) + FIELD_DIMENSIONS)
+        | Q(dimension='day', value__gte=since, value__lte=today.isoformat())
+    )
+
+    grouped = defaultdict(lambda: defaultdict(list))
+    for row in rows:
+        grouped[row.dimension][row.value].append(row)
+
+    stats = {'all': _summary(grouped['all']['']), 'days': days}
+    for dimension in FIELD_DIMENSIONS + ('day',):
+        stats[dimension] = {value: _summary(value_rows) for value, value_rows in sorted(grouped[dimension].items())}
+    return stats
@@ -1,3 +1,1485 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import re
+import secrets
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import BytesIO, StringIO
+import tempfile
+import zlib
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError
+from django.db.models import Sum
+from django.http import Http404
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    async_views, bulk, life_grid, life_tables, metrics, page_cache, pdf_cache, pdf_generator, pdf_jobs,
+    pdf_parallel, profiling, retention, scoring_rules, stats, uncertainty, what_if, write_buffer,
+)
+from .responses import parse_range
+from .benchmarks import compare_results, generate_profiles, seed_calculations
+from .lifespan_calculator import calculate_lifespan, calculate_lifespan_bands, calculate_lifespan_batch
+from .models import ArchivedCalculation, LifeCalculation, LifespanStat, PDFJob, RequestProfile
+from .pdf_generator import RENDER_MODES, render_life_calendar
+
+
+def legacy_calculate_lifespan(exercise_minutes_per_week=0, smoking_status='none', weight_kg=70,
+                              height_cm=170, diet_quality='moderate', alcohol_consumption='none',
+                              has_health_issues=False, base_age=75):
+    """The hard-coded formula the v1 rule table replaced."""
+    exercise = 5 if exercise_minutes_per_week >= 150 else 3 if exercise_minutes_per_week >= 75 else 0
+    smoking = {'daily': -10, 'occasional': -5}.get(smoking_status, 0)
+    bmi = weight_kg / ((height_cm / 100) ** 2)
+    bmi_score = 2 if 18.5 <= bmi <= 24.9 else 0 if 25 <= bmi <= 29.9 else -2
+    diet = {'healthy': 2, 'moderate': 0}.get(diet_quality, -2)
+    alcohol = -3 if alcohol_consumption == 'heavy' else 0
+    health = -5 if has_health_issues else 3
+    estimated_age = (base_age + 0.2 * exercise + 0.25 * smoking + 0.15 * bmi_score
+                     + 0.15 * diet + 0.1 * alcohol + 0.15 * health)
+    return max(estimated_age, 50)
+
+
+class CalculateLifespanBatchTests(SimpleTestCase):
+    def assert_parity(self, profiles, base_age=75):
+        batch = calculate_lifespan_batch(profiles, base_age=base_age)
+        records = [dict(zip(profiles, values)) for values in zip(*profiles.values())]
+        scalar = [calculate_lifespan(base_age=base_age, **record) for record in records]
+        self.assertEqual(batch.tolist(), scalar)
+
+    def test_random_profiles_match_scalar(self):
+        self.assert_parity(generate_profiles(5000, seed=42))
+
+    def test_band_edges_match_scalar(self):
+        # Exercise and BMI boundaries, including the 24.9/25 and 29.9/30 gaps
+        self.assert_parity({
+            'exercise_minutes_per_week': np.array([0, 74, 75, 149, 150, 151, 0, 0, 0, 0]),
+            'weight_kg': np.array([53.5, 53.4, 72.0, 71.9, 72.3, 86.6, 86.4, 86.7, 40.0, 150.0]),
+            'height_cm': np.full(10, 170.0),
+        })
+
+    def test_string_normalization_matches_scalar(self):
+        self.assert_parity({
+            'smoking_status': np.array([' Daily', 'SOMETIMES', 'روزانه', 'none', ''], dtype=object),
+            'diet_quality': np.array(['Healthy ', 'سالم', 'moderate', 'junk', 'UNHEALTHY'], dtype=object),
+            'alcohol_consumption': np.array(['High', 'زیاد', 'light', 'none', 'heavy'], dtype=object),
+            'has_health_issues': np.array(['yes', 'No', 'maybe', 'بله', 'multiple'], dtype=object),
+        })
+
+    def test_structured_array_input(self):
+        profiles = np.array(
+            [(200, 'daily', 80.0, 180.0), (10, 'none', 60.0, 165.0)],
+            dtype=[('exercise_minutes_per_week', 'i4'), ('smoking_status', 'U10'),
+                   ('weight_kg', 'f8'), ('height_cm', 'f8')],
+        )
+        expected = [
+            calculate_lifespan(exercise_minutes_per_week=200, smoking_status='daily', weight_kg=80.0, height_cm=180.0),
+            calculate_lifespan(exercise_minutes_per_week=10, smoking_status='none', weight_kg=60.0, height_cm=165.0),
+        ]
+        self.assertEqual(calculate_lifespan_batch(profiles).tolist(), expected)
+
+    def test_array_base_age_and_minimum(self):
+        profiles = {'smoking_status': np.array(['daily', 'none'], dtype=object)}
+        result = calculate_lifespan_batch(profiles, base_age=np.array([40.0, 80.0]))
+        self.assertEqual(result.tolist(), [50.0, calculate_lifespan(base_age=80.0)])
+
+
+class LifespanBandsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_percentiles_follow_the_spread(self):
+        inputs = {
+            'exercise_minutes_per_week': 200, 'smoking_status': 'daily', 'weight_kg': 90, 'height_cm': 175,
+            'diet_quality': 'healthy', 'alcohol_consumption': 'none', 'has_health_issues': True,
+        }
+        bands = calculate_lifespan_bands(seed=1, **inputs)
+        mean, sd = scoring_rules.get_rules().estimate_spread(inputs)
+
+        self.assertAlmostEqual(mean, calculate_lifespan(**inputs))
+        self.assertAlmostEqual(bands['p50'], mean, delta=0.2)
+        self.assertAlmostEqual(bands['p10'], mean - 1.2816 * sd, delta=0.2)
+        self.assertAlmostEqual(bands['p90'], mean + 1.2816 * sd, delta=0.2)
+
+        fractions = [fraction for _, fraction in bands['survival']]
+        self.assertEqual(fractions, sorted(fractions, reverse=True))
+        self.assertEqual(fractions[0], 1.0)
+        self.assertEqual(fractions[-1], 0.0)
+        self.assertEqual(calculate_lifespan_bands(seed=1, **inputs), bands)
+
+    def test_results_show_range_cached_per_fingerprint(self):
+        form_data = {
+            'date_of_birth': '1990-05-17', 'gender': 'female', 'exercise_minutes_per_week': '120',
+            'smoking_status': 'none', 'weight_kg': '64', 'height_cm': '168',
+            'diet_quality': 'healthy', 'alcohol_consumption': 'light',
+        }
+        with override_settings(REUSE_IDENTICAL_CALCULATIONS=False):
+            self.client.post(reverse('life:index'), form_data)
+            self.client.post(reverse('life:index'), form_data)
+        first, second = LifeCalculation.objects.order_by('pk')
+        self.assertEqual(first.fingerprint, second.fingerprint)
+
+        with mock.patch('life.uncertainty.lifespan_bands', wraps=uncertainty.lifespan_bands) as sample:
+            response = self.client.get(reverse('life:results', args=[first.unique_id]))
+            self.client.get(reverse('life:results', args=[second.unique_id]))
+        self.assertEqual(sample.call_count, 1)
+        self.assertContains(response, 'Likely between')
+        self.assertEqual(uncertainty.get_lifespan_bands(second), response.context['bands'])
+
+
+class WhatIfTests(TestCase):
+    inputs = {
+        'exercise_minutes_per_week': 30, 'smoking_status': 'daily', 'weight_kg': 98, 'height_cm': 175,
+        'diet_quality': 'moderate', 'alcohol_consumption': 'none', 'has_health_issues': False,
+    }
+
+    def test_grid_matches_scoring(self):
+        rules = scoring_rules.get_rules()
+        profiles = generate_profiles(2000, seed=3)
+        for record in (dict(zip(profiles, values)) for values in zip(*profiles.values())):
+            self.assertAlmostEqual(rules.estimate_codes(rules.codes(record)), calculate_lifespan(**record))
+
+    def test_ranked_improvements(self):
+        result = what_if.improvements(scoring_rules.get_rules(), self.inputs)
+        current = calculate_lifespan(**self.inputs)
+        self.assertAlmostEqual(result['estimated_lifespan_years'], current)
+
+        best = result['single'][0]
+        self.assertEqual(best['changes'], [{'factor': 'smoking', 'from': 'daily', 'to': 'none'}])
+        self.assertAlmostEqual(best['years_gained'], calculate_lifespan(**dict(self.inputs, smoking_status='none')) - current)
+        gains = [improvement['years_gained'] for improvement in result['single']]
+        self.assertEqual(gains, sorted(gains, reverse=True))
+
+        best_pair = result['combined'][0]
+        self.assertEqual([change['factor'] for change in best_pair['changes']], ['exercise', 'smoking'])
+        self.assertAlmostEqual(
+            best_pair['years_gained'],
+            calculate_lifespan(**dict(self.inputs, smoking_status='none', exercise_minutes_per_week=150)) - current,
+        )
+        self.assertTrue(all(len(improvement['changes']) == 2 for improvement in result['combined']))
+
+    def test_endpoint_and_results_section(self):
+        calculation = LifeCalculation.objects.create(
+            date_of_birth=date(1980, 3, 1), estimated_lifespan_years=calculate_lifespan(**self.inputs),
+            unique_id='what-if', **self.inputs,
+        )
+        data = self.client.get(reverse('life:what_if', args=[calculation.unique_id])).json()
+        self.assertEqual(data['single'][0]['changes'][0]['to'], 'none')
+
+        cache.clear()
+        self.assertContains(self.client.get(reverse('life:results', args=[calculation.unique_id])), 'Smoking: daily → none')
+
+
+class LifeTablesTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        life_tables.get_life_tables.cache_clear()
+        self.addCleanup(life_tables.get_life_tables.cache_clear)
+
+    def test_lookup_interpolates_clamps_and_falls_back(self):
+        path = self.directory / 'tables.bin'
+        life_tables.write_life_tables(path, {
+            ('WLD', 'M'): [70.0, 69.5, 68.5],
+            ('WLD', 'T'): [72.0, 71.0, 70.0],
+        })
+        tables = life_tables.LifeTables(path)
+        self.assertAlmostEqual(tables.remaining_years('wld', 'M', 1.5), 69.0)
+        self.assertAlmostEqual(tables.remaining_years('WLD', 'M', 40), 68.5)
+        self.assertAlmostEqual(tables.remaining_years('WLD', 'F', 0), 72.0)
+        with self.assertRaises(KeyError):
+            tables.remaining_years('FRA', 'M', 0)
+
+        rows = [tables.row('WLD', 'M'), tables.row('WLD', 'F')]
+        np.testing.assert_allclose(tables.remaining_years_batch(rows, [1.5, 2.0]), [69.0, 70.0])
+        np.testing.assert_allclose(tables.remaining_years_batch(rows[:1], [1.5]), [69.0])
+        single = tables.remaining_years_batch(rows[0], 1.5)
+        self.assertEqual(single.shape, (1,))
+        np.testing.assert_allclose(single, [69.0])
+
+    def test_single_age_tables_are_rejected(self):
+        path = self.directory / 'tables.bin'
+        with self.assertRaises(ValueError):
+            life_tables.write_life_tables(path, {('WLD', 'T'): [72.0]})
+
+        # A file written by something else
+        path.write_bytes(life_tables.HEADER.pack(life_tables.MAGIC, 1, 1) + b'WLDT' + np.array([72.0], '<f4').tobytes())
+        with self.assertRaises(ValueError):
+            life_tables.LifeTables(path)
+
+    def test_build_command_and_age_aware_base_age(self):
+        source = self.directory / 'tables.csv'
+        lines = ['country,sex,age,remaining_years']
+        lines += [f'WLD,female,{age},{80 - 0.75 * age}' for age in range(101)]
+        lines += [f'WLD,M,{age},{75 - 0.75 * age}' for age in range(101)]
+        source.write_text('\n'.join(lines))
+        path = self.directory / 'tables.bin'
+        call_command('build_life_tables', str(source), str(path), stdout=StringIO())
+
+        gaps = self.directory / 'gaps.csv'
+        gaps.write_text('country,sex,age,remaining_years\nWLD,M,0,75\nWLD,M,2,74\n')
+        with self.assertRaises(CommandError):
+            call_command('build_life_tables', str(gaps), str(path), stdout=StringIO())
+
+        form_data = {
+            'date_of_birth': '1990-05-17', 'gender': 'female', 'exercise_minutes_per_week': '120',
+            'smoking_status': 'none', 'weight_kg': '64', 'height_cm': '168',
+            'diet_quality': 'healthy', 'alcohol_consumption': 'light',
+        }
+        # Still May 17 in Los Angeles, already May 18 in UTC
+        now = datetime(2024, 5, 18, 2, 0, tzinfo=dt_timezone.utc)
+        with override_settings(LIFE_TABLES_PATH=str(path), TIME_ZONE='America/Los_Angeles'), \
+                mock.patch('django.utils.timezone.now', return_value=now), \
+                mock.patch('life.life_tables.age_in_years', wraps=life_tables.age_in_years) as age_in_years:
+            self.client.post(reverse('life:index'), form_data)
+        self.assertEqual(age_in_years.call_args.args, (date(1990, 5, 17), date(2024, 5, 18)))
+        calculation = LifeCalculation.objects.get()
+        age = life_tables.age_in_years(date(1990, 5, 17), date(2024, 5, 18))
+        self.assertAlmostEqual(calculation.base_age, round(age + 80 - 0.75 * age, 2))
+        self.assertNotEqual(calculation.base_age, scoring_rules.get_rules().base_age)
+
+
+class LifeGridTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_spans_cover_cells_once(self):
+        for start, stop in ((0, 0), (0, 52), (0, 1900), (1900, 4680), (10, 30), (50, 110)):
+            covered = set()
+            for column, row, width, height in life_grid._spans(start, stop, 52):
+                cells = {(row + r) * 52 + column + c for r in range(height) for c in range(width)}
+                self.assertFalse(covered & cells)
+                covered |= cells
+            self.assertEqual(covered, set(range(start, stop)))
+
+    def test_png_matches_grid(self):
+        png = life_grid.render_life_grid_png(60, 53)
+        self.assertEqual(png[:8], b'\x89PNG\r\n\x1a\n')
+        width, height = np.frombuffer(png[16:24], dtype='>u4')
+        self.assertEqual((width, height), (518, 18))
+
+        pixels = np.frombuffer(zlib.decompress(png[41:-16]), dtype=np.uint8).reshape(height, width * 4 + 1)
+        pixel = lambda x, y: tuple(pixels[y, 1 + 4 * x:5 + 4 * x])
+        self.assertEqual(pixel(0, 10), life_grid.LIVED_COLOR)
+        self.assertEqual(pixel(10, 10), life_grid.REMAINING_COLOR)
+        self.assertEqual(pixel(80, 10), life_grid.BACKGROUND_COLOR)
+        self.assertEqual(pixel(8, 0), life_grid.BACKGROUND_COLOR)
+
+    def test_results_embed_grid_cached_per_size(self):
+        calculations = [
+            LifeCalculation.objects.create(
+                date_of_birth=date(1990, 1, 1), estimated_lifespan_years=80.0, unique_id=f'grid-{index}',
+                **WhatIfTests.inputs,
+            )
+            for index in range(2)
+        ]
+        with mock.patch('life.life_grid.render_life_grid_svg', wraps=life_grid.render_life_grid_svg) as render:
+            response = self.client.get(reverse('life:results', args=[calculations[0].unique_id]))
+            self.client.get(reverse('life:results', args=[calculations[1].unique_id]))
+        self.assertEqual(render.call_count, 1)
+        self.assertContains(response, 'weeks lived</title>')
+
+        url = reverse('life:life_grid', args=[calculations[0].unique_id])
+        response = self.client.get(url, {'format': 'png', 'unit': 'days'})
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(self.client.get(url, {'format': 'gif'}).status_code, 400)
+
+
+class CompareResultsTests(SimpleTestCase):
+    def test_regressions_respect_metric_direction(self):
+        baseline = {
+            'scoring.batch_rows_per_second': 1000.0,
+            'pdf.form.80_years.seconds': 1.0,
+            'pdf.form.80_years.bytes': 100,
+            'views.results.median_seconds': 0.01,
+            'metrics.request_overhead_seconds': -1e-6,
+            'metrics.query_overhead_seconds': 0.0,
+        }
+        current = {
+            'scoring.batch_rows_per_second': 700.0,
+            'pdf.form.80_years.seconds': 0.5,
+            'pdf.form.80_years.bytes': 150,
+            'views.results.median_seconds': 0.011,
+            'views.new.median_seconds': 1.0,
+            'metrics.request_overhead_seconds': 1e-5,
+            'metrics.query_overhead_seconds': 1e-6,
+        }
+        regressions, not_comparable = compare_results(current, baseline, threshold=0.2)
+        self.assertEqual(
+            [name for name, *_ in regressions],
+            ['scoring.batch_rows_per_second', 'pdf.form.80_years.bytes'],
+        )
+        self.assertEqual(not_comparable, [
+            ('metrics.request_overhead_seconds', -1e-6, 1e-5),
+            ('metrics.query_overhead_seconds', 0.0, 1e-6),
+        ])
+
+
+class BenchmarkCommandTests(SimpleTestCase):
+    def test_database_benchmarks_run_back_to_back(self):
+        # A subprocess, as the benchmarks create and destroy their own test
+        # database
+        result = subprocess.run(
+            [
+                sys.executable, 'manage.py', 'benchmark', 'servers', 'admin',
+                '--seed-rows', '20', '--requests', '4', '--concurrency', '2',
+                '--admin-rows', '300', '--iterations', '1',
+            ],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('admin.search_speedup', result.stdout)
+
+    def test_default_runs_only_the_light_benchmarks(self):
+        command = 'life.management.commands.benchmark'
+        ran = []
+        patches = [
+            mock.patch(f'{command}.bench_{name}', lambda *args, name=name, **kwargs: ran.append(name) or {})
+            for name in ('scoring', 'pdf', 'views', 'writes', 'servers', 'admin', 'life_tables', 'pdf_parallel',
+                         'metrics', 'import')
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        call_command('benchmark', stdout=StringIO())
+        self.assertEqual(ran, ['scoring', 'pdf', 'views'])
+
+
+class ScoringRulesTests(SimpleTestCase):
+    def setUp(self):
+        scoring_rules.clear_rules_cache()
+        self.addCleanup(scoring_rules.clear_rules_cache)
+
+    def test_v1_matches_legacy_formula(self):
+        profiles = generate_profiles(5000, seed=7)
+        records = [dict(zip(profiles, values)) for values in zip(*profiles.values())]
+        for record in records:
+            self.assertEqual(calculate_lifespan(**record), legacy_calculate_lifespan(**record))
+
+    def test_band_edges(self):
+        bmi = scoring_rules.get_rules('v1').factor('bmi')
+        self.assertEqual(
+            [bmi.score(value) for value in (18.49, 18.5, 24.9, 24.95, 25, 29.9, 29.95, 30)],
+            [-2, 2, 2, -2, 0, 0, -2, -2],
+        )
+        exercise = scoring_rules.get_rules('v1').factor('exercise')
+        self.assertEqual([exercise.score(value) for value in (0, 74, 75, 149, 150, 1000)], [0, 0, 3, 3, 5, 5])
+
+    def test_overlapping_bands_are_rejected(self):
+        with self.assertRaises(scoring_rules.RulesError):
+            scoring_rules.BandedFactor('x', 'x', 1, 0, [
+                {'min': 0, 'max': 10, 'score': 1},
+                {'min': 5, 'max': 20, 'score': 2},
+            ])
+
+    def test_unknown_version(self):
+        with self.assertRaises(scoring_rules.RulesError):
+            scoring_rules.get_rules('does-not-exist')
+        with self.assertRaises(scoring_rules.RulesError):
+            scoring_rules.get_rules('../v1')
+
+    def test_hot_reload(self):
+        with tempfile.TemporaryDirectory() as rules_dir:
+            data = json.loads((scoring_rules.RULES_DIR / 'v1.json').read_text(encoding='utf-8'))
+            data['version'] = 'test'
+            path = Path(rules_dir) / 'test.json'
+            path.write_text(json.dumps(data), encoding='utf-8')
+
+            expected = calculate_lifespan()
+
+            with mock.patch.object(scoring_rules, 'RULES_DIR', Path(rules_dir)), \
+                    mock.patch.object(scoring_rules, 'RELOAD_CHECK_INTERVAL', 0):
+                self.assertEqual(calculate_lifespan(rules_version='test'), expected)
+
+                data['base_age'] = 80
+                path.write_text(json.dumps(data), encoding='utf-8')
+                os.utime(path, ns=(path.stat().st_mtime_ns + 10**9,) * 2)
+                self.assertEqual(calculate_lifespan(rules_version='test'), expected + 5)
+
+                # A broken edit keeps the last good table
+                path.write_text('{', encoding='utf-8')
+                os.utime(path, ns=(path.stat().st_mtime_ns + 2 * 10**9,) * 2)
+                with self.assertLogs('life.scoring_rules', 'ERROR'):
+                    self.assertEqual(scoring_rules.get_rules('test').base_age, 80)
+
+
+class RenderLifeCalendarTests(SimpleTestCase):
+    def render(self, total_years, mode):
+        output = BytesIO()
+        render_life_calendar(total_years, output, mode)
+        return output.getvalue()
+
+    def test_modes_render_one_page_per_year(self):
+        for mode in RENDER_MODES:
+            with self.subTest(mode=mode):
+                pdf = self.render(3, mode)
+                self.assertTrue(pdf.startswith(b'%PDF-'))
+                self.assertEqual(len(re.findall(rb'/Type /Page\b', pdf)), 3)
+
+    def test_form_mode_is_smaller(self):
+        self.assertLess(len(self.render(5, 'form')) * 2, len(self.render(5, 'inline')))
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            self.render(1, 'sketch')
+        with self.assertRaises(ValueError):
+            render_life_calendar(1, BytesIO(), layout='days')
+
+    def test_year_range_and_lived_days(self):
+        output = BytesIO()
+        render_life_calendar(80, output, years=(30, 32), highlight=(31, 100))
+        pdf = output.getvalue()
+        self.assertEqual(len(re.findall(rb'/Type /Page\b', pdf)), 3)
+        self.assertGreater(len(pdf), len(self.render(3, 'form')))
+        with self.assertRaises(ValueError):
+            render_life_calendar(80, BytesIO(), years=(79, 81))
+        self.assertEqual(pdf_generator.lived_position(date(1990, 1, 1), date(2020, 3, 1)), (31, 60))
+
+    def test_poster_layouts_fit_on_few_pages(self):
+        for layout in ('weeks', 'months'):
+            with self.subTest(layout=layout):
+                for total_years, pages in ((85, 1), (150, 2)):
+                    output = BytesIO()
+                    render_life_calendar(total_years, output, layout=layout)
+                    self.assertEqual(len(re.findall(rb'/Type /Page\b', output.getvalue())), pages)
+                self.assertLess(len(output.getvalue()) * 10, len(self.render(85, 'form')))
+
+
+class PDFParallelTests(SimpleTestCase):
+    @staticmethod
+    def page_contents(data):
+        document = pdf_parallel._Document(data)
+        return [
+            document.objects[int(re.search(rb'/Contents (\d+) 0 R', document.objects[number]).group(1))]
+            for number in document.page_numbers
+        ]
+
+    @override_settings(PDF_PARALLEL_MIN_YEARS=2, PDF_PARALLEL_MODES=RENDER_MODES)
+    def test_merged_chunks_match_serial_render(self):
+        for mode in RENDER_MODES:
+            with self.subTest(mode=mode):
+                serial = BytesIO()
+                render_life_calendar(7, serial, mode, highlight=(5, 20))
+                merged = BytesIO()
+                with ThreadPoolExecutor(3) as executor:
+                    pdf_parallel.render_life_calendar_parallel(
+                        7, merged, mode, highlight=(5, 20), executor=executor, processes=3,
+                    )
+                merged = merged.getvalue()
+                self.assertEqual(self.page_contents(merged), self.page_contents(serial.getvalue()))
+                # Shared resources are written once
+                self.assertEqual(merged.count(b'/Subtype /Form'), serial.getvalue().count(b'/Subtype /Form'))
+
+    def test_short_poster_and_form_calendars_render_serially(self):
+        self.assertIsNone(pdf_parallel.plan_chunks(39, 'inline', processes=4))
+        self.assertIsNone(pdf_parallel.plan_chunks(80, 'inline', layout='weeks', processes=4))
+        self.assertIsNone(pdf_parallel.plan_chunks(80, 'inline', processes=1))
+        # Form mode redraws the grid in every chunk
+        self.assertIsNone(pdf_parallel.plan_chunks(80, 'form', processes=4))
+        self.assertEqual(pdf_parallel.plan_chunks(80, 'inline', years=(31, 80), processes=4),
+                         [(31, 43), (44, 56), (57, 69), (70, 80)])
+
+
+class PDFCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.cache = pdf_cache.PDFCache(self.directory.name, max_bytes=250, memory_max_bytes=150)
+
+    def test_key_depends_on_parameters(self):
+        self.assertEqual(pdf_cache.cache_key(total_years=80), pdf_cache.cache_key(total_years=80))
+        self.assertNotEqual(pdf_cache.cache_key(total_years=80), pdf_cache.cache_key(total_years=81))
+
+    def test_render_once_then_serve_from_disk(self):
+        render = mock.Mock(side_effect=lambda output: output.write(b'%PDF-' + b'x' * 95))
+        key = pdf_cache.cache_key(total_years=3)
+
+        with self.cache.get_or_render(key, render) as first:
+            self.assertEqual(len(first.read()), 100)
+        self.cache.clear_memory()
+        with self.cache.get_or_render(key, render) as second:
+            # Served as a file from the shared tier, not re-rendered
+            self.assertEqual(second.name, str(self.cache.path(key)))
+            self.assertEqual(len(second.read()), 100)
+        render.assert_called_once()
+
+    def test_memory_tier_is_bounded(self):
+        for years in (1, 2):
+            self.cache.store(pdf_cache.cache_key(total_years=years), b'x' * 100)
+        self.assertEqual(len(self.cache._memory), 1)
+        self.assertEqual(self.cache.open(pdf_cache.cache_key(total_years=2)).read(), b'x' * 100)
+
+    def test_disk_tier_evicts_least_recently_used(self):
+        keys = [pdf_cache.cache_key(total_years=years) for years in (1, 2, 3)]
+        for age, key in enumerate(keys):
+            self.cache.store(key, b'x' * 100)
+            os.utime(self.cache.path(key), (1000 + age, 1000 + age))
+        self.cache.evict()
+        self.assertEqual([self.cache.path(key).exists() for key in keys], [False, True, True])
+
+
+class GeneratePDFViewTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(PDF_CACHE_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        pdf_cache.get_pdf_cache.cache_clear()
+        self.addCleanup(pdf_cache.get_pdf_cache.cache_clear)
+
+        self.calculation = LifeCalculation.objects.create(
+            date_of_birth=date(1990, 1, 1), weight_kg=70, height_cm=175,
+            estimated_lifespan_years=2.0, unique_id='pdf-view-test',
+        )
+
+    def test_pdf_is_rendered_once(self):
+        url = reverse('life:generate_pdf', args=[self.calculation.unique_id])
+        with mock.patch.object(pdf_parallel, 'render_life_calendar', wraps=pdf_parallel.render_life_calendar) as render:
+            first = self.client.get(url)
+            second = self.client.get(url)
+
+        render.assert_called_once_with(2, mock.ANY, 'form', 'yearly', None, None)
+        self.assertEqual(first['Content-Type'], 'application/pdf')
+        self.assertIn('attachment; filename="life_calendar_pdf-view.pdf"', first['Content-Disposition'])
+        self.assertEqual(b''.join(first.streaming_content), b''.join(second.streaming_content))
+
+    def test_poster_layout(self):
+        url = reverse('life:generate_pdf', args=[self.calculation.unique_id])
+        response = self.client.get(url, {'layout': 'weeks'})
+        self.assertIn('filename="life_calendar_weeks_pdf-view.pdf"', response['Content-Disposition'])
+        self.assertNotEqual(b''.join(response.streaming_content), b''.join(self.client.get(url).streaming_content))
+        self.assertEqual(self.client.get(url, {'layout': 'days'}).status_code, 400)
+
+    def test_year_range_and_highlight(self):
+        calculation = LifeCalculation.objects.create(
+            date_of_birth=date(1990, 1, 1), weight_kg=70, height_cm=175,
+            estimated_lifespan_years=80.0, unique_id='pdf-range-test',
+        )
+        url = reverse('life:generate_pdf', args=[calculation.unique_id])
+        with mock.patch('django.utils.timezone.now', return_value=datetime(2020, 3, 1, tzinfo=dt_timezone.utc)), \
+                mock.patch.object(pdf_parallel, 'render_life_calendar', wraps=pdf_parallel.render_life_calendar) as render:
+            response = self.client.get(url, {'from': 'current', 'to': '35', 'highlight': '1'})
+            self.assertEqual(self.client.get(url, {'from': '40', 'to': '30'}).status_code, 400)
+            self.assertEqual(self.client.get(url, {'from': 'x'}).status_code, 400)
+            self.assertEqual(self.client.get(url, {'from': '1', 'layout': 'weeks'}).status_code, 400)
+
+        render.assert_called_once_with(80, mock.ANY, 'form', 'yearly', (31, 35), (31, 60))
+        self.assertIn('filename="life_calendar_pdf-rang_years_31-35.pdf"', response['Content-Disposition'])
+        self.assertEqual(len(re.findall(rb'/Type /Page\b', b''.join(response.streaming_content))), 5)
+
+    def get(self, **headers):
+        return self.client.get(reverse('life:generate_pdf', args=[self.calculation.unique_id]), headers=headers)
+
+    def test_full_response_headers(self):
+        response = self.get()
+        body = b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(response['Content-Length']), len(body))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(response['ETag'].startswith('"'))
+
+    def test_byte_ranges(self):
+        full = self.get()
+        body = b''.join(full.streaming_content)
+
+        response = self.get(range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), body[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(body)}')
+        self.assertEqual(response['Content-Length'], '10')
+
+        response = self.get(range='bytes=-5', if_range=full['ETag'])
+        self.assertEqual(b''.join(response.streaming_content), body[-5:])
+
+        response = self.get(range=f'bytes={len(body)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(body)}')
+
+        # A stale If-Range gets the whole file
+        response = self.get(range='bytes=0-9', if_range='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_get(self):
+        etag = self.get()['ETag']
+        response = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_sendfile(self):
+        with override_settings(PDF_SENDFILE_HEADER='X-Accel-Redirect', PDF_SENDFILE_URL_PREFIX='/protected/'):
+            response = self.get()
+        key = pdf_cache.life_calendar_key(2)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{key[:2]}/{key}.pdf')
+        self.assertEqual(response.content, b'')
+
+        # A memory tier hit whose file was evicted is written back to disk
+        path = pdf_cache.get_pdf_cache().path(key)
+        body = path.read_bytes()
+        path.unlink()
+        with override_settings(PDF_SENDFILE_HEADER='X-Accel-Redirect', PDF_SENDFILE_URL_PREFIX='/protected/'):
+            self.get()
+        self.assertEqual(path.read_bytes(), body)
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-5000', 1000), (0, 999))
+        self.assertEqual(parse_range('bytes=990-5000', 1000), (990, 999))
+        self.assertIs(parse_range('bytes=1000-', 1000), False)
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 1000))
+        self.assertIsNone(parse_range('items=0-1', 1000))
+        self.assertIsNone(parse_range(None, 1000))
+
+
+class PDFJobTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(PDF_CACHE_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        pdf_cache.get_pdf_cache.cache_clear()
+        self.addCleanup(pdf_cache.get_pdf_cache.cache_clear)
+
+        self.calculation = LifeCalculation.objects.create(
+            date_of_birth=date(1990, 1, 1), weight_kg=70, height_cm=175,
+            estimated_lifespan_years=2.0, unique_id='pdf-job-test',
+        )
+
+    def enqueue(self):
+        response = self.client.post(reverse('life:enqueue_pdf', args=[self.calculation.unique_id]))
+        self.assertEqual(response.status_code, 202)
+        return response.json()
+
+    def test_identical_jobs_are_deduplicated(self):
+        first = self.enqueue()
+        second = self.enqueue()
+        self.assertEqual(first['job_id'], second['job_id'])
+        self.assertEqual(first['status'], PDFJob.PENDING)
+        self.assertEqual(PDFJob.objects.count(), 1)
+
+    def test_worker_renders_and_job_is_downloadable(self):
+        job_id = self.enqueue()['job_id']
+        response = self.client.get(reverse('life:pdf_job_download', args=[job_id]))
+        self.assertEqual(response.status_code, 404)
+
+        with mock.patch.object(pdf_jobs, 'close_old_connections'):
+            pdf_jobs.run_worker(processes=1, once=True)
+
+        status = self.client.get(reverse('life:pdf_job_status', args=[job_id])).json()
+        self.assertEqual(status['status'], PDFJob.DONE)
+        response = self.client.get(status['download_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF-'))
+
+        # Finished jobs are served from the cache without being queued again
+        self.assertEqual(self.enqueue()['status'], PDFJob.DONE)
+
+    @override_settings(PDF_PARALLEL_MIN_YEARS=2, PDF_PARALLEL_MODES=RENDER_MODES)
+    def test_worker_splits_long_calendars(self):
+        job_id = self.enqueue()['job_id']
+        with mock.patch.object(pdf_jobs, 'close_old_connections'), \
+                mock.patch.object(pdf_jobs, 'merge_into_cache', wraps=pdf_jobs.merge_into_cache) as merge:
+            pdf_jobs.run_worker(processes=2, once=True)
+
+        self.assertEqual(len(merge.call_args.args[2]), 2)
+        status = self.client.get(reverse('life:pdf_job_status', args=[job_id])).json()
+        self.assertEqual(status['status'], PDFJob.DONE)
+        pdf = b''.join(self.client.get(status['download_url']).streaming_content)
+        self.assertEqual(len(re.findall(rb'/Type /Page\b', pdf)), 2)
+
+    def test_only_jobs_without_heartbeat_are_requeued(self):
+        job_id = self.enqueue()['job_id']
+        self.assertEqual(pdf_jobs.claim_next_job('a').worker, 'a')
+        long_ago = timezone.now() - timedelta(seconds=settings.PDF_JOB_TIMEOUT + 60)
+        PDFJob.objects.filter(key=job_id).update(started_at=long_ago)
+
+        # A long render whose worker is alive keeps its job
+        self.assertEqual(pdf_jobs.requeue_stale_jobs('b'), 0)
+
+        PDFJob.objects.filter(key=job_id).update(heartbeat_at=long_ago)
+        self.assertEqual(pdf_jobs.requeue_stale_jobs('a'), 0)
+        self.assertEqual(pdf_jobs.send_heartbeat('a'), 1)
+        self.assertEqual(pdf_jobs.requeue_stale_jobs('b'), 0)
+
+        PDFJob.objects.filter(key=job_id).update(heartbeat_at=long_ago)
+        self.assertEqual(pdf_jobs.requeue_stale_jobs('b'), 1)
+        job = PDFJob.objects.get(key=job_id)
+        self.assertEqual((job.status, job.worker, job.heartbeat_at), (PDFJob.PENDING, '', None))
+
+    def test_evicted_job_is_requeued(self):
+        job_id = self.enqueue()['job_id']
+        PDFJob.objects.filter(key=job_id).update(status=PDFJob.DONE)
+        self.assertEqual(self.enqueue()['status'], PDFJob.PENDING)
+
+    def test_enqueue_requires_post(self):
+        response = self.client.get(reverse('life:enqueue_pdf', args=[self.calculation.unique_id]))
+        self.assertEqual(response.status_code, 405)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ResultsCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calculation = LifeCalculation.objects.create(
+            date_of_birth=date(1990, 1, 1), weight_kg=70, height_cm=175,
+            estimated_lifespan_years=80.0, unique_id='results-cache-test',
+        )
+        self.url = reverse('life:results', args=[self.calculation.unique_id])
+
+    def at(self, *args):
+        return mock.patch('django.utils.timezone.now', return_value=datetime(*args, tzinfo=dt_timezone.utc))
+
+    def test_cached_until_utc_midnight(self):
+        with self.at(2026, 3, 1, 23, 0):
+            first = self.client.get(self.url)
+            self.assertEqual(first['Cache-Control'], 'public, max-age=3600')
+            with self.assertNumQueries(0):
+                second = self.client.get(self.url)
+            self.assertEqual(first.content, second.content)
+            self.assertEqual(first['ETag'], second['ETag'])
+
+        with self.at(2026, 3, 2, 0, 1):
+            with self.assertNumQueries(1):
+                third = self.client.get(self.url)
+        self.assertNotEqual(first['ETag'], third['ETag'])
+        self.assertIn(b'const initialElapsedSeconds = %d;' % ((date(2026, 3, 2) - date(1990, 1, 1)).days * 86400),
+                      third.content)
+
+    def test_conditional_get(self):
+        with self.at(2026, 3, 1, 12, 0):
+            first = self.client.get(self.url)
+            response = self.client.get(self.url, headers={'if-none-match': first['ETag']})
+            self.assertEqual(response.status_code, 304)
+            response = self.client.get(self.url, headers={'if-modified-since': first['Last-Modified']})
+            self.assertEqual(response.status_code, 304)
+
+    def test_unknown_link_is_not_cached(self):
+        url = reverse('life:results', args=['missing'])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_waits_for_render_in_progress(self):
+        with self.at(2026, 3, 1, 12, 0):
+            self.client.get(self.url)
+            page_key = next(key for key in cache._cache if 'daily-page' in key)
+        cache.clear()
+
+        # Another worker holds the render lock: no render here, wait for its page
+        original_get = cache.get
+        calls = []
+
+        def get(key, *args, **kwargs):
+            calls.append(key)
+            if len(calls) == 3:
+                cache.set(key, {'content': b'rendered elsewhere', 'content_type': 'text/html',
+                                'etag': '"x"', 'last_modified': 0})
+            return original_get(key, *args, **kwargs)
+
+        with self.at(2026, 3, 1, 12, 0), mock.patch.object(cache, 'add', return_value=False), \
+                mock.patch.object(cache, 'get', side_effect=get), \
+                mock.patch.object(page_cache, 'LOCK_POLL_INTERVAL', 0):
+            with self.assertNumQueries(0):
+                response = self.client.get(self.url)
+        self.assertEqual(response.content, b'rendered elsewhere')
+
+
+class BulkEstimateTests(TestCase):
+    profile = {
+        'date_of_birth': '1985-06-01',
+        'gender': 'female',
+        'exercise_minutes_per_week': 160,
+        'smoking_status': 'none',
+        'weight_kg': 62,
+        'height_cm': 170,
+        'diet_quality': 'healthy',
+        'alcohol_consumption': 'light',
+        'has_health_issues': False,
+    }
+
+    def post(self, lines, query='', headers=None):
+        body = b''.join(line if isinstance(line, bytes) else json.dumps(line).encode() + b'\n' for line in lines)
+        response = self.client.post(
+            reverse('life:bulk_estimate') + query, body, content_type='application/x-ndjson', headers=headers,
+        )
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_scores_and_validates_each_line(self):
+        expected = calculate_lifespan(
+            exercise_minutes_per_week=160, smoking_status='none', weight_kg=62, height_cm=170,
+            diet_quality='healthy', alcohol_consumption='light', has_health_issues=False,
+        )
+        results = self.post([
+            dict(self.profile, ref='a'),
+            b'not json\n',
+            b'\n',
+            dict(self.profile, smoking_status='cigars'),
+            dict(self.profile, ref='b'),
+        ])
+
+        self.assertEqual(results[0], {'line': 1, 'estimated_lifespan_years': expected, 'ref': 'a'})
+        self.assertEqual(results[1], {'line': 2, 'errors': {'__all__': ['Invalid JSON.']}})
+        self.assertEqual(results[2]['line'], 4)
+        self.assertIn('smoking_status', results[2]['errors'])
+        self.assertEqual(results[3]['ref'], 'b')
+        self.assertEqual(len(results), 4)
+        self.assertEqual(LifeCalculation.objects.count(), 0)
+
+    @override_settings(BULK_PERSIST_TOKEN='secret')
+    def test_persist_in_batches(self):
+        with mock.patch.object(bulk, 'CHUNK_SIZE', 2), \
+                mock.patch.object(LifeCalculation.objects, 'bulk_create', wraps=LifeCalculation.objects.bulk_create) as bulk_create:
+            results = self.post([self.profile] * 5, query='?persist=1', headers={'authorization': 'Bearer secret'})
+
+        self.assertEqual(bulk_create.call_count, 3)
+        self.assertEqual(LifeCalculation.objects.count(), 5)
+        calculation = LifeCalculation.objects.get(unique_id=results[4]['unique_id'])
+        self.assertEqual(calculation.estimated_lifespan_years, results[4]['estimated_lifespan_years'])
+        self.assertEqual(calculation.gender, 'female')
+
+    def test_non_string_values(self):
+        results = self.post([
+            dict(self.profile, date_of_birth=123),
+            dict(self.profile, weight_kg=[62]),
+            dict(self.profile, has_health_issues=True),
+        ])
+        self.assertIn('date_of_birth', results[0]['errors'])
+        self.assertEqual(results[1]['errors'], {'weight_kg': ['Expected a string, number or boolean.']})
+        self.assertIn('estimated_lifespan_years', results[2])
+
+    def test_persist_requires_token(self):
+        url = reverse('life:bulk_estimate') + '?persist=1'
+        body = json.dumps(self.profile)
+        self.assertEqual(self.client.post(url, body, content_type='application/x-ndjson').status_code, 403)
+        with override_settings(BULK_PERSIST_TOKEN='secret'):
+            response = self.client.post(
+                url, body, content_type='application/x-ndjson', headers={'authorization': 'Bearer wrong'},
+            )
+            self.assertEqual(response.status_code, 403)
+        self.assertEqual(LifeCalculation.objects.count(), 0)
+
+    def test_long_lines_are_rejected(self):
+        lines = bulk.read_lines(BytesIO(b'x' * 100 + b'\n{}\n').readline, max_line_bytes=10)
+        self.assertEqual(list(lines), [None, b'{}\n'])
+
+
+class TransferCommandTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        seed_calculations(25)
+
+    def call(self, *args):
+        call_command(*args, stdout=StringIO())
+
+    def rows(self):
+        return [dict(row, id=None) for row in LifeCalculation.objects.order_by('unique_id').values()]
+
+    def round_trip(self, filename, *export_args):
+        path = str(self.directory / filename)
+        expected = self.rows()
+        self.call('export_calculations', path, '--chunk-size', '10', *export_args)
+        LifeCalculation.objects.all().delete()
+        self.call('import_calculations', path, '--batch-size', '10')
+        self.assertEqual(self.rows(), expected)
+        return path
+
+    def test_csv_round_trip(self):
+        LifeCalculation.objects.filter(pk=LifeCalculation.objects.order_by('pk')[0].pk).update(
+            created_at=datetime(2020, 1, 2, 3, 4, 5, 678901, tzinfo=dt_timezone.utc),
+        )
+        path = self.round_trip('calculations.csv')
+        self.assertTrue(Path(path).read_text().startswith('unique_id,date_of_birth,'))
+        # Imported rows are counted on the day they were created
+        self.assertTrue(LifespanStat.objects.filter(dimension='day', value='2020-01-02').exists())
+
+    def test_gzipped_jsonl_round_trip(self):
+        path = self.round_trip('calculations.jsonl.gz')
+        self.assertEqual(Path(path).read_bytes()[:2], b'\x1f\x8b')
+
+    def test_resume_export_and_import(self):
+        path = str(self.directory / 'calculations.csv')
+        expected = self.rows()
+        self.call('export_calculations', path, '--chunk-size', '10')
+        full = Path(path).read_text()
+        Path(path).write_text(''.join(full.splitlines(keepends=True)[:11]))
+        # Rows deleted before the resume point do not shift it
+        tenth = LifeCalculation.objects.order_by('pk')[9]
+        LifeCalculation.objects.filter(pk__lt=tenth.pk).order_by('pk').first().delete()
+        self.call('export_calculations', path, '--after-id', str(tenth.pk))
+        self.assertEqual(Path(path).read_text(), full)
+
+        LifeCalculation.objects.all().delete()
+        self.call('import_calculations', path, '--batch-size', '5')
+        LifeCalculation.objects.order_by('pk').last().delete()
+        with self.assertRaises(CommandError):
+            self.call('import_calculations', path, '--offset', '20')
+        self.call('import_calculations', path, '--offset', '20', '--ignore-conflicts')
+        self.assertEqual(self.rows(), expected)
+
+    def test_repeated_unique_id_is_imported_and_counted_once(self):
+        path = self.directory / 'calculations.jsonl'
+        self.call('export_calculations', str(path))
+        lines = path.read_text().splitlines(keepends=True)
+        path.write_text(''.join(lines + lines[:1]))
+        LifeCalculation.objects.all().delete()
+        LifespanStat.objects.all().delete()
+
+        self.call('import_calculations', str(path), '--ignore-conflicts')
+        self.assertEqual(LifeCalculation.objects.count(), 25)
+        self.assertEqual(LifespanStat.objects.filter(dimension='all').aggregate(Sum('count'))['count__sum'], 25)
+
+    def test_invalid_row_reports_resume_offset(self):
+        path = self.directory / 'calculations.jsonl'
+        self.call('export_calculations', str(path))
+        lines = path.read_text().splitlines(keepends=True)
+        lines[12] = lines[12].replace('"weight_kg":', '"weight_kg":"heavy","x":')
+        path.write_text(''.join(lines))
+        LifeCalculation.objects.all().delete()
+
+        with self.assertRaisesMessage(CommandError, 'Row 13: weight_kg'):
+            self.call('import_calculations', str(path), '--batch-size', '5')
+        self.assertEqual(LifeCalculation.objects.count(), 10)
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.enterContext(self.settings(CALCULATION_ARCHIVE_DIR=self.directory))
+        cache.clear()
+        seed_calculations(30)
+        ids = list(LifeCalculation.objects.order_by('pk').values_list('pk', flat=True))
+        LifeCalculation.objects.filter(pk__in=ids[:12]).update(created_at=datetime(2020, 1, 15, tzinfo=dt_timezone.utc))
+        LifeCalculation.objects.filter(pk__in=ids[12:20]).update(created_at=datetime(2020, 2, 3, 12, 30, tzinfo=dt_timezone.utc))
+        self.old = list(LifeCalculation.objects.filter(pk__in=ids[:20]).order_by('pk').values())
+
+    def archived_lines(self):
+        return [
+            json.loads(line)
+            for path in sorted(self.directory.glob('*.jsonl.gz'))
+            for line in gzip.open(path, 'rt')
+        ]
+
+    def test_archives_old_rows_by_month(self):
+        call_command('archive_calculations', '--days', '365', '--batch-size', '7', stdout=StringIO())
+
+        self.assertEqual(LifeCalculation.objects.count(), 10)
+        self.assertEqual(
+            sorted(path.name for path in self.directory.iterdir()),
+            ['calculations-2020-01.jsonl.gz', 'calculations-2020-02.jsonl.gz'],
+        )
+        self.assertEqual([line['unique_id'] for line in self.archived_lines()], [row['unique_id'] for row in self.old])
+        self.assertEqual(ArchivedCalculation.objects.count(), 20)
+
+    def test_interrupted_run_resumes(self):
+        cutoff = datetime(2021, 1, 1, tzinfo=dt_timezone.utc)
+        # The second batch is written to the archive but never deleted
+        bulk_create = ArchivedCalculation.objects.bulk_create
+        with mock.patch.object(ArchivedCalculation.objects, 'bulk_create', wraps=bulk_create,
+                               side_effect=[mock.DEFAULT, RuntimeError]):
+            with self.assertRaises(RuntimeError):
+                retention.archive_calculations(cutoff, batch_size=8)
+        self.assertEqual(LifeCalculation.objects.count(), 22)
+
+        self.assertEqual(retention.archive_calculations(cutoff, batch_size=8), 12)
+        self.assertEqual(LifeCalculation.objects.count(), 10)
+        self.assertEqual(len(self.archived_lines()), 28)
+        self.assertEqual(retention.archive_calculations(cutoff), 0)
+
+        for row in self.old:
+            self.assertEqual(self.client.get(reverse('life:results', args=[row['unique_id']])).status_code, 200)
+        self.assertEqual(ArchivedCalculation.objects.count(), 0)
+
+    def test_share_link_restores_archived_row(self):
+        retention.archive_calculations(datetime(2021, 1, 1, tzinfo=dt_timezone.utc))
+        row = self.old[15]
+
+        response = self.client.get(reverse('life:results', args=[row['unique_id']]))
+        self.assertEqual(response.status_code, 200)
+        restored = LifeCalculation.objects.filter(unique_id=row['unique_id']).values().get()
+        self.assertEqual(dict(restored, id=None), dict(row, id=None))
+        self.assertFalse(ArchivedCalculation.objects.filter(unique_id=row['unique_id']).exists())
+
+        self.assertEqual(self.client.get(reverse('life:results', args=['never-saved'])).status_code, 404)
+
+
+class WriteBufferTests(TransactionTestCase):
+    def calculation(self, unique_id):
+        return LifeCalculation(
+            date_of_birth=date(1990, 5, 17), weight_kg=64, height_cm=168,
+            estimated_lifespan_years=76.5, unique_id=unique_id,
+        )
+
+    def test_concurrent_submissions_share_transactions(self):
+        buffer = write_buffer.WriteBuffer(max_delay=0.01)
+
+        def submit(thread):
+            for index in range(25):
+                buffer.submit(self.calculation(f'{thread}-{index}'))
+
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(submit, range(8)))
+        self.assertTrue(buffer.flush(timeout=10))
+
+        self.assertEqual(LifeCalculation.objects.count(), 200)
+        self.assertLess(buffer.batches, 200)
+
+    def test_failed_batch_is_saved_row_by_row(self):
+        buffer = write_buffer.WriteBuffer(max_delay=0.05)
+        with self.assertLogs('life.write_buffer', 'WARNING'):
+            for unique_id in ('a', 'b', 'a', 'c'):
+                buffer.submit(self.calculation(unique_id))
+            self.assertTrue(buffer.flush(timeout=10))
+
+        self.assertEqual(sorted(LifeCalculation.objects.values_list('unique_id', flat=True)), ['a', 'b', 'c'])
+        # The duplicate is kept rather than dropped
+        self.assertEqual(list(buffer.failed), ['a'])
+
+    def test_transient_failures_are_retried(self):
+        buffer = write_buffer.WriteBuffer(retry_delay=0.01)
+        save = LifeCalculation.save
+        attempts = []
+
+        def flaky_save(calculation, *args, **kwargs):
+            attempts.append(calculation.unique_id)
+            if len(attempts) == 1:
+                raise OperationalError('database is locked')
+            return save(calculation, *args, **kwargs)
+
+        with mock.patch.object(LifeCalculation.objects, 'bulk_create', side_effect=OperationalError('database is locked')), \
+                mock.patch.object(LifeCalculation, 'save', flaky_save), \
+                self.assertLogs('life.write_buffer', 'WARNING'):
+            buffer.submit(self.calculation('a'))
+            self.assertTrue(buffer.flush(timeout=10))
+
+        self.assertEqual(attempts, ['a', 'a'])
+        self.assertTrue(LifeCalculation.objects.filter(unique_id='a').exists())
+        self.assertEqual(buffer.failed, {})
+
+    @override_settings(
+        CALCULATION_WRITE_BUFFER=True,
+        CALCULATION_WRITE_BUFFER_NOT_FOUND_WAIT=2,
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    )
+    def test_results_wait_for_row_saved_by_another_worker(self):
+        # Saved by "another worker" shortly after the redirect
+        timer = threading.Timer(0.2, lambda: self.calculation('elsewhere').save())
+        timer.start()
+        self.addCleanup(timer.join)
+        self.assertEqual(self.client.get(reverse('life:results', args=['elsewhere'])).status_code, 200)
+
+        with override_settings(CALCULATION_WRITE_BUFFER_NOT_FOUND_WAIT=0.1):
+            self.assertEqual(self.client.get(reverse('life:results', args=['missing'])).status_code, 404)
+
+    @override_settings(
+        CALCULATION_WRITE_BUFFER=True,
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    )
+    def test_results_wait_for_buffered_submission(self):
+        write_buffer.get_write_buffer.cache_clear()
+        self.addCleanup(write_buffer.get_write_buffer.cache_clear)
+        response = self.client.post(reverse('life:index'), {
+            'date_of_birth': '1990-05-17',
+            'gender': 'female',
+            'exercise_minutes_per_week': '120',
+            'smoking_status': 'none',
+            'weight_kg': '64',
+            'height_cm': '168',
+            'diet_quality': 'healthy',
+            'alcohol_consumption': 'light',
+        })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.client.get(response.url).status_code, 200)
+
+
+class FingerprintTests(TestCase):
+    form_data = {
+        'date_of_birth': '1990-05-17',
+        'gender': 'female',
+        'exercise_minutes_per_week': '120',
+        'smoking_status': 'none',
+        'weight_kg': '64',
+        'height_cm': '168',
+        'diet_quality': 'healthy',
+        'alcohol_consumption': 'light',
+    }
+
+    def submit(self, **changes):
+        response = self.client.post(reverse('life:index'), dict(self.form_data, **changes))
+        self.assertEqual(response.status_code, 302)
+        return response.url
+
+    def test_identical_submissions_share_a_calculation(self):
+        first = self.submit()
+        self.assertEqual(self.submit(weight_kg='64.0'), first)
+        self.assertNotEqual(self.submit(weight_kg='65'), first)
+        self.assertEqual(LifeCalculation.objects.count(), 2)
+        self.assertEqual(set(LifeCalculation.objects.values_list('rules_version', flat=True)), {'v1'})
+
+    @override_settings(REUSE_IDENTICAL_CALCULATIONS=False)
+    def test_reuse_can_be_disabled(self):
+        self.assertNotEqual(self.submit(), self.submit())
+        self.assertEqual(LifeCalculation.objects.values('fingerprint').distinct().count(), 1)
+
+    def test_migration_backfills_fingerprints(self):
+        from importlib import import_module
+        from django.apps import apps
+
+        migration = import_module('life.migrations.0003_lifecalculation_fingerprint')
+        self.submit()
+        calculation = LifeCalculation.objects.get()
+        LifeCalculation.objects.update(fingerprint='')
+
+        with mock.patch.object(migration, 'BATCH_SIZE', 1):
+            migration.backfill_fingerprints(apps, None)
+        self.assertEqual(LifeCalculation.objects.get().fingerprint, calculation.fingerprint)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AsyncViewTests(TestCase):
+    form_data = FingerprintTests.form_data
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(PDF_CACHE_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        pdf_cache.get_pdf_cache.cache_clear()
+        self.addCleanup(pdf_cache.get_pdf_cache.cache_clear)
+        self.factory = AsyncRequestFactory()
+
+    async def submit(self):
+        response = await async_views.index(self.factory.post('/', self.form_data))
+        self.assertEqual(response.status_code, 302)
+        return response.url.rstrip('/').rsplit('/', 1)[-1]
+
+    async def test_index_and_results(self):
+        unique_id = await self.submit()
+        self.assertEqual(await self.submit(), unique_id)
+        self.assertEqual(await LifeCalculation.objects.acount(), 1)
+
+        response = await async_views.results(self.factory.get(f'/results/{unique_id}/'), unique_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'/pdf/' + unique_id.encode(), response.content)
+
+        with self.assertRaises(Http404):
+            await async_views.results(self.factory.get('/results/missing/'), 'missing')
+
+    async def test_failed_stats_update_rolls_back_the_row(self):
+        with mock.patch('life.stats._add', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                await self.submit()
+        self.assertEqual(await LifeCalculation.objects.acount(), 0)
+
+    async def test_generate_pdf_renders_in_process_pool(self):
+        self.addCleanup(async_views.get_render_executor.cache_clear)
+        self.addCleanup(lambda: async_views.get_render_executor().shutdown())
+        unique_id = await self.submit()
+        request = self.factory.get(f'/pdf/{unique_id}/')
+
+        first, second = await asyncio.gather(
+            async_views.generate_pdf(request, unique_id),
+            async_views.generate_pdf(request, unique_id),
+        )
+        body = b''.join([chunk async for chunk in first])
+        self.assertEqual(b''.join([chunk async for chunk in second]), body)
+        self.assertTrue(body.startswith(b'%PDF'))
+        self.assertEqual(int(first['Content-Length']), len(body))
+        self.assertEqual(len(list(Path(pdf_cache.get_pdf_cache().directory).glob('*/*.pdf'))), 1)
+
+        response = await async_views.generate_pdf(
+            self.factory.get(f'/pdf/{unique_id}/', headers={'range': 'bytes=10-19'}), unique_id
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join([chunk async for chunk in response]), body[10:20])
+
+    @override_settings(PDF_SENDFILE_HEADER='X-Accel-Redirect')
+    async def test_sendfile_of_pdf_evicted_after_render_is_404(self):
+        self.addCleanup(async_views.get_render_executor.cache_clear)
+        self.addCleanup(lambda: async_views.get_render_executor().shutdown())
+        unique_id = await self.submit()
+        cache = pdf_cache.get_pdf_cache()
+        real_open = cache.open
+
+        def evicting_open(key):
+            # Another worker evicts the file just before it is opened
+            cache.path(key).unlink(missing_ok=True)
+            return real_open(key)
+
+        with mock.patch.object(cache, 'open', side_effect=evicting_open):
+            with self.assertRaises(Http404):
+                await async_views.generate_pdf(self.factory.get(f'/pdf/{unique_id}/'), unique_id)
+
+
+class LifespanStatsTests(TestCase):
+    def create(self, years, **fields):
+        return LifeCalculation.objects.create(
+            date_of_birth=date(1990, 1, 1), weight_kg=70, height_cm=175,
+            estimated_lifespan_years=years, unique_id=secrets.token_urlsafe(16), **fields,
+        )
+
+    def snapshot(self):
+        return {
+            (row.dimension, row.value, row.bucket): (row.count, round(row.total_years, 6), round(row.total_squared_years, 6))
+            for row in LifespanStat.objects.all()
+        }
+
+    def test_saves_are_recorded_incrementally(self):
+        self.create(76.5, gender='female', smoking_status='none')
+        self.create(76.9, gender='female', smoking_status='daily')
+        self.create(72.0, gender='male', smoking_status='daily')
+
+        response = self.client.get(reverse('life:lifespan_stats'))
+        data = response.json()
+
+        self.assertEqual(data['all']['count'], 3)
+        self.assertAlmostEqual(data['all']['mean_years'], 75.133333, places=5)
+        self.assertEqual(data['all']['histogram'], [
+            {'min_years': 72.0, 'max_years': 73.0, 'count': 1},
+            {'min_years': 76.0, 'max_years': 77.0, 'count': 2},
+        ])
+        self.assertEqual(data['gender']['female']['count'], 2)
+        self.assertEqual(data['smoking_status']['daily']['count'], 2)
+        self.assertEqual(list(data['day'].values())[0]['count'], 3)
+
+    def test_rebuild_matches_incremental_stats(self):
+        for index in range(20):
+            self.create(60 + index * 1.7, gender=('male', 'female', 'other')[index % 3])
+        LifeCalculation.objects.bulk_create([
+            LifeCalculation(date_of_birth=date(1990, 1, 1), weight_kg=70, height_cm=175,
+                            estimated_lifespan_years=80.5, unique_id='bulk')
+        ])
+        stats.record_calculations(LifeCalculation.objects.filter(unique_id='bulk'))
+        incremental = self.snapshot()
+
+        LifespanStat.objects.all().delete()
+        call_command('rebuild_lifespan_stats', stdout=StringIO())
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_endpoint_cost_is_constant(self):
+        for index in range(10):
+            self.create(70 + index)
+        with self.assertNumQueries(1):
+            self.client.get(reverse('life:lifespan_stats'), {'days': 7})
+        self.assertEqual(self.client.get(reverse('life:lifespan_stats'), {'days': 'x'}).status_code, 400)
+        self.assertEqual(self.client.post(reverse('life:lifespan_stats')).status_code, 405)
+
+
+class ScalableAdminTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.url = reverse('admin:life_lifecalculation_changelist')
+        seed_calculations(250)
+
+    def test_keyset_pages_cover_every_row_in_order(self):
+        seen = []
+        url = self.url
+        while url:
+            response = self.client.get(url)
+            cl = response.context['cl']
+            self.assertIsNone(cl.full_result_count)
+            seen.extend(calculation.unique_id for calculation in cl.result_list)
+            url = cl.next_page_url and self.url + cl.next_page_url
+
+        expected = list(LifeCalculation.objects.order_by('-created_at', '-pk').values_list('unique_id', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertContains(response, 'First page')
+
+    def test_filtered_count_stops_at_limit(self):
+        with override_settings(ADMIN_COUNT_LIMIT=50):
+            response = self.client.get(self.url, {'gender': 'female'})
+        cl = response.context['cl']
+        self.assertEqual(cl.result_count, 50)
+        self.assertFalse(cl.paginator.count_is_exact)
+        self.assertTrue(all(calculation.gender == 'female' for calculation in cl.result_list))
+
+    def test_search_matches_exactly(self):
+        calculation = LifeCalculation.objects.get(unique_id='bench-0-7')
+        results = self.client.get(self.url, {'q': 'bench-0-7'}).context['cl'].result_list
+        self.assertEqual([row.unique_id for row in results], ['bench-0-7'])
+
+        self.assertEqual(len(self.client.get(self.url, {'q': 'bench-0'}).context['cl'].result_list), 0)
+
+        results = self.client.get(self.url, {'q': calculation.date_of_birth.isoformat()}).context['cl'].result_list
+        self.assertIn(calculation.unique_id, [row.unique_id for row in results])
+        self.assertTrue(all(row.date_of_birth == calculation.date_of_birth for row in results))
+
+    def test_bad_cursor_and_classic_mode(self):
+        response = self.client.get(self.url, {'after': 'nonsense'})
+        self.assertRedirects(response, self.url + '?e=1', fetch_redirect_response=False)
+
+        with override_settings(SCALABLE_ADMIN=False):
+            response = self.client.get(self.url, {'q': 'bench-0-2'})
+        self.assertEqual(response.context['cl'].full_result_count, 250)
+        self.assertEqual(response.context['cl'].result_count, 61)
+
+
+class RequestTimingTests(TestCase):
+    form_data = FingerprintTests.form_data
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(PDF_CACHE_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        pdf_cache.get_pdf_cache.cache_clear()
+        self.addCleanup(pdf_cache.get_pdf_cache.cache_clear)
+        cache.clear()
+        metrics.get_registry().clear()
+
+    def timings(self, response):
+        return {part.split(';')[0]: part for part in response['Server-Timing'].split(', ')}
+
+    def test_server_timing_header(self):
+        response = self.client.post(reverse('life:index'), self.form_data)
+        timings = self.timings(response)
+        self.assertEqual(list(timings), ['db', 'scoring', 'total'])
+        self.assertRegex(timings['db'], r'^db;dur=[\d.]+;desc="[1-9]\d* queries"$')
+
+        timings = self.timings(self.client.get(response.url))
+        self.assertIn('template', timings)
+        self.assertIn('scoring', timings)
+
+        unique_id = response.url.rstrip('/').rsplit('/', 1)[-1]
+        response = self.client.get(reverse('life:generate_pdf', args=[unique_id]))
+        body = b''.join(response.streaming_content)
+        self.assertIn(f'desc="{len(body)} bytes"', self.timings(response)['pdf'])
+        # A cached PDF is not rendered again
+        self.assertNotIn('pdf', self.timings(self.client.get(reverse('life:generate_pdf', args=[unique_id]))))
+
+    def test_metrics_endpoint(self):
+        url = self.client.post(reverse('life:index'), self.form_data).url
+        for _ in range(3):
+            self.client.get(url)
+
+        # Hidden unless staff or a token is configured
+        self.assertEqual(self.client.get(reverse('life:metrics')).status_code, 404)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(reverse('life:metrics')).status_code, 401)
+            response = self.client.get(reverse('life:metrics'), headers={'authorization': 'Bearer secret'})
+            self.assertEqual(response.status_code, 200)
+
+        from django.contrib.auth.models import User
+
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        response = self.client.get(reverse('life:metrics'))
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('# TYPE timetodeath_request_duration_seconds histogram', text)
+        self.assertIn('timetodeath_request_duration_seconds_count{view="life:results"} 3\n', text)
+        self.assertIn('timetodeath_request_duration_seconds_bucket{view="life:results",le="+Inf"} 3\n', text)
+        self.assertIn('timetodeath_scoring_duration_seconds_count{view="life:index"} 1\n', text)
+        # Buckets are cumulative
+        counts = [int(count) for count in re.findall(r'db_queries_bucket\{view="life:results",le="[^"]+"\} (\d+)', text)]
+        self.assertEqual(counts, sorted(counts))
+
+    def test_timers_only_record_inside_requests(self):
+        timings, token = metrics.start_request()
+        LifeCalculation.objects.count()
+        with metrics.timed('scoring'):
+            pass
+        metrics.finish_request(token)
+
+        LifeCalculation.objects.count()
+        metrics.record_pdf_bytes(100)
+        self.assertEqual(timings.queries, 1)
+        self.assertEqual(set(timings.durations), {'db', 'scoring'})
+        self.assertEqual(timings.pdf_bytes, 0)
+
+
+class RequestProfilingTests(TestCase):
+    form_data = FingerprintTests.form_data
+
+    def setUp(self):
+        pdf_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(pdf_directory.cleanup)
+        profiles_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(profiles_directory.cleanup)
+        self.profiles = Path(profiles_directory.name)
+        settings_override = override_settings(PDF_CACHE_DIR=pdf_directory.name, PROFILES_DIR=profiles_directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        pdf_cache.get_pdf_cache.cache_clear()
+        self.addCleanup(pdf_cache.get_pdf_cache.cache_clear)
+        cache.clear()
+        self.url = self.client.post(reverse('life:index'), self.form_data).url
+        self.unique_id = self.url.rstrip('/').rsplit('/', 1)[-1]
+
+    def test_staff_profiles_and_admin_shows_report(self):
+        self.client.get(self.url)
+        # Anonymous requests are served without profiling
+        self.assertNotIn('X-Profile-Report', self.client.get(self.url, {'profile': 'cpu'}))
+
+        from django.contrib.auth.models import User
+
+        staff = User.objects.create_user('staff', password='secret', is_staff=True, is_superuser=True)
+        self.client.force_login(staff)
+        response = self.client.get(self.url, {'profile': 'cpu', 'profile_uncached': '1'})
+        profile = RequestProfile.objects.get()
+        self.assertEqual(response['X-Profile-Report'], reverse('admin:life_requestprofile_change', args=[profile.pk]))
+        self.assertEqual((profile.kind, profile.user, profile.status_code), ('cpu', 'staff', 200))
+        report = (self.profiles / profile.report).read_text()
+        self.assertIn('_results_response', report)
+
+        pdf_url = reverse('life:generate_pdf', args=[self.unique_id])
+        response = self.client.get(pdf_url, {'profile': 'memory'})
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        memory_profile = RequestProfile.objects.get(kind='memory')
+        self.assertIn('Peak traced memory', (self.profiles / memory_profile.report).read_text())
+
+        page = self.client.get(response['X-Profile-Report'])
+        self.assertContains(page, 'Peak traced memory')
+        self.client.post(reverse('admin:life_requestprofile_delete', args=[memory_profile.pk]), {'post': 'yes'})
+        self.assertFalse((self.profiles / memory_profile.report).exists())
+
+    def test_token_is_bound_to_its_path(self):
+        pdf_url = reverse('life:generate_pdf', args=[self.unique_id])
+        token = profiling.make_token(pdf_url)
+        self.assertNotIn('X-Profile-Report', self.client.get(self.url, {'profile': 'cpu', 'profile_token': token}))
+        self.assertNotIn('X-Profile-Report', self.client.get(pdf_url, {'profile': 'cpu', 'profile_token': 'forged'}))
+
+        response = self.client.get(pdf_url, {'profile': 'cpu', 'profile_token': token, 'profile_uncached': '1'})
+        self.assertIn('X-Profile-Report', response)
+        report = (self.profiles / RequestProfile.objects.get().report).read_text()
+        self.assertIn('pdf_generator.py', report)
+        self.assertIn('by token', report)
+        self.assertNotIn('profile_token', report)
+
+    def test_oldest_reports_are_evicted(self):
+        token = profiling.make_token(self.url)
+        for _ in range(3):
+            self.client.get(self.url, {'profile': 'cpu', 'profile_token': token})
+        sizes = sorted(path.stat().st_size for path in self.profiles.iterdir())
+        newest = RequestProfile.objects.first()
+
+        with override_settings(PROFILES_MAX_BYTES=sizes[0] + 1):
+            self.client.get(self.url, {'profile': 'cpu', 'profile_token': token})
+        self.assertEqual(RequestProfile.objects.count(), 1)
+        self.assertEqual([path.name for path in self.profiles.iterdir()], [RequestProfile.objects.get().report])
+        self.assertNotEqual(RequestProfile.objects.get(), newest)
@@ -0,0 +1,292 @@
+"""
+Streaming import and export of LifeCalculation rows.
+
+export_calculations() walks the table in primary key order with
+.iterator(chunk_size=...) and import_calculations() saves rows in batched
+bulk_create() transactions, so memory use depends on the chunk size and not
+on the size of the table or file. An interrupted export is resumed after
+the last primary key it wrote, an import at a row offset of its file; both
+report progress through a callback.
+Files are CSV with a header row or JSON Lines, optionally gzip-compressed.
+"""
+import csv
+import gzip
+import io
+import json
+import secrets
+import sys
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import LifeCalculation
+from .stats import record_calculations
+
+FORMATS = ('csv', 'jsonl')
+
+# Rows per database round trip
+CHUNK_SIZE = 2000
+
+FIELDS = (
+    'unique_id',
+    'date_of_birth',
+    'gender',
+    'exercise_minutes_per_week',
+    'smoking_status',
+    'weight_kg',
+    'height_cm',
+    'diet_quality',
+    'alcohol_consumption',
+    'has_health_issues',
+    'estimated_lifespan_years',
+    'base_age',
+    'created_at',
+    'fingerprint',
+    'rules_version',
+)
+
+# Columns an imported row may leave out
+OPTIONAL_FIELDS = ('unique_id', 'base_age', 'created_at', 'fingerprint', 'rules_version')
+
+
+class TransferError(ValueError):
+    """An imported row is missing fields or has invalid values."""
+
+
+def detect_format(path, file_format=None):
+    """Return (format, gzipped) from an explicit format or the file name."""
+    suffixes = [suffix.lower() for suffix in Path(path).suffixes]
+    gzipped = bool(suffixes) and suffixes[-1] == '.gz'
+    if gzipped:
+        suffixes.pop()
+    if file_format is None and suffixes:
+        file_format = suffixes[-1].lstrip('.')
+        file_format = 'jsonl' if file_format in ('json', 'ndjson') else file_format
+    if file_format not in FORMATS:
+        raise TransferError(f"Cannot tell the format of {path}; use one of: {', '.join(FORMATS)}")
+    return file_format, gzipped
+
+
+@contextmanager
+def open_text(path, mode, gzipped=False):
+    """
+    Open a path, or stdin/stdout for '-', as text for the csv and json
+    modules. mode is 'r', 'w' or 'a'; appending to a gzip file adds a new
+    gzip member, which readers treat as one stream.
+    """
+    if path != '-':
+        if gzipped:
+            stream = gzip.open(path, mode + 't', encoding='utf-8', newline='')
+        else:
+            stream = open(path, mode, encoding='utf-8', newline='')
+        with stream:
+            yield stream
+        return
+
+    binary = sys.stdin.buffer if mode == 'r' else sys.stdout.buffer
+    compressed = gzip.GzipFile(fileobj=binary, mode='rb' if mode == 'r' else 'wb') if gzipped else None
+    stream = io.TextIOWrapper(compressed or binary, encoding='utf-8', newline='')
+    try:
+        yield stream
+    finally:
+        # Never close the process's own stdin/stdout
+        stream.flush()
+        stream.detach()
+        if compressed is not None:
+            compressed.close()
+
+
+def _json_default(value):
+    # Full precision, unlike DjangoJSONEncoder which drops microseconds
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _write_csv(stream, rows, header):
+    writer = csv.writer(stream)
+    if header:
+        writer.writerow(FIELDS)
+    for row in rows:
+        writer.writerow(row)
+        yield
+
+
+def _write_jsonl(stream, rows, header):
+    encoder = json.JSONEncoder(separators=(',', ':'), default=_json_default)
+    for row in rows:
+        stream.write(encoder.encode(dict(zip(FIELDS, row))))
+        stream.write('\n')
+        yield
+
+
+def export_calculations(stream, file_format, queryset=None, after=None,
+                        chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Write calculations to a text stream in primary key order.
+
+    Args:
+        stream: Text stream to write to
+        file_format: 'csv' or 'jsonl'
+        queryset: Calculations to export (default: all)
+        after: Primary key of the last row already written, to resume an
+            interrupted export with an index range scan rather than an
+            OFFSET. The CSV header is only written when it is None.
+        chunk_size: Rows fetched per query
+        progress: Called with (rows written, rows per second, primary key
+            of the last row written) after every chunk
+
+    Returns:
+        (rows written, primary key of the last row written), the key to
+        resume after
+    """
+    if queryset is None:
+        queryset = LifeCalculation.objects.all()
+    queryset = queryset.order_by('pk')
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+    last_pk = after
+
+    def rows():
+        nonlocal last_pk
+        for pk, *row in queryset.values_list('pk', *FIELDS).iterator(chunk_size=chunk_size):
+            last_pk = pk
+            yield row
+
+    write = _write_csv if file_format == 'csv' else _write_jsonl
+
+    start = time.perf_counter()
+    written = 0
+    for _ in write(stream, rows(), header=after is None):
+        written += 1
+        if progress and written % chunk_size == 0:
+            progress(written, written / (time.perf_counter() - start), last_pk)
+    if progress:
+        progress(written, written / max(time.perf_counter() - start, 1e-9), last_pk)
+    return written, last_pk
+
+
+def _read_records(stream, file_format):
+    if file_format == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            raise TransferError(f'Line {number}: invalid JSON') from None
+
+
+def _restore_created_at(calculations, created_ats):
+    # bulk_create() stamped the rows with the current time through
+    # auto_now_add; put the imported times back, as retention.py does, with
+    # one executemany() so the cost stays linear in the batch size
+    meta = LifeCalculation._meta
+    quote = connection.ops.quote_name
+    sql = 'UPDATE {} SET {} = %s WHERE {} = %s'.format(
+        quote(meta.db_table),
+        quote(meta.get_field('created_at').column),
+        quote(meta.get_field('unique_id').column),
+    )
+    adapt = connection.ops.adapt_datetimefield_value
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            (adapt(created_at), calculation.unique_id)
+            for calculation, created_at in zip(calculations, created_ats)
+        ])
+    for calculation, created_at in zip(calculations, created_ats):
+        calculation.created_at = created_at
+
+
+def _build(record, converters, number):
+    values = {}
+    for name, to_python in converters:
+        value = record.get(name)
+        if value is None or value == '':
+            if name in OPTIONAL_FIELDS:
+                continue
+            raise TransferError(f'Row {number}: {name} is missing')
+        try:
+            values[name] = to_python(value)
+        except ValidationError as error:
+            raise TransferError(f'Row {number}: {name}: {" ".join(error.messages)}') from None
+    values.setdefault('unique_id', secrets.token_urlsafe(16))
+    calculation = LifeCalculation(**values)
+    if calculation.created_at is None:
+        calculation.created_at = timezone.now()
+    return calculation
+
+
+def import_calculations(stream, file_format, offset=0, batch_size=CHUNK_SIZE,
+                        ignore_conflicts=False, progress=None):
+    """
+    Read calculations from a text stream and save them in batches.
+
+    Each batch is saved with bulk_create() in its own transaction, so after
+    a failure every row before the reported offset is saved and none after.
+    Rows without a unique_id get a new one; created_at is kept when given.
+
+    Args:
+        stream: Text stream to read from
+        file_format: 'csv' or 'jsonl'
+        offset: Rows to skip, to resume an interrupted import
+        batch_size: Rows saved per transaction
+        ignore_conflicts: Skip rows whose unique_id already exists, or
+            appeared earlier in the file, instead of failing, which makes
+            re-running an import safe. Skipped rows are not added to the
+            lifespan stats.
+        progress: Called with (rows saved including offset, rows per
+            second) after every batch
+
+    Returns:
+        Rows read including offset, i.e. the offset to resume from
+    """
+    converters = [(name, LifeCalculation._meta.get_field(name).to_python) for name in FIELDS]
+    records = _read_records(stream, file_format)
+
+    start = time.perf_counter()
+    imported = offset
+    batch = []
+
+    def save():
+        nonlocal imported
+        new = batch
+        with transaction.atomic():
+            if ignore_conflicts:
+                existing = set(LifeCalculation.objects.filter(
+                    unique_id__in=[calculation.unique_id for calculation in batch]
+                ).values_list('unique_id', flat=True))
+                # A unique_id repeated within the batch is imported once,
+                # like one already in the database, so the stats only
+                # count rows bulk_create() really inserts
+                new = []
+                for calculation in batch:
+                    if calculation.unique_id not in existing:
+                        existing.add(calculation.unique_id)
+                        new.append(calculation)
+            created_ats = [calculation.created_at for calculation in new]
+            LifeCalculation.objects.bulk_create(new, ignore_conflicts=ignore_conflicts)
+            if new:
+                _restore_created_at(new, created_ats)
+            record_calculations(new)
+        imported += len(batch)
+        batch.clear()
+        if progress:
+            progress(imported, (imported - offset) / max(time.perf_counter() - start, 1e-9))
+
+    for number, record in enumerate(records, start=1):
+        if number <= offset:
+            continue
+        batch.append(_build(record, converters, number))
+        if len(batch) >= batch_size:
+            save()
+    if batch:
+        save()
+    return imported
@@ -0,0 +1,38 @@
+"""
+Uncertainty bands of saved calculations.
+
+get_lifespan_bands() runs calculate_lifespan_bands() for a calculation,
+seeded from its input fingerprint so a share link always shows the same
+range, and caches the result per fingerprint: identical answers share one
+set of bands however many calculations or page renders there are.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+from .fingerprints import FINGERPRINT_FIELDS, input_fingerprint
+from .lifespan_calculator import lifespan_bands
+from .scoring_rules import get_rules
+
+# Bump when the sampling changes, so cached bands are recomputed
+BANDS_VERSION = 1
+
+
+def get_lifespan_bands(calculation):
+    """
+    Percentiles (p10, p50, p90) and survival curve of a calculation's
+    lifespan; see lifespan_calculator.lifespan_bands().
+    """
+    # The rules the estimate was scored with, when recorded
+    rules = get_rules(calculation.rules_version or settings.LIFESPAN_RULES_VERSION)
+    inputs = {field: getattr(calculation, field) for field in FINGERPRINT_FIELDS}
+    fingerprint = calculation.fingerprint or input_fingerprint(inputs, calculation.base_age, rules.version)
+    samples = settings.LIFESPAN_UNCERTAINTY_SAMPLES
+
+    cache = caches[settings.RESULTS_CACHE_ALIAS]
+    key = f'lifespan-bands:{BANDS_VERSION}:{samples}:{fingerprint}'
+    bands = cache.get(key)
+    if bands is None:
+        mean, sd = rules.estimate_spread(inputs, base_age=calculation.base_age)
+        bands = lifespan_bands(mean, sd, rules.minimum_age, samples, seed=int(fingerprint[:16], 16))
+        cache.set(key, bands, None)
+    return bands
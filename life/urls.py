@@ -1,10 +1,22 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# The async views save a thread hop per request under ASGI
+page_views = async_views if settings.ASYNC_VIEWS else views
 
 app_name = 'life'
 
 urlpatterns = [
-    path('', views.index, name='index'),
-    path('results/<str:unique_id>/', views.results, name='results'),
-    path('pdf/<str:unique_id>/', views.generate_pdf, name='generate_pdf'),
+    path('', page_views.index, name='index'),
+    path('results/<str:unique_id>/', page_views.results, name='results'),
+    path('pdf/<str:unique_id>/', page_views.generate_pdf, name='generate_pdf'),
+    path('life-grid/<str:unique_id>/', views.life_grid, name='life_grid'),
+    path('pdf/<str:unique_id>/jobs/', views.enqueue_pdf, name='enqueue_pdf'),
+    path('pdf-jobs/<str:job_id>/', views.pdf_job_status, name='pdf_job_status'),
+    path('pdf-jobs/<str:job_id>/download/', views.pdf_job_download, name='pdf_job_download'),
+    path('api/estimate/bulk/', views.bulk_estimate, name='bulk_estimate'),
+    path('api/stats/', views.lifespan_stats, name='lifespan_stats'),
+    path('api/what-if/<str:unique_id>/', views.what_if, name='what_if'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
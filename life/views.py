@@ -1,12 +1,74 @@
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, Http404
+from django.urls import reverse
+from django.utils.http import http_date
+from django.utils.safestring import mark_safe
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
 from django.utils import timezone
-from datetime import date, timedelta
+from datetime import date, timedelta, timezone as dt_timezone
 import secrets
+from .bulk import estimate_ndjson, read_lines
+from .fingerprints import input_fingerprint
 from .forms import LifeCalculationForm
-from .models import LifeCalculation
+from .life_grid import FORMATS, UNITS, calculation_life_grid
+from .life_tables import base_age_for
+from .models import LifeCalculation, PDFJob
 from .lifespan_calculator import calculate_lifespan
-from .pdf_generator import create_life_calendar_pdf
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, get_registry, timed
+from .scoring_rules import get_rules
+from .stats import get_stats
+from .uncertainty import get_lifespan_bands
+from .what_if import calculation_improvements
+from .pdf_cache import get_pdf_cache, life_calendar_key, life_calendar_pdf_path, open_life_calendar_pdf
+from .pdf_generator import DEFAULT_LAYOUT, LAYOUTS, calculate_total_years, lived_position
+from .page_cache import serve_daily_cached
+from .pdf_jobs import enqueue_life_calendar
+from .retention import get_calculation_or_404
+from .responses import sendfile_response, serve_cached_file
+from .write_buffer import get_buffered_calculation_or_404, get_write_buffer, wait_until_saved
+
+
+def _calculation_fields(cleaned_data, rules, base_age, fingerprint):
+    """Score the form answers and return the fields of a new calculation."""
+    with timed('scoring'):
+        estimated_years = calculate_lifespan(
+            base_age=base_age,
+            rules_version=rules.version,
+            exercise_minutes_per_week=cleaned_data['exercise_minutes_per_week'],
+            smoking_status=cleaned_data['smoking_status'],
+            weight_kg=cleaned_data['weight_kg'],
+            height_cm=cleaned_data['height_cm'],
+            diet_quality=cleaned_data['diet_quality'],
+            alcohol_consumption=cleaned_data['alcohol_consumption'],
+            has_health_issues=cleaned_data['has_health_issues']
+        )
+    
+    return {
+        'date_of_birth': cleaned_data['date_of_birth'],
+        'gender': cleaned_data['gender'],
+        'exercise_minutes_per_week': cleaned_data['exercise_minutes_per_week'],
+        'smoking_status': cleaned_data['smoking_status'],
+        'weight_kg': cleaned_data['weight_kg'],
+        'height_cm': cleaned_data['height_cm'],
+        'diet_quality': cleaned_data['diet_quality'],
+        'alcohol_consumption': cleaned_data['alcohol_consumption'],
+        'has_health_issues': cleaned_data['has_health_issues'],
+        'estimated_lifespan_years': estimated_years,
+        'base_age': base_age,
+        # Unique ID for sharing
+        'unique_id': secrets.token_urlsafe(16),
+        'fingerprint': fingerprint,
+        'rules_version': rules.version,
+    }
+
+
+def save_calculation(calculation):
+    """Save a new calculation and its stats update in one transaction."""
+    with transaction.atomic():
+        calculation.save(force_insert=True)
 
 
 def index(request):
@@ -16,55 +78,64 @@ def index(request):
     if request.method == 'POST':
         form = LifeCalculationForm(request.POST)
         if form.is_valid():
-            # Calculate lifespan
-            dob = form.cleaned_data['date_of_birth']
-            estimated_years = calculate_lifespan(
-                base_age=75,
-                exercise_minutes_per_week=form.cleaned_data['exercise_minutes_per_week'],
-                smoking_status=form.cleaned_data['smoking_status'],
-                weight_kg=form.cleaned_data['weight_kg'],
-                height_cm=form.cleaned_data['height_cm'],
-                diet_quality=form.cleaned_data['diet_quality'],
-                alcohol_consumption=form.cleaned_data['alcohol_consumption'],
-                has_health_issues=form.cleaned_data['has_health_issues']
-            )
+            rules = get_rules(settings.LIFESPAN_RULES_VERSION)
             
-            # Create unique ID for sharing
-            unique_id = secrets.token_urlsafe(16)
+            base_age = base_age_for(form.cleaned_data['date_of_birth'], form.cleaned_data['gender'], rules.base_age)
+            # Identical answers give an identical result; reuse its share link
+            fingerprint = input_fingerprint(form.cleaned_data, base_age, rules.version)
+            if settings.REUSE_IDENTICAL_CALCULATIONS:
+                existing_id = (
+                    LifeCalculation.objects.filter(fingerprint=fingerprint)
+                    .values_list('unique_id', flat=True).first()
+                )
+                if existing_id is not None:
+                    return redirect('life:results', unique_id=existing_id)
             
-            # Save calculation
-            calculation = LifeCalculation.objects.create(
-                date_of_birth=dob,
-                gender=form.cleaned_data['gender'],
-                exercise_minutes_per_week=form.cleaned_data['exercise_minutes_per_week'],
-                smoking_status=form.cleaned_data['smoking_status'],
-                weight_kg=form.cleaned_data['weight_kg'],
-                height_cm=form.cleaned_data['height_cm'],
-                diet_quality=form.cleaned_data['diet_quality'],
-                alcohol_consumption=form.cleaned_data['alcohol_consumption'],
-                has_health_issues=form.cleaned_data['has_health_issues'],
-                estimated_lifespan_years=estimated_years,
-                unique_id=unique_id
-            )
+            # Calculate lifespan and save calculation
+            calculation = LifeCalculation(**_calculation_fields(form.cleaned_data, rules, base_age, fingerprint))
+            if settings.CALCULATION_WRITE_BUFFER:
+                get_write_buffer().submit(calculation)
+            else:
+                save_calculation(calculation)
             
             # Redirect to results page
-            return redirect('life:results', unique_id=unique_id)
+            return redirect('life:results', unique_id=calculation.unique_id)
     else:
         form = LifeCalculationForm()
     
-    return render(request, 'life/index.html', {'form': form})
+    return render_page(request, 'life/index.html', {'form': form})
+
+
+def render_page(request, template_name, context):
+    """render() timed as the request's 'template' phase."""
+    with timed('template'):
+        return render(request, template_name, context)
 
 
 def results(request, unique_id):
     """
     Results page showing elapsed and remaining life with timers.
-    """
-    calculation = get_object_or_404(LifeCalculation, unique_id=unique_id)
     
+    The page only changes when the date rolls over, so it is cached per
+    share link until the next UTC midnight (see page_cache.py).
+    """
+    wait_until_saved(unique_id)
+    return serve_daily_cached(
+        request,
+        f'results:{unique_id}',
+        lambda today: _render_results(request, unique_id, today),
+    )
+
+
+def _render_results(request, unique_id, today):
+    calculation = get_buffered_calculation_or_404(unique_id)
+    return _results_response(request, calculation, today)
+
+
+def _results_response(request, calculation, today):
     # Calculate dates
     birth_date = calculation.date_of_birth
-    today = date.today()
-    estimated_death_date = birth_date + timedelta(days=int(calculation.estimated_lifespan_years * 365.25))
+    estimated_death_date = calculation.estimated_death_date
     
     # Calculate elapsed and remaining time
     elapsed_delta = today - birth_date
@@ -87,6 +158,10 @@ def results(request, unique_id):
     total_lifespan_days = (estimated_death_date - birth_date).days
     life_percentage = min(100, (elapsed_delta.days / total_lifespan_days * 100)) if total_lifespan_days > 0 else 0
     
+    with timed('scoring'):
+        improvements = calculation_improvements(calculation, limit=3)
+        bands = get_lifespan_bands(calculation) if settings.LIFESPAN_UNCERTAINTY else None
+    
     context = {
         'calculation': calculation,
         'birth_date': birth_date,
@@ -102,28 +177,257 @@ def results(request, unique_id):
         'remaining_days': remaining_days,
         'life_percentage': round(life_percentage, 2),
         'share_url': request.build_absolute_uri(request.path),
+        'improvements': improvements,
     }
     
-    return render(request, 'life/results.html', context)
+    if settings.LIFE_GRID:
+        # Generated by life_grid.py from numbers only
+        context['life_grid'] = mark_safe(calculation_life_grid(calculation, today))
+    
+    if bands is not None:
+        context['bands'] = bands
+        context['earliest_death_date'] = birth_date + timedelta(days=int(bands['p10'] * 365.25))
+        context['latest_death_date'] = birth_date + timedelta(days=int(bands['p90'] * 365.25))
+        # Every sample reaches the ages before the curve starts
+        survival = dict(bands['survival'])
+        first_age = bands['survival'][0][0]
+        context['survival_milestones'] = [
+            (age, round((1.0 if age < first_age else survival.get(age, 0.0)) * 100)) for age in (70, 80, 90, 100)
+        ]
+    
+    response = render_page(request, 'life/results.html', context)
+    response['Last-Modified'] = http_date(calculation.created_at.timestamp())
+    return response
+
+
+def _invalid_layout_response():
+    return JsonResponse({'error': f'layout must be one of {", ".join(LAYOUTS)}'}, status=400)
+
+
+def _pdf_filename(unique_id, layout, years=None):
+    if years:
+        return f'life_calendar_{unique_id[:8]}_years_{years[0]}-{years[1]}.pdf'
+    if layout == DEFAULT_LAYOUT:
+        return f'life_calendar_{unique_id[:8]}.pdf'
+    return f'life_calendar_{layout}_{unique_id[:8]}.pdf'
+
+
+def _pdf_pages(params, calculation, total_years, layout):
+    """
+    The (years, highlight) arguments of render_life_calendar() for a PDF
+    request's ?from=, ?to= and ?highlight=.
+    
+    Raises ValueError with a message for the client on invalid values.
+    """
+    today = timezone.now().astimezone(dt_timezone.utc).date()
+    current_year, lived_days = lived_position(calculation.date_of_birth, today)
+    wants_range = 'from' in params or 'to' in params
+    wants_highlight = params.get('highlight') == '1'
+    if layout != DEFAULT_LAYOUT and (wants_range or wants_highlight):
+        raise ValueError('from, to and highlight only apply to the yearly layout')
+    
+    years = None
+    if wants_range:
+        first_year = params.get('from', '1')
+        try:
+            first_year = min(current_year, total_years) if first_year == 'current' else int(first_year)
+            last_year = min(int(params.get('to', total_years)), total_years)
+        except ValueError:
+            raise ValueError('from and to must be year numbers (from may be "current")') from None
+        if not 1 <= first_year <= last_year:
+            raise ValueError(f'from and to must be years from 1 to {total_years}, from no later than to')
+        if (first_year, last_year) != (1, total_years):
+            years = (first_year, last_year)
+    
+    first_year, last_year = years or (1, total_years)
+    highlight = None
+    if wants_highlight and first_year <= current_year <= last_year and lived_days > 0:
+        highlight = (current_year, lived_days)
+    return years, highlight
 
 
 def generate_pdf(request, unique_id):
     """
     Generate and download PDF for the life calendar.
+    
+    ?layout=weeks or months gives a one-page poster with a row of week or
+    month cells per year instead of a page per year (see pdf_generator.py).
+    
+    For the yearly layout, ?from= and ?to= (1-based, inclusive) render only
+    those years; ?from=current starts at the current year of life. With
+    ?highlight=1 the days already lived on the current year's page are
+    filled in.
     """
-    calculation = get_object_or_404(LifeCalculation, unique_id=unique_id)
+    layout = request.GET.get('layout', DEFAULT_LAYOUT)
+    if layout not in LAYOUTS:
+        return _invalid_layout_response()
+    calculation = get_calculation_or_404(unique_id)
     
     birth_date = calculation.date_of_birth
-    estimated_death_date = birth_date + timedelta(days=int(calculation.estimated_lifespan_years * 365.25))
+    estimated_death_date = calculation.estimated_death_date
     
-    # Generate PDF
-    pdf_buffer = create_life_calendar_pdf(birth_date, estimated_death_date)
+    # Cached by year count and pages; only a cache miss renders the PDF
+    total_years = calculate_total_years(birth_date, estimated_death_date)
+    try:
+        years, highlight = _pdf_pages(request.GET, calculation, total_years, layout)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    filename = _pdf_filename(unique_id, layout, years)
+    pages = {'layout': layout, 'years': years, 'highlight': highlight}
     
-    if pdf_buffer is None:
-        raise Http404("PDF generation failed")
+    if settings.PDF_SENDFILE_HEADER:
+        return sendfile_response(life_calendar_pdf_path(total_years, **pages), filename, 'application/pdf')
     
-    # Create response
-    response = HttpResponse(pdf_buffer.read(), content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="life_calendar_{unique_id[:8]}.pdf"'
+    return serve_cached_file(
+        request,
+        life_calendar_key(total_years, **pages),
+        lambda: open_life_calendar_pdf(total_years, **pages),
+        filename,
+        'application/pdf',
+    )
+
+
+@require_GET
+def life_grid(request, unique_id):
+    """
+    The life grid of a calculation as an image: ?format=svg (default) or
+    png, ?unit=weeks (default) or days.
     
-    return response
+    Lighter than the PDF calendar; cached like the results page.
+    """
+    unit = request.GET.get('unit', 'weeks')
+    image_format = request.GET.get('format', 'svg')
+    if unit not in UNITS or image_format not in FORMATS:
+        return JsonResponse(
+            {'error': f'unit must be one of {", ".join(UNITS)} and format one of {", ".join(FORMATS)}'},
+            status=400,
+        )
+    
+    def render_grid(today):
+        calculation = get_calculation_or_404(unique_id)
+        content_type = 'image/svg+xml' if image_format == 'svg' else 'image/png'
+        return HttpResponse(calculation_life_grid(calculation, today, unit, image_format), content_type=content_type)
+    
+    wait_until_saved(unique_id)
+    return serve_daily_cached(request, f'life-grid:{unique_id}:{unit}:{image_format}', render_grid)
+
+
+def _pdf_job_payload(request, job):
+    payload = {
+        'job_id': job.key,
+        'status': job.status,
+        'total_years': job.total_years,
+        'status_url': request.build_absolute_uri(reverse('life:pdf_job_status', args=[job.key])),
+    }
+    if job.status == PDFJob.DONE:
+        payload['download_url'] = request.build_absolute_uri(reverse('life:pdf_job_download', args=[job.key]))
+    if job.status == PDFJob.FAILED:
+        payload['error'] = job.error
+    return payload
+
+
+@require_POST
+def enqueue_pdf(request, unique_id):
+    """
+    Queue a background render of the life calendar PDF.
+    """
+    calculation = get_calculation_or_404(unique_id)
+    total_years = calculate_total_years(calculation.date_of_birth, calculation.estimated_death_date)
+    
+    job = enqueue_life_calendar(total_years)
+    return JsonResponse(_pdf_job_payload(request, job), status=202)
+
+
+def pdf_job_status(request, job_id):
+    """
+    Report the status of a background PDF render.
+    """
+    job = get_object_or_404(PDFJob, key=job_id)
+    return JsonResponse(_pdf_job_payload(request, job))
+
+
+def pdf_job_download(request, job_id):
+    """
+    Download the PDF of a finished background render.
+    """
+    job = get_object_or_404(PDFJob, key=job_id, status=PDFJob.DONE)
+    return serve_cached_file(
+        request,
+        job.key,
+        lambda: get_pdf_cache().open(job.key),
+        f'life_calendar_{job.total_years}_years.pdf',
+        'application/pdf',
+    )
+
+
+def _bearer_token_matches(request, token):
+    """Whether the request has "Authorization: Bearer <token>"; never for no token."""
+    return bool(token) and secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+
+@csrf_exempt
+@require_POST
+def bulk_estimate(request):
+    """
+    Estimate lifespans for an NDJSON stream of profiles.
+    
+    Each request line is a JSON object with the fields of the index form;
+    results are streamed back as NDJSON, one line per input line. With
+    ?persist=1 and the BULK_PERSIST_TOKEN bearer token, valid profiles are
+    also saved as calculations.
+    """
+    persist = request.GET.get('persist', '').lower() in ('1', 'true', 'yes')
+    # Not a staff session: the endpoint is exempt from CSRF checks
+    if persist and not _bearer_token_matches(request, settings.BULK_PERSIST_TOKEN):
+        return JsonResponse({'error': 'persist requires the BULK_PERSIST_TOKEN bearer token'}, status=403)
+    rules = get_rules(settings.LIFESPAN_RULES_VERSION)
+    
+    return StreamingHttpResponse(
+        estimate_ndjson(read_lines(request.readline), rules, persist=persist),
+        content_type='application/x-ndjson',
+    )
+
+
+@require_GET
+def lifespan_stats(request):
+    """
+    Distribution of estimated lifespans overall, by gender, smoking status
+    and diet quality, and per day for the last ?days= days (default 30).
+    
+    Answered from the summary tables maintained by stats.py, so the cost
+    does not grow with the number of calculations.
+    """
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        days = 0
+    if not 1 <= days <= 366:
+        return JsonResponse({'error': 'days must be an integer from 1 to 366'}, status=400)
+    
+    today = timezone.now().astimezone(dt_timezone.utc).date()
+    return JsonResponse(get_stats(today, days))
+
+
+@require_GET
+def metrics(request):
+    """
+    Request timing histograms of this process in the Prometheus text
+    format (see metrics.py), for staff users and, once METRICS_TOKEN is
+    set, scrapers sending it as a bearer token. Anyone else gets a 404
+    while no token is configured.
+    """
+    if not request.user.is_staff and not _bearer_token_matches(request, settings.METRICS_TOKEN):
+        if not settings.METRICS_TOKEN:
+            raise Http404
+        return JsonResponse({'error': 'A valid bearer token is required'}, status=401)
+    return HttpResponse(get_registry().exposition(), content_type=METRICS_CONTENT_TYPE)
+
+
+@require_GET
+def what_if(request, unique_id):
+    """
+    Ranked single-factor and two-factor lifestyle changes that would add
+    years to a calculation's estimate (see what_if.py).
+    """
+    calculation = get_calculation_or_404(unique_id)
+    return JsonResponse(calculation_improvements(calculation))
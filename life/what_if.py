@@ -0,0 +1,91 @@
+"""
+"What if" improvements: how many years a person would gain by changing
+one or two of their lifestyle factors.
+
+Every factor input falls into one of a few codes (a band or a category),
+so RuleTable.grid holds the estimate for every combination of them. A
+person's alternatives are grid lookups with one or two codes swapped, not
+new runs of the calculator.
+"""
+from itertools import combinations
+
+from django.conf import settings
+
+from .scoring_rules import get_rules
+
+# Improvements returned per kind (single factor, pair of factors)
+DEFAULT_LIMIT = 5
+
+
+def _change(factor, current, target):
+    return {'factor': factor.name, 'from': factor.labels[current], 'to': factor.labels[target]}
+
+
+def improvements(rules, inputs, base_age=None, limit=DEFAULT_LIMIT):
+    """
+    Rank the changes of one factor and of two factors that add years.
+
+    Two-factor changes are only listed when both changes add years, so a
+    pair is never a single improvement plus a neutral change.
+
+    Returns:
+        Dict with the current estimate and lists 'single' and 'combined'
+        of {'changes': [{'factor', 'from', 'to'}, ...], 'years_gained'},
+        best first
+    """
+    codes = rules.codes(inputs)
+    current = rules.estimate_codes(codes, base_age)
+
+    def gain(changes):
+        changed = list(codes)
+        for index, target in changes:
+            changed[index] = target
+        return round(rules.estimate_codes(changed, base_age) - current, 2)
+
+    options = {
+        index: [target for target in factor.targets if target != codes[index]]
+        for index, factor in enumerate(rules.factors)
+    }
+    single = {}
+    for index, targets in options.items():
+        for target in targets:
+            years = gain([(index, target)])
+            if years > 0:
+                single[index, target] = years
+
+    combined = []
+    for (first, first_target), (second, second_target) in combinations(single, 2):
+        if first == second:
+            continue
+        years = gain([(first, first_target), (second, second_target)])
+        if years > max(single[first, first_target], single[second, second_target]):
+            combined.append(([(first, first_target), (second, second_target)], years))
+
+    def describe(changes, years):
+        return {
+            'changes': [_change(rules.factors[index], codes[index], target) for index, target in changes],
+            'years_gained': years,
+        }
+
+    ranked_single = sorted(single.items(), key=lambda item: -item[1])[:limit]
+    ranked_combined = sorted(combined, key=lambda item: -item[1])[:limit]
+    return {
+        'estimated_lifespan_years': round(current, 2),
+        'single': [describe([change], years) for change, years in ranked_single],
+        'combined': [describe(changes, years) for changes, years in ranked_combined],
+    }
+
+
+def calculation_improvements(calculation, limit=DEFAULT_LIMIT):
+    """improvements() for a saved calculation."""
+    inputs = {
+        'exercise_minutes_per_week': calculation.exercise_minutes_per_week,
+        'smoking_status': calculation.smoking_status,
+        'weight_kg': calculation.weight_kg,
+        'height_cm': calculation.height_cm,
+        'diet_quality': calculation.diet_quality,
+        'alcohol_consumption': calculation.alcohol_consumption,
+        'has_health_issues': calculation.has_health_issues,
+    }
+    rules = get_rules(calculation.rules_version or settings.LIFESPAN_RULES_VERSION)
+    return improvements(rules, inputs, base_age=calculation.base_age, limit=limit)
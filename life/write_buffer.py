@@ -0,0 +1,220 @@
+"""
+Write coalescing for new calculations.
+
+With CALCULATION_WRITE_BUFFER enabled, the index view hands new
+LifeCalculation rows to a per-process WriteBuffer instead of saving them on
+the request thread. A background thread saves whatever has queued up in one
+bulk_create() transaction, so concurrent submissions share a single SQLite
+write lock and commit instead of queueing for it one by one. The view
+returns the unique_id straight away; results() waits for a row still
+pending in its own process before looking it up, and retries the lookup
+for up to CALCULATION_WRITE_BUFFER_NOT_FOUND_WAIT seconds when the redirect
+reached another worker than the one holding the row.
+
+A row that cannot be saved is retried when the error may be transient
+(OperationalError, e.g. a locked database) and otherwise kept in
+WriteBuffer.failed, from where retry_failed() queues it again.
+
+Rows are only durable once their batch commits: a process that dies in the
+few milliseconds before that loses them.
+"""
+import asyncio
+import atexit
+import logging
+import queue
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import DatabaseError, OperationalError, close_old_connections, transaction
+from django.http import Http404
+
+from .models import LifeCalculation
+from .retention import aget_calculation_or_404, get_calculation_or_404
+from .stats import record_calculations
+
+# How often a share link not found yet is looked up again
+NOT_FOUND_POLL_INTERVAL = 0.05
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBuffer:
+    """
+    Saves submitted LifeCalculation instances in batches on a writer thread.
+
+    Args:
+        max_batch: Most rows saved in one transaction
+        max_delay: Seconds the writer waits for more rows after the first
+            one arrives. 0 only groups rows that queued up while the
+            previous batch was being written.
+        max_retries: Times a row failing with an OperationalError is
+            queued again before it is given up on
+        retry_delay: Seconds before a failed row is queued again
+    """
+
+    def __init__(self, max_batch=200, max_delay=0.0, max_retries=3, retry_delay=0.5):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.batches = 0
+        # unique_id to calculation of rows given up on
+        self.failed = {}
+        self._attempts = {}
+        self._queue = queue.Queue()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, calculation):
+        """Queue an unsaved calculation and return its unique_id."""
+        with self._lock:
+            self._pending.setdefault(calculation.unique_id, threading.Event())
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='calculation-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush, timeout=5)
+        self._queue.put(calculation)
+        return calculation.unique_id
+
+    def wait(self, unique_id, timeout=None):
+        """
+        Block until a submitted calculation has been written or given up
+        on. Returns False on timeout; unknown ids return True at once.
+        """
+        with self._lock:
+            event = self._pending.get(unique_id)
+        return event is None or event.wait(timeout)
+
+    def retry_failed(self):
+        """Queue the calculations in failed again; returns how many."""
+        with self._lock:
+            calculations = list(self.failed.values())
+            self.failed.clear()
+        for calculation in calculations:
+            self.submit(calculation)
+        return len(calculations)
+
+    def flush(self, timeout=None):
+        """Block until everything submitted so far has been written."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            events = list(self._pending.values())
+        for event in events:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if not event.wait(remaining):
+                return False
+        return True
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            retries = []
+            try:
+                retries = self._write(batch)
+            finally:
+                retrying = {id(calculation) for calculation in retries}
+                with self._lock:
+                    for calculation in batch:
+                        if id(calculation) in retrying:
+                            continue
+                        self._attempts.pop(calculation.unique_id, None)
+                        event = self._pending.pop(calculation.unique_id, None)
+                        if event is not None:
+                            event.set()
+            for calculation in retries:
+                timer = threading.Timer(self.retry_delay, self._queue.put, [calculation])
+                timer.daemon = True
+                timer.start()
+
+    def _write(self, batch):
+        """Save a batch; returns the calculations to queue again."""
+        close_old_connections()
+        try:
+            with transaction.atomic():
+                LifeCalculation.objects.bulk_create(batch)
+                record_calculations(batch)
+            self.batches += 1
+            return []
+        except DatabaseError:
+            logger.warning("Saving %d calculations together failed; saving them one by one", len(batch), exc_info=True)
+
+        retries = []
+        for calculation in batch:
+            try:
+                calculation.save(force_insert=True)
+            except DatabaseError as error:
+                attempts = self._attempts.get(calculation.unique_id, 0) + 1
+                if isinstance(error, OperationalError) and attempts <= self.max_retries:
+                    logger.warning("Could not save calculation %s; retrying", calculation.unique_id, exc_info=True)
+                    self._attempts[calculation.unique_id] = attempts
+                    retries.append(calculation)
+                else:
+                    logger.exception("Could not save calculation %s; kept in WriteBuffer.failed", calculation.unique_id)
+                    with self._lock:
+                        self.failed[calculation.unique_id] = calculation
+        return retries
+
+
+@lru_cache(maxsize=None)
+def get_write_buffer():
+    """The process-wide write buffer, configured from settings."""
+    return WriteBuffer(
+        max_batch=settings.CALCULATION_WRITE_BUFFER_MAX_BATCH,
+        max_delay=settings.CALCULATION_WRITE_BUFFER_MAX_DELAY,
+        max_retries=settings.CALCULATION_WRITE_BUFFER_RETRIES,
+    )
+
+
+def wait_until_saved(unique_id):
+    """Wait for a calculation still queued in this process, if any."""
+    if get_write_buffer.cache_info().currsize:
+        get_write_buffer().wait(unique_id, timeout=settings.CALCULATION_WRITE_BUFFER_WAIT_TIMEOUT)
+
+
+def get_buffered_calculation_or_404(unique_id):
+    """
+    get_calculation_or_404() that, with CALCULATION_WRITE_BUFFER on, keeps
+    looking for up to CALCULATION_WRITE_BUFFER_NOT_FOUND_WAIT seconds: the
+    row may still be queued in another worker's buffer.
+    """
+    if not settings.CALCULATION_WRITE_BUFFER:
+        return get_calculation_or_404(unique_id)
+    deadline = time.monotonic() + settings.CALCULATION_WRITE_BUFFER_NOT_FOUND_WAIT
+    while True:
+        try:
+            return get_calculation_or_404(unique_id)
+        except Http404:
+            if time.monotonic() >= deadline:
+                raise
+        time.sleep(NOT_FOUND_POLL_INTERVAL)
+
+
+async def aget_buffered_calculation_or_404(unique_id):
+    """Async get_buffered_calculation_or_404()."""
+    if not settings.CALCULATION_WRITE_BUFFER:
+        return await aget_calculation_or_404(unique_id)
+    deadline = time.monotonic() + settings.CALCULATION_WRITE_BUFFER_NOT_FOUND_WAIT
+    while True:
+        try:
+            return await aget_calculation_or_404(unique_id)
+        except Http404:
+            if time.monotonic() >= deadline:
+                raise
+        await asyncio.sleep(NOT_FOUND_POLL_INTERVAL)
@@ -2,6 +2,8 @@
 ASGI config for timetodeath project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Set ASYNC_VIEWS = True in settings when serving through it, so the main
+pages run as native async views.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'life.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -49,6 +50,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'life.middleware.RequestProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'timetodeath.urls'
@@ -82,6 +84,32 @@ DATABASES = {
     }
 }
 
+# Production write mode for SQLite. WAL lets readers run while a write is in
+# progress, busy_timeout makes a writer wait for the lock instead of failing
+# with "database is locked", synchronous=NORMAL skips the fsync on every
+# commit (still safe from corruption in WAL mode), and IMMEDIATE transactions
+# take the write lock up front so waiting writers cannot deadlock.
+SQLITE_PRODUCTION_WRITES = True
+
+if SQLITE_PRODUCTION_WRITES:
+    DATABASES['default']['OPTIONS'] = {
+        'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA busy_timeout=5000',
+        'transaction_mode': 'IMMEDIATE',
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# File-based so that all workers on a host share it; Redis or Memcached
+# work as well.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -127,3 +155,165 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Lifespan scoring rules
+# Name of the rule table in life/rules/ used for new calculations
+
+LIFESPAN_RULES_VERSION = 'v1'
+
+
+# Life calendar PDF cache
+# Rendered PDFs are shared by all workers through PDF_CACHE_DIR
+
+PDF_CACHE_DIR = BASE_DIR / 'pdf_cache'
+PDF_CACHE_MAX_BYTES = 512 * 1024 * 1024
+PDF_CACHE_MEMORY_BYTES = 64 * 1024 * 1024
+
+# Let a reverse proxy serve cached PDFs from PDF_CACHE_DIR instead of Django:
+# 'X-Accel-Redirect' (nginx, with PDF_SENDFILE_URL_PREFIX mapped to an
+# internal location aliasing PDF_CACHE_DIR) or 'X-Sendfile' (Apache, lighttpd).
+PDF_SENDFILE_HEADER = None
+PDF_SENDFILE_URL_PREFIX = '/protected/pdf/'
+
+
+# Background PDF jobs (python manage.py run_pdf_worker)
+# PDF_JOB_WORKERS is the size of the render process pool. A worker updates
+# the heartbeat of its running jobs every PDF_JOB_HEARTBEAT_INTERVAL
+# seconds; jobs without a heartbeat for PDF_JOB_TIMEOUT seconds are assumed
+# lost and queued again.
+
+PDF_JOB_WORKERS = 2
+PDF_JOB_TIMEOUT = 600
+PDF_JOB_HEARTBEAT_INTERVAL = 30
+
+
+# Parallel PDF rendering (see life/pdf_parallel.py)
+# Calendars of at least PDF_PARALLEL_MIN_YEARS pages in one of
+# PDF_PARALLEL_MODES are split into chunks rendered by several processes and
+# merged. Form mode is left out: each chunk redraws the shared grid, so a
+# 100-year calendar takes 0.08 s serially but 0.14 s in 2 chunks. The PDF job worker and the async
+# views use their own pools; the sync views use a pool of
+# PDF_PARALLEL_PROCESSES (1 renders serially).
+
+PDF_PARALLEL_PROCESSES = 1
+PDF_PARALLEL_MIN_YEARS = 40
+PDF_PARALLEL_MODES = ('inline',)
+
+
+# Results page cache
+# Pages are cached per share link until the next UTC midnight; only one
+# worker renders a missing page while others wait up to the lock timeout.
+
+RESULTS_CACHE_ALIAS = 'default'
+RESULTS_CACHE_LOCK_TIMEOUT = 10
+
+
+# Bulk estimation API (see life/bulk.py)
+# Anyone can score profiles; saving them with ?persist=1 needs this token
+# in an "Authorization: Bearer <token>" header. None disables persisting.
+
+BULK_PERSIST_TOKEN = None
+
+
+# Duplicate submissions
+# Send resubmissions of identical answers to the existing result's share
+# link instead of saving a new calculation (see life/fingerprints.py)
+
+REUSE_IDENTICAL_CALCULATIONS = True
+
+
+# Write coalescing for index submissions (see life/write_buffer.py)
+# Saves new calculations on a background thread, grouping concurrent ones
+# into one transaction. A row is durable only once its batch commits. With
+# several workers, a results page for a row queued in another worker looks
+# again for up to CALCULATION_WRITE_BUFFER_NOT_FOUND_WAIT seconds before
+# answering 404. Rows failing with a transient error are retried
+# CALCULATION_WRITE_BUFFER_RETRIES times.
+
+CALCULATION_WRITE_BUFFER = False
+CALCULATION_WRITE_BUFFER_MAX_BATCH = 200
+CALCULATION_WRITE_BUFFER_MAX_DELAY = 0.0
+CALCULATION_WRITE_BUFFER_WAIT_TIMEOUT = 5
+CALCULATION_WRITE_BUFFER_NOT_FOUND_WAIT = 1.0
+CALCULATION_WRITE_BUFFER_RETRIES = 3
+
+
+# Async views (see life/async_views.py)
+# Serve index, results and generate_pdf with native async views; enable when
+# running under ASGI (timetodeath.asgi). They render PDFs in a pool of
+# PDF_RENDER_PROCESSES processes.
+
+ASYNC_VIEWS = False
+PDF_RENDER_PROCESSES = 2
+
+
+# Admin for large tables (see life/admin_changelist.py)
+# The calculation changelist estimates its total instead of counting every
+# row, counts filtered results only up to ADMIN_COUNT_LIMIT, pages by
+# (created_at, id) instead of OFFSET and searches unique_id and date of birth
+# by exact match instead of LIKE.
+
+SCALABLE_ADMIN = True
+ADMIN_COUNT_LIMIT = 10_000
+
+
+# Retention (python manage.py archive_calculations, see life/retention.py)
+# Calculations older than CALCULATION_RETENTION_DAYS are moved to gzip JSON
+# Lines files in CALCULATION_ARCHIVE_DIR, one per month, and deleted in
+# batches of CALCULATION_ARCHIVE_BATCH_SIZE rows. Archived share links are
+# restored on first visit.
+
+CALCULATION_RETENTION_DAYS = 730
+CALCULATION_ARCHIVE_DIR = BASE_DIR / 'archive'
+CALCULATION_ARCHIVE_BATCH_SIZE = 500
+
+
+# Uncertainty bands (see life/uncertainty.py)
+# Show the 80% range of the estimate on the results page, from
+# LIFESPAN_UNCERTAINTY_SAMPLES Monte Carlo samples cached per fingerprint.
+
+LIFESPAN_UNCERTAINTY = True
+LIFESPAN_UNCERTAINTY_SAMPLES = 100_000
+
+
+# Life grid (see life/life_grid.py)
+# Show every week of life as an inline SVG on the results page.
+
+LIFE_GRID = True
+
+
+# Life tables (see life/life_tables.py)
+# Binary file built with `python manage.py build_life_tables`. When set, a
+# person's base age is their age plus the remaining life expectancy for
+# their age and sex in LIFE_TABLE_COUNTRY, instead of the rule table's
+# fixed base age.
+
+LIFE_TABLES_PATH = None
+LIFE_TABLE_COUNTRY = 'WLD'
+
+
+# Request timing (see life/metrics.py)
+# Time SQL, scoring, template rendering and PDF rendering per request, send
+# them in a Server-Timing header and keep per-view histograms, served in the
+# Prometheus text format at /metrics/. The endpoint is staff-only until
+# METRICS_TOKEN is set; scrapers then send it as "Authorization: Bearer
+# <token>".
+
+REQUEST_TIMING = True
+SERVER_TIMING_HEADER = True
+METRICS_TOKEN = None
+
+
+# Request profiling (see life/profiling.py)
+# Staff users, or anyone with a token from `python manage.py profile_token`,
+# can add ?profile=cpu or ?profile=memory to a URL to profile that request.
+# Reports (the top PROFILE_REPORT_LINES entries) are written to PROFILES_DIR,
+# listed in the admin and deleted oldest first past PROFILES_MAX_BYTES.
+
+REQUEST_PROFILING = True
+PROFILES_DIR = BASE_DIR / 'profiles'
+PROFILES_MAX_BYTES = 20 * 1024 * 1024
+PROFILE_REPORT_LINES = 40
+PROFILE_TRACEMALLOC_FRAMES = 5
+PROFILE_TOKEN_MAX_AGE = 3600  # seconds